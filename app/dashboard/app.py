@@ -2,6 +2,8 @@ import dash
 from dash import Dash, html, dcc
 from flask import request, jsonify, abort
 import requests
+# register callbacks shared by the pages
+from app.dashboard import zoom
 #from flask_cors import CORS
 
 ##
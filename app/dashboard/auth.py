@@ -0,0 +1,53 @@
+import time
+import threading
+from collections import OrderedDict
+import requests
+from flask import request
+from dash.exceptions import PreventUpdate
+
+
+###
+# Constant definitions
+###
+
+# login check of the server, answers 200 if the cookies belong to a logged in user
+auth_url = "http://127.0.0.1:8000/login/auth"
+# seconds a successful check is reused, zooming fires a callback per relayout and shouldn't ask the server each time
+auth_ttl = 10
+# number of sessions whose successful check is kept
+cache_size = 1024
+
+# cookies -> time of the successful check, ordered from least to most recently checked
+checked = OrderedDict()
+# callbacks run in multiple threads
+lock = threading.Lock()
+
+
+###
+# Function definitions
+###
+
+# returns the status code of the server's login check for cookies (cookies of the current request if None)
+def check(cookies=None):
+    cookies = request.cookies if cookies is None else cookies
+    key = tuple(sorted(cookies.items()))
+    now = time.monotonic()
+    with lock:
+        if key in checked and now - checked[key] < auth_ttl:
+            return 200
+
+    response = requests.get(auth_url, cookies=cookies)
+    if response.status_code == 200:
+        with lock:
+            checked.pop(key, None)
+            checked[key] = now
+            while len(checked) > cache_size:
+                checked.popitem(last=False)
+    return response.status_code
+
+
+# dash callbacks go to /_dash-update-component, which app.py lets pass without a login. Callbacks that load data by a
+# job or sensor name sent by the client call this first, it stops the callback if the visitor isn't logged in
+def require_login():
+    if check() != 200:
+        raise PreventUpdate
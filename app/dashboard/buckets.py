@@ -0,0 +1,75 @@
+import pandas as pd
+
+
+# builds a query that aggregates the rows of source into num_buckets equally spaced timeslots between time_lower &
+# time_upper inside postgres (width_bucket + GROUP BY), so only num_buckets rows get transferred instead of every row
+# source is a table or a subquery in brackets with a "timestamp" column, its parameters have to be named (%(name)s)
+# for every col in cols the query returns <col>_sum, <col>_min and <col>_max
+# count is the number of rows per timeslot, if count_col is provided the rows are already aggregated: count is the sum
+# of count_col and every value is weighted by it, rows with a count of 0 are ignored
+# every timeslot is returned, empty timeslots have a count of 0 and NULL values
+def bucket_sql(source, cols, count_col=None):
+    if count_col is None:
+        count_expr = "COUNT(b.timestamp)"
+        weight = ""
+        where = ""
+    else:
+        count_expr = f"COALESCE(SUM(b.{count_col}), 0)"
+        weight = f" * b.{count_col}"
+        where = f" FILTER (WHERE b.{count_col} > 0)"
+
+    aggs = [f"{count_expr} AS count"]
+    for col in cols:
+        aggs.append(f"SUM(b.{col}{weight}){where} AS {col}_sum")
+        aggs.append(f"MIN(b.{col}){where} AS {col}_min")
+        aggs.append(f"MAX(b.{col}){where} AS {col}_max")
+
+    # width_bucket returns num_buckets + 1 for time_upper, so the last timeslot is closed
+    # time of a timeslot is spaced like np.linspace(time_lower, time_upper, num_buckets)
+    return f"""SELECT g.bucket - 1 AS bucket,
+            %(time_lower)s::float8 + (g.bucket - 1) * (%(time_upper)s::float8 - %(time_lower)s::float8)
+                / GREATEST(%(num_buckets)s - 1, 1) AS time,
+            {", ".join(aggs)}
+            FROM generate_series(1, %(num_buckets)s) AS g(bucket)
+            LEFT JOIN (
+                SELECT LEAST(width_bucket(src.timestamp, %(time_lower)s::float8, %(time_upper)s::float8,
+                       %(num_buckets)s), %(num_buckets)s) AS bucket, src.*
+                FROM {source} AS src
+                WHERE src.timestamp BETWEEN %(time_lower)s::float8 AND %(time_upper)s::float8) AS b
+            ON b.bucket = g.bucket
+            GROUP BY g.bucket
+            ORDER BY g.bucket"""
+
+
+# returns lowest and highest timestamp of source or (None, None) if source is empty
+def get_time_bounds(cur, source, params=None):
+    cur.execute(f"SELECT MIN(src.timestamp), MAX(src.timestamp) FROM {source} AS src", params)
+    return cur.fetchone()
+
+
+# returns dataframe [bucket, time, count, <col>, <col>_min, <col>_max ...] with num_buckets many rows, <col> is the
+# average of the timeslot
+# if time_lower and time_upper are omitted, the range of source is used
+def fetch_buckets(cur, source, cols, num_buckets, params=None, count_col=None, time_lower=None, time_upper=None):
+    params = dict(params or {})
+    if time_lower is None or time_upper is None:
+        lower, upper = get_time_bounds(cur, source, params)
+        time_lower = lower if time_lower is None else time_lower
+        time_upper = upper if time_upper is None else time_upper
+    columns = ["bucket", "time", "count"]
+    for col in cols:
+        columns += [col + "_sum", col + "_min", col + "_max"]
+    if time_lower is None or time_upper is None:
+        return pd.DataFrame(columns=[c for c in columns if not c.endswith("_sum")] + cols)
+
+    # width_bucket needs an upper bound that is bigger than the lower bound
+    if time_upper <= time_lower:
+        time_upper = time_lower + 1
+
+    params.update(time_lower=float(time_lower), time_upper=float(time_upper), num_buckets=int(num_buckets))
+    cur.execute(bucket_sql(source, cols, count_col), params)
+    df = pd.DataFrame(cur.fetchall(), columns=columns)
+    df["count"] = df["count"].astype(float)
+    for col in cols:
+        df[col] = df.pop(col + "_sum").astype(float) / df["count"].where(df["count"] > 0)
+    return df
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+import plotly.io as pio
+import psycopg2 as ps
+import app.dashboard.credentials as credentials
+
+
+###
+# Constant definitions
+###
+
+# seconds the data version is reused before it is read from the DB again, so visitors don't cause a query each
+version_ttl = 5
+# seconds rendered figures are kept in redis, older versions aren't requested anymore anyway
+redis_ttl = 24 * 60 * 60
+# number of (page, key) entries kept in memory, least recently used entries are dropped first
+cache_size = 256
+
+# (page, key) -> (version, dict figure name -> figure dict), ordered from least to most recently used
+figures = OrderedDict()
+# (page, key) -> lock, so figures of a page are only built once per version even if many visitors come at once
+build_locks = {}
+lock = threading.Lock()
+
+version = None
+version_time = 0
+# redis client if DASH_REDIS_URL is set (multiple dashboard workers share rendered figures), False if not available
+redis_client = None
+
+
+###
+# Function definitions
+###
+
+def connect():
+    db_user, db_password, user, password = credentials.get()
+    # Connect to postgres database
+    return ps.connect(database="postgres",
+                      user=db_user,
+                      host="localhost",
+                      password=db_password,
+                      port=5432)
+
+
+# returns the current data version, the data_daemon increases it every time it ingested new data
+def get_version():
+    global version, version_time
+    if version is not None and time.monotonic() - version_time < version_ttl:
+        return version
+
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT version FROM data_version WHERE id = 1")
+        row = cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+    version = 0 if row is None else row[0]
+    version_time = time.monotonic()
+    return version
+
+
+# returns redis client or None, redis is optional and only used if DASH_REDIS_URL is set in the env file
+def get_redis():
+    global redis_client
+    if redis_client is None:
+        credentials.get()
+        url = os.getenv("DASH_REDIS_URL")
+        redis_client = False
+        if url:
+            try:
+                import redis
+                redis_client = redis.Redis.from_url(url)
+            except ImportError:
+                print("Warning: DASH_REDIS_URL is set but redis is not installed, figures are only cached in memory")
+    return redis_client or None
+
+
+def load_from_redis(page, key, current):
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        data = client.get(f"figures:{page}:{key}:{current}")
+    except Exception as e:
+        print(f"Warning: Could not read figures from redis: {str(e)}")
+        return None
+    return None if data is None else json.loads(data)
+
+
+def save_to_redis(page, key, current, rendered):
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.set(f"figures:{page}:{key}:{current}", json.dumps(rendered), ex=redis_ttl)
+    except Exception as e:
+        print(f"Warning: Could not save figures to redis: {str(e)}")
+
+
+# returns dict figure name -> figure dict for page and key (e.g. the sensor name)
+# build is called without arguments and returns dict figure name -> plotly figure, it only gets called if the data
+# changed since the figures were built the last time
+def get_figures(page, key, build):
+    current = get_version()
+    with lock:
+        cached = figures.get((page, key))
+        if cached is not None:
+            figures.move_to_end((page, key))
+    if cached is not None and cached[0] == current:
+        return cached[1]
+
+    with lock:
+        build_lock = build_locks.setdefault((page, key), threading.Lock())
+    with build_lock:
+        # another visitor may have built the figures while waiting for the lock
+        cached = figures.get((page, key))
+        if cached is not None and cached[0] == current:
+            return cached[1]
+
+        rendered = load_from_redis(page, key, current)
+        if rendered is None:
+            # plotly's json encoder converts numpy arrays and dates, so the figures can be shared through redis
+            rendered = {name: json.loads(pio.to_json(fig)) for name, fig in build().items()}
+            save_to_redis(page, key, current, rendered)
+        with lock:
+            figures[(page, key)] = (current, rendered)
+            figures.move_to_end((page, key))
+            while len(figures) > cache_size:
+                old_key, _ = figures.popitem(last=False)
+                build_locks.pop(old_key, None)
+        return rendered
@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+###
+# Constant definitions
+###
+
+# upper limit of memory used by the cached frames, least recently used entries are dropped first
+max_bytes = 256 * 1024 * 1024
+
+# key -> (dict frame name -> pyarrow table, size in bytes), ordered from least to most recently used
+entries = OrderedDict()
+total_bytes = 0
+# callbacks run in multiple threads
+lock = threading.Lock()
+
+
+###
+# Function definitions
+###
+
+# returns table as dataframe, only rows of sensor_name are converted if it is provided
+def to_df(table, sensor_name=None):
+    if sensor_name is not None:
+        table = table.filter(pc.equal(table["sensor_name"], sensor_name))
+    return table.to_pandas()
+
+
+# store dict frame name -> dataframe under key, replaces older frames of the key and returns the stored tables
+# frames are kept as arrow tables, they are columnar and a lot smaller than the dataframes with object columns
+def put(key, frames):
+    global total_bytes
+    tables = {name: pa.Table.from_pandas(df, preserve_index=False) for name, df in frames.items()}
+    size = sum(t.nbytes for t in tables.values())
+
+    with lock:
+        if key in entries:
+            total_bytes -= entries.pop(key)[1]
+        entries[key] = (tables, size)
+        total_bytes += size
+        # the newest entry is always kept, even if it is bigger than max_bytes on its own
+        while total_bytes > max_bytes and len(entries) > 1:
+            total_bytes -= entries.popitem(last=False)[1][1]
+    return tables
+
+
+# returns frame name of key as dataframe (see to_df) or None if key isn't cached (anymore)
+def get(key, name, sensor_name=None):
+    with lock:
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        entries.move_to_end(key)
+    return to_df(entry[0][name], sensor_name)
+
+
+# like get, but calls loader(key) to fill the cache if key isn't cached
+def get_or_load(key, name, loader, sensor_name=None):
+    df = get(key, name, sensor_name)
+    if df is None:
+        tables = put(key, loader(key))
+        df = to_df(tables[name], sensor_name)
+    return df
@@ -1,4 +1,6 @@
 import datetime
+import functools
+import numpy as np
 import pandas as pd
 import dash
 from dash import dcc
@@ -6,6 +8,7 @@ import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import psycopg2 as ps
 import app.dashboard.credentials as credentials
+import app.dashboard.figure_cache as figure_cache
 
 
 dash.register_page(__name__, path_template="/heatmap/<name>")
@@ -29,19 +32,44 @@ card_class = "text-white shadow p-0 rounded w-100"
 graph_config = {"displayModeBar": "hover"}
 
 
+def connect():
+    db_user, db_password, user, password = credentials.get()
+    # Connect to postgres database
+    return ps.connect(database="postgres",
+                      user=db_user,
+                      host="localhost",
+                      password=db_password,
+                      port=5432)
+
+
+# returns names of all sensors with jobs, cached until the data_daemon changes the data version
+@functools.lru_cache(maxsize=2)
+def known_sensors(version):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT DISTINCT sensor_name FROM sensor_job WHERE job_name != 'public_page'")
+        return frozenset(r[0] for r in cur.fetchall())
+    finally:
+        cur.close()
+        conn.close()
+
+
+# returns months since year 0 of unix timestamps, so months can be used as consecutive indices
+def month_index(timestamps):
+    dates = pd.DatetimeIndex(pd.to_datetime(np.asarray(timestamps, dtype=float), unit='s'))
+    return (dates.year * 12 + dates.month - 1).to_numpy()
+
+
 # create dataframe [year, month, count] for every year-month combination between now and years many years ago where
 # count is number of jobs in this year-month
 def create_sensor_df(cur, sensor, years=2):
     # get the timestamp of input years many years ago, if timestamp is in middle of year, take the first day of the year
     # as lower bound for jobs to be included and today as upper bound
     base = datetime.datetime.utcnow() - datetime.timedelta(weeks=years * 52)
-    start_of_year = datetime.datetime(base.year, 1, 1, tzinfo=datetime.timezone.utc)
-    year_lower = start_of_year.year
-    month_lower = start_of_year.month
-    start_of_year = start_of_year.timestamp()
-    year_month_upper = datetime.datetime.today().strftime("%Y %m")
-    year_upper = int(year_month_upper.split()[0])
-    month_upper = int(year_month_upper.split()[1])
+    start_of_year = datetime.datetime(base.year, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+    month_lower = month_index([start_of_year])[0]
+    month_upper = month_index([datetime.datetime.utcnow().timestamp()])[0]
 
     if sensor == "all":
         # get all jobs
@@ -60,50 +88,25 @@ def create_sensor_df(cur, sensor, years=2):
         data = cur.fetchall()
         df_jobs = pd.DataFrame(data=data, columns=["name", "start_time", "end_time"])
 
-    # create dataframe for plotting year, month and count, prefill with all years and months to plot with count of zero
-    df_heatmap = pd.DataFrame(columns=['year', 'month', 'count'])
-    df_heatmap.loc[len(df_heatmap)] = year_lower, month_lower, 0
-    while not (year_lower == year_upper and month_lower == month_upper):
-        if month_lower < 12:
-            month_lower += 1
-        else:
-            month_lower = 1
-            year_lower += 1
-        df_heatmap.loc[len(df_heatmap)] = year_lower, month_lower, 0
-
-    # iterate over every job, add up count for year month combinations where job was active
-    for index, row in df_jobs.iterrows():
-        start = max(start_of_year, row['start_time'])
-        start = datetime.datetime.utcfromtimestamp(start).strftime("%Y %m")
-        end = datetime.datetime.utcfromtimestamp(row['end_time']).strftime("%Y %m")
-
-        if start_of_year < int(row['end_time']):
-            s_year = int(start.split()[0])
-            s_month = int(start.split()[1])
-            e_year = int(end.split()[0])
-            e_month = int(end.split()[1])
-
-            # increment count for every year-month combination where job was active
-            df_heatmap.loc[(df_heatmap["year"] == s_year) & (df_heatmap["month"] == s_month), "count"] += 1
-            while not (s_year == e_year and s_month == e_month):
-                if s_month < 12:
-                    s_month += 1
-                else:
-                    s_month = 1
-                    s_year += 1
-                df_heatmap.loc[(df_heatmap["year"] == s_year) & (df_heatmap["month"] == s_month), "count"] += 1
-
-    return df_heatmap
+    # first and last active month of every job as index into the months between month_lower and month_upper
+    num_months = month_upper - month_lower + 1
+    start_time = df_jobs["start_time"].astype(float).fillna(start_of_year).clip(lower=start_of_year)
+    starts = month_index(start_time) - month_lower
+    ends = np.minimum(month_index(df_jobs["end_time"].astype(float)) - month_lower, num_months - 1)
+    active = (df_jobs["end_time"].astype(float) > start_of_year).to_numpy() & (starts <= ends) & (starts < num_months)
 
+    # difference array: +1 in the first month of a job, -1 after its last month, cumulative sum is the count per month
+    diff = np.zeros(num_months + 1, dtype=int)
+    np.add.at(diff, starts[active], 1)
+    np.add.at(diff, ends[active] + 1, -1)
 
-def layout(name=None, **kwargs):
-    db_user, db_password, user, password = credentials.get()
-    # Connect to postgres database
-    conn = ps.connect(database="postgres",
-                      user=db_user,
-                      host="localhost",
-                      password=db_password,
-                      port=5432)
+    months = np.arange(month_lower, month_upper + 1)
+    return pd.DataFrame({"year": months // 12, "month": months % 12 + 1, "count": np.cumsum(diff[:num_months])})
+
+
+# returns dict with the heatmap of sensor name, only called by figure_cache if the data changed
+def build_figures(name):
+    conn = connect()
     cur = conn.cursor()
 
     # create dataframe, define labels and heatmap graph
@@ -149,12 +152,25 @@ def layout(name=None, **kwargs):
     cur.close()
     conn.close()
 
+    return {"heatmap": fig}
+
+
+def layout(name=None, **kwargs):
+    # figures are rebuilt once new jobs arrive or a new month starts
+    month = datetime.datetime.utcnow().strftime("%Y %m")
+    # the name comes from the public url, only heatmaps of existing sensors are cached so arbitrary names can't fill
+    # the cache (or redis)
+    if name == "all" or name in known_sensors(figure_cache.get_version()):
+        figures = figure_cache.get_figures("heatmap", (name, month), lambda: build_figures(name))
+    else:
+        figures = build_figures(name)
+
     # layout of site
     return dbc.Container(
         dbc.Row(
             dbc.Col(
                 dbc.Card(
-                    dcc.Graph(figure=fig,
+                    dcc.Graph(figure=figures["heatmap"],
                               config=graph_config
                             ),
                     style=card_style,
@@ -1,4 +1,3 @@
-from io import StringIO
 import plotly.express as px
 import pandas as pd
 import dash
@@ -6,10 +5,16 @@ from dash import dcc, html, Input, Output, State, callback, ALL, ctx
 import dash_bootstrap_components as dbc
 import psycopg2 as ps
 import app.dashboard.credentials as credentials
+import app.dashboard.buckets as buckets
+import app.dashboard.frame_store as frame_store
+import app.dashboard.auth as auth
 
 
 dash.register_page(__name__, path_template="/job_details/<name>")
 
+# num of datapoints the signal data of all sensors gets aggregated to
+num_datapoints = 200
+
 ##
 # Styles
 ##
@@ -112,14 +117,86 @@ def draw_sensor_buttons(sensors):
     return buttonList
 
 
-def layout(name=None, **kwargs):
+def connect():
     db_user, db_password, user, password = credentials.get()
     # Connect to postgres database
-    conn = ps.connect(database="postgres",
+    return ps.connect(database="postgres",
                       user=db_user,
                       host="localhost",
                       password=db_password,
                       port=5432)
+
+
+# returns dict with all dataframes of an iridium job that are needed by the callbacks
+def query_frames(cur, name):
+    # get configration of all sensors
+    cur.execute("""SELECT sensor_name, sample_rate, center_freq, bandwidth, gain, if_gain, bb_gain, decimation 
+                    FROM sensor_job 
+                    WHERE job_name = %s""", (name,))
+    df_conf = pd.DataFrame(cur.fetchall(), columns=['sensor_name', 'sample_rate', 'center_freq', 'bandwidth',
+                                                    'gain', 'if_gain', 'bb_gain', 'decimation'])
+
+    # get stderr data of all sensors
+    cur.execute("""SELECT s.timestamp, s.i, s.o, s.ok_s, s.ok, s.drops, s.drop_rate, s.queue_saturation,
+                j.sensor_name 
+                FROM stderr as s, sensor_job as j 
+                WHERE s.id = j.id 
+                AND j.job_name = %s
+                ORDER BY timestamp, ok""", (name,))
+    df_stderr = pd.DataFrame(cur.fetchall(), columns=['timestamp', 'i', 'o', 'ok_s', 'ok', 'drops', 'drop_rate',
+                                                      'queue_saturation', 'sensor_name'])
+    df_stderr["timestamp"] = pd.to_datetime(df_stderr["timestamp"], unit='s')
+
+    # get signal data of all sensors
+    cur.execute("""SELECT j.sensor_name, s.timestamp, s.signal_level, s.background_noise, s.snr, s.count 
+                FROM signal as s, sensor_job as j 
+                WHERE s.id = j.id 
+                AND j.job_name = %s 
+                ORDER BY s.timestamp ASC""", (name,))
+    df_signal = pd.DataFrame(cur.fetchall(),
+                             columns=['sensor_name', 'timestamp', 'signal_level', 'background_noise', 'snr',
+                                      'count'])
+    df_signal["timestamp"] = pd.to_datetime(df_signal["timestamp"], unit='s')
+
+    # aggregate signal data of all sensors to num_datapoints timeslots and calculate cumulative sum to show data
+    # for all sensors
+    source = """(SELECT s.* 
+                FROM signal as s, sensor_job as j 
+                WHERE s.id = j.id 
+                AND j.job_name = %(name)s)"""
+    df_signal_sum = buckets.fetch_buckets(cur, source, [], num_datapoints, {"name": name}, count_col="count")
+    df_signal_sum = df_signal_sum.rename(columns={"time": "timestamp"})
+    df_signal_sum["timestamp"] = pd.to_datetime(df_signal_sum["timestamp"], unit='s')
+    df_signal_sum['sum'] = df_signal_sum['count'].cumsum()
+
+    # get packet data of all sensors
+    cur.execute("""SELECT s.sensor_name, p.type, p.count 
+                FROM packets as p, sensor_job as s 
+                WHERE s.id = p.id
+                AND s.job_name = %s""", (name,))
+    df_packets = pd.DataFrame(cur.fetchall(), columns=['sensor_name', 'type', 'count'])
+
+    # calculate sum of packet types for all sensors
+    df_packets_sum = df_packets.drop(columns=['sensor_name']).groupby('type')
+    df_packets_sum = df_packets_sum['count'].sum().reset_index()
+
+    return {"conf": df_conf, "stderr": df_stderr, "signal": df_signal, "signal_sum": df_signal_sum,
+            "packets": df_packets, "packets_sum": df_packets_sum}
+
+
+# loads the dataframes of a job if they were dropped from the frame store (e.g. after a restart of the dashboard)
+def load_frames(name):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        return query_frames(cur, name)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def layout(name=None, **kwargs):
+    conn = connect()
     cur = conn.cursor()
 
     ###
@@ -137,7 +214,7 @@ def layout(name=None, **kwargs):
         return html.Div(
             dbc.ListGroup(
                 [dbc.ListGroupItem("No command found for this job. "
-                                   "You may need to wait up to 24h if job was recently created.", color="dark")],
+                                   "Jobs show up once the first sensor uploaded its data.", color="dark")],
                 class_name="w-25 text-center"))
 
     command = command[0]
@@ -176,50 +253,14 @@ def layout(name=None, **kwargs):
             return html.Div(
                 dbc.ListGroup(
                     [dbc.ListGroupItem("No sensor data for this job. "
-                                       "You may need to wait up to 24h if data was recently uploaded.", color="dark")],
+                                       "You may need to wait a few minutes if data was recently uploaded.", color="dark")],
                     class_name="w-25 text-center"))
 
-        # get configration of all sensors
-        cur.execute("""SELECT sensor_name, sample_rate, center_freq, bandwidth, gain, if_gain, bb_gain, decimation 
-                        FROM sensor_job 
-                        WHERE job_name = %s""", (name,))
-        df_conf = pd.DataFrame(cur.fetchall(), columns=['sensor_name', 'sample_rate', 'center_freq', 'bandwidth',
-                                                        'gain', 'if_gain', 'bb_gain', 'decimation'])
-
-        # get stderr data of all sensors
-        cur.execute("""SELECT s.timestamp, s.i, s.o, s.ok_s, s.ok, j.sensor_name 
-                    FROM stderr as s, sensor_job as j 
-                    WHERE s.id = j.id 
-                    AND j.job_name = %s
-                    ORDER BY timestamp, ok""", (name,))
-        df_stderr = pd.DataFrame(cur.fetchall(), columns=['timestamp', 'i', 'o', 'ok_s', 'ok', 'sensor_name'])
-        df_stderr["timestamp"] = pd.to_datetime(df_stderr["timestamp"], unit='s')
-
-        # get signal data of all sensors
-        cur.execute("""SELECT j.sensor_name, s.timestamp, s.signal_level, s.background_noise, s.snr, s.count 
-                    FROM signal as s, sensor_job as j 
-                    WHERE s.id = j.id 
-                    AND j.job_name = %s 
-                    ORDER BY s.timestamp ASC""", (name,))
-        df_signal = pd.DataFrame(cur.fetchall(),
-                                 columns=['sensor_name', 'timestamp', 'signal_level', 'background_noise', 'snr',
-                                          'count'])
-        df_signal["timestamp"] = pd.to_datetime(df_signal["timestamp"], unit='s')
-
-        # calculate cumulative sum without sensor names to show data for all sensors
-        df_signal_sum = df_signal.drop(columns=['sensor_name'])
-        df_signal_sum['sum'] = df_signal_sum['count'].cumsum()
-
-        # get packet data of all sensors
-        cur.execute("""SELECT s.sensor_name, p.type, p.count 
-                    FROM packets as p, sensor_job as s 
-                    WHERE s.id = p.id
-                    AND s.job_name = %s""", (name,))
-        df_packets = pd.DataFrame(cur.fetchall(), columns=['sensor_name', 'type', 'count'])
-
-        # calculate sum of packet types for all sensors
-        df_packets_sum = df_packets.drop(columns=['sensor_name']).groupby('type')
-        df_packets_sum = df_packets_sum['count'].sum().reset_index()
+        frames = query_frames(cur, name)
+        # keep dataframes on the server, the page only gets the job name as key to them
+        frame_store.put(name, frames)
+        df_signal_sum = frames["signal_sum"]
+        df_packets_sum = frames["packets_sum"]
 
         cur.close()
         conn.close()
@@ -267,12 +308,8 @@ def layout(name=None, **kwargs):
         # layout of site
         return dbc.Container([
             dcc.Location(id="url"),
-            dcc.Store(id="stderr", data=df_stderr.to_json(orient='split')),
-            dcc.Store(id="signal", data=df_signal.to_json(orient='split')),
-            dcc.Store(id="signal_sum", data=df_signal_sum.to_json(orient='split')),
-            dcc.Store(id="packets", data=df_packets.to_json(orient='split')),
-            dcc.Store(id="packets_sum", data=df_packets_sum.to_json(orient='split')),
-            dcc.Store(id="conf", data=df_conf.to_json(orient='split')),
+            dcc.Store(id="job_name", data=name),
+            dcc.Store(id="zoom_source", data={"job": name, "sensor": None}),
             dbc.Row([
                 # buttons
                 dbc.Col(
@@ -402,18 +439,19 @@ def toggle_collapse(n, is_open):
         Output('line_card', 'style', allow_duplicate=True),
         Output('pie_card', 'style', allow_duplicate=True),
         Output('bar_card', 'style', allow_duplicate=True),
-        Output('signal_card', 'style', allow_duplicate=True)
+        Output('signal_card', 'style', allow_duplicate=True),
+        Output('zoom_source', 'data', allow_duplicate=True)
     ],
     [
         Input('allData', 'n_clicks'),
-        State("signal_sum", "data"),
-        State("packets_sum", "data"),
+        State("job_name", "data"),
     ],
     prevent_initial_call=True
 )
-def show_all_data(x, signal_sum, packets_sum):
-    df_signal_sum = pd.read_json(StringIO(signal_sum), orient='split')
-    df_packets_sum = pd.read_json(StringIO(packets_sum), orient='split')
+def show_all_data(x, job_name):
+    auth.require_login()
+    df_signal_sum = frame_store.get_or_load(job_name, "signal_sum", load_frames)
+    df_packets_sum = frame_store.get_or_load(job_name, "packets_sum", load_frames)
 
     info = "Data for all sensors"
     display = {"display": "block"}
@@ -451,7 +489,9 @@ def show_all_data(x, signal_sum, packets_sum):
                       "Count: %{value:,}<extra></extra>"
     )
 
-    return packetLine, packetPie, packetBar, info, display, display, display, {"display": "none"}
+    zoom_source = {"job": job_name, "sensor": None}
+
+    return packetLine, packetPie, packetBar, info, display, display, display, {"display": "none"}, zoom_source
 
 
 
@@ -465,30 +505,29 @@ def show_all_data(x, signal_sum, packets_sum):
         Output('pie_card', 'style', allow_duplicate=True),
         Output('bar_card', 'style', allow_duplicate=True),
         Output('signal_card', 'style', allow_duplicate=True),
-        Output('signal_card', 'children', allow_duplicate=True)
+        Output('signal_card', 'children', allow_duplicate=True),
+        Output('zoom_source', 'data', allow_duplicate=True)
     ],
     [
         # use pattern matching callback with keyword ALL to trigger callback from all buttons that have type and sensor
         # in id
         Input({"type": "data", "sensor": ALL}, 'n_clicks'),
-        State("signal", "data"),
-        State("packets", "data"),
+        State("job_name", "data"),
     ],
     prevent_initial_call=True
 )
-def data_button(x, signal, packets):
+def data_button(x, job_name):
+    auth.require_login()
     # determine which sensor button was clicked by context
     sensor = ctx.triggered_id.sensor
 
-    df_signal = pd.read_json(StringIO(signal), orient='split')
-    df_packets = pd.read_json(StringIO(packets), orient='split')
+    # only rows of current sensor are taken out of the frame store
+    df_packetCount = frame_store.get_or_load(job_name, "packets", load_frames, sensor)
+    df_signal_sensor = frame_store.get_or_load(job_name, "signal", load_frames, sensor).sort_values(by='timestamp')
 
     info = "Data for " + sensor
     display = {"display": "block"}
 
-    # filter all dataframes by current sensor name
-    df_packetCount = df_packets[df_packets.sensor_name == sensor]
-    df_signal_sensor = df_signal[df_signal.sensor_name == sensor].sort_values(by='timestamp')
     df_signal_sensor['sum'] = df_signal_sensor['count'].cumsum()
 
     packetLine = px.line(df_signal_sensor,
@@ -543,7 +582,10 @@ def data_button(x, signal, packets):
                       "dB: %{y}<extra></extra>"
     )
 
-    return packetLine, packetPie, packetBar, info, display, display, display, display, graph
+    # zooming into packetLine and signalLine shows the data of this sensor in higher resolution
+    zoom_source = {"job": job_name, "sensor": sensor}
+
+    return packetLine, packetPie, packetBar, info, display, display, display, display, graph, zoom_source
 
 @callback(
     [
@@ -554,28 +596,32 @@ def data_button(x, signal, packets):
         Output('line_card', 'style', allow_duplicate=True),
         Output('pie_card', 'style', allow_duplicate=True),
         Output('bar_card', 'style', allow_duplicate=True),
-        Output('signal_card', 'style', allow_duplicate=True)
+        Output('signal_card', 'style', allow_duplicate=True),
+        Output('zoom_source', 'data', allow_duplicate=True)
     ],
     [
         # use pattern matching callback with keyword ALL to trigger callback from all buttons that have type and sensor
         # in id
         Input({"type": "stderr", "sensor": ALL}, 'n_clicks'),
-        State("stderr", "data"),
+        State("job_name", "data"),
     ],
     prevent_initial_call=True
 )
-def stderr_button(x, stderr):
+def stderr_button(x, job_name):
+    auth.require_login()
     # determine which sensor button was clicked by context
     sensor = ctx.triggered_id.sensor
 
-    df_stderr = pd.read_json(StringIO(stderr), orient='split')
+    df_sensor = frame_store.get_or_load(job_name, "stderr", load_frames, sensor)
 
     info = "Stderr for " + sensor
+    # jobs parsed before the extractor health was stored have no drop rate and queue saturation
+    if df_sensor['drop_rate'].notna().any():
+        info += (f" | dropped bursts: {int(df_sensor['drops'].sum()):,}"
+                 f" | max drop rate: {df_sensor['drop_rate'].max():.1%}"
+                 f" | max queue saturation: {df_sensor['queue_saturation'].max():.0%}")
     display = {"display": "block"}
 
-    # filter dataframe by current sensor name
-    df_sensor = df_stderr[df_stderr.sensor_name == sensor]
-
     lineBurst = px.line(df_sensor,
                         x='timestamp',
                         y='i',
@@ -616,7 +662,8 @@ def stderr_button(x, stderr):
                       "Avg num: %{y:,}/s<extra></extra>"
     )
 
-    return lineBurst, lineFrame, lineOk, info, display, display, display, {"display": "none"}
+    # packetLine shows stderr data, so it can't be zoomed
+    return lineBurst, lineFrame, lineOk, info, display, display, display, {"display": "none"}, None
 
 @callback(
     [
@@ -631,23 +678,21 @@ def stderr_button(x, stderr):
         # use pattern matching callback with keyword ALL to trigger callback from all buttons that have type and sensor
         # in id
         Input({"type": "config", "sensor": ALL}, 'n_clicks'),
-        State("conf", "data"),
+        State("job_name", "data"),
     ],
     prevent_initial_call=True
 )
-def conf_button(x, conf):
+def conf_button(x, job_name):
+    auth.require_login()
     # determine which sensor button was clicked by context
     sensor = ctx.triggered_id.sensor
 
-    df_conf = pd.read_json(StringIO(conf), orient='split')
+    df_conf_sensor = frame_store.get_or_load(job_name, "conf", load_frames, sensor)
 
     not_display = {"display": "none"}
     info = "Configuration for " + sensor
     style = {"display": "block", "width": "50%", "float": "right"}
 
-    # filter dataframe by current sensor name
-    df_conf_sensor = df_conf[df_conf.sensor_name == sensor]
-
     card = dbc.Card(
         dbc.ListGroup([
             dbc.ListGroupItem(
@@ -698,4 +743,4 @@ def conf_button(x, conf):
         className=card_class
     )
 
-    return info, not_display, not_display, not_display, style, card
\ No newline at end of file
+    return info, not_display, not_display, not_display, style, card
\ No newline at end of file
@@ -1,12 +1,14 @@
-from io import StringIO
+import functools
 import plotly.express as px
 import pandas as pd
 import dash
 from dash import dcc, Input, Output, callback, State
 import dash_bootstrap_components as dbc
-from flask import request, jsonify
-import requests
 import plotly.colors as pc
+import psycopg2 as ps
+import app.dashboard.credentials as credentials
+import app.dashboard.figure_cache as figure_cache
+import app.dashboard.auth as auth
 
 
 dash.register_page(__name__, path="/job_tracker")
@@ -22,6 +24,8 @@ threshold = 0.2
 # list of all allowed command types
 commands = ["get_full_status", "iridium_sniffing", "get_logs", "reboot", "get_status", "get_sys_config",
             "set_sys_config", "reset"]
+# number of filter combinations whose counts are kept in memory
+cache_size = 64
 
 ##
 # Styles
@@ -48,56 +52,92 @@ graph_config = {"displayModeBar": "hover"}
 # Functions
 ##
 
-# returns dataframe where every row contains at least one of the provided sensors as well as rows with no sensors
-def filterSensors(df, sensors):
-    # keep jobs without sensors
-    sensors.append('nan')
-    df = df.explode('sensors').astype(str)
-    df = df[df.sensors.isin(sensors)]
-    return df
+def connect():
+    db_user, db_password, user, password = credentials.get()
+    # Connect to postgres database
+    return ps.connect(database="postgres",
+                      user=db_user,
+                      host="localhost",
+                      password=db_password,
+                      port=5432)
 
 
-# return dataframe [[attribute -> count], [attribute -> count] ...]
-def count_attribute(df, attribute, rename):
-    df = df.explode(attribute)
-    df = df.groupby(attribute).count()
-    df = df.reset_index().rename(columns={rename: 'count'})
-    df = df.sort_values("count", ascending=False)
+# add percent and label cols to display only the traces with percentages bigger than threshold
+def add_percent(df):
+    df['percent'] = df['count'] / df['count'].sum() * 100
+    df['label'] = df['percent'].apply(lambda x: f"{x:.1f}%" if x >= threshold else "")
     return df
 
 
-def layout(**kwargs):
-    # get data for all jobs
-    # TODO this is a workaround, get fixedjobs directly from postgresDB in the future
-    url = "http://127.0.0.1:8000/fixedjobs/"
-    cookies = request.cookies
-    response = requests.get(url, cookies=cookies)
-    if response.status_code != 200:
-        return jsonify({"status": "Unauthorized"}), response.status_code
-    data = response.json()
-    df_jobs = pd.json_normalize(data.get("data", []), max_level=0)
-    df_jobs = df_jobs.drop(columns=["arguments", "states", "start_time", "end_time", "id"])
+# returns dataframes [status, count], [sensors, count] and [command, count] of all jobs the server knows (mirrored into
+# DB.jobs and DB.job_sensors by the data_daemon), status, sensors and command are tuples of allowed values or None to
+# not filter by them
+# jobs without sensors are always kept, commands not in the allowed list are shown as *
+# results are cached until the data_daemon changes the data version, so dataframes must not be modified
+@functools.lru_cache(maxsize=cache_size)
+def query_counts(version, status, sensors, command):
+    params = {"commands": commands,
+              "status": None if status is None else list(status),
+              "sensors": None if sensors is None else list(sensors),
+              "command": None if command is None else list(command)}
+    filtered = """WITH tracked AS (
+                    SELECT j.name, j.status, 
+                    CASE WHEN j.command = ANY(%(commands)s::text[]) THEN j.command ELSE '*' END AS command 
+                    FROM jobs as j 
+                    WHERE j.status IS NOT NULL), 
+                filtered AS (
+                    SELECT t.* 
+                    FROM tracked as t 
+                    WHERE (%(status)s::text[] IS NULL OR t.status = ANY(%(status)s::text[])) 
+                    AND (%(command)s::text[] IS NULL OR t.command = ANY(%(command)s::text[])) 
+                    AND (%(sensors)s::text[] IS NULL 
+                        OR NOT EXISTS (SELECT 1 FROM job_sensors as s WHERE s.job_name = t.name) 
+                        OR EXISTS (SELECT 1 FROM job_sensors as s 
+                                   WHERE s.job_name = t.name 
+                                   AND s.sensor_name = ANY(%(sensors)s::text[]))))"""
+
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute(filtered + """ SELECT f.status, COUNT(*) AS count 
+                    FROM filtered as f 
+                    GROUP BY f.status 
+                    ORDER BY count DESC, f.status""", params)
+        df_status = pd.DataFrame(cur.fetchall(), columns=['status', 'count'])
+
+        # count jobs per sensor, a job with multiple sensors counts for each of them
+        cur.execute(filtered + """ SELECT s.sensor_name, COUNT(*) AS count 
+                    FROM filtered as f, job_sensors as s 
+                    WHERE s.job_name = f.name 
+                    AND (%(sensors)s::text[] IS NULL OR s.sensor_name = ANY(%(sensors)s::text[])) 
+                    GROUP BY s.sensor_name 
+                    ORDER BY count DESC, s.sensor_name""", params)
+        df_sensor_count = add_percent(pd.DataFrame(cur.fetchall(), columns=['sensors', 'count']))
+
+        cur.execute(filtered + """ SELECT f.command, COUNT(*) AS count 
+                    FROM filtered as f 
+                    GROUP BY f.command 
+                    ORDER BY count DESC, f.command""", params)
+        df_command_count = add_percent(pd.DataFrame(cur.fetchall(), columns=['command', 'count']))
+    finally:
+        cur.close()
+        conn.close()
+
+    return df_status, df_sensor_count, df_command_count
+
+
+# returns tuple of checked values for query_counts
+def to_filter(values):
+    return tuple(sorted(values or []))
 
+
+def layout(**kwargs):
     ###
     # Data handling
     ###
 
-    if not showPending:
-        df_jobs = df_jobs[df_jobs.status.isin(['finished', 'failed', 'running'])]
-
-    # show all commands not in the allowed list with * symbol
-    df_jobs["command"] = df_jobs["command"].where(df_jobs["command"].isin(commands), "*")
-
-    # count sensors attribute (explode sensors because sensors is a list)
-    df_sensor_count = count_attribute(df_jobs, "sensors", "name")
-    # add percent and label cols to display only the traces with percentages bigger than threshold
-    df_sensor_count['percent'] = df_sensor_count['count'] / df_sensor_count['count'].sum() * 100
-    df_sensor_count['label'] = df_sensor_count['percent'].apply(lambda x: f"{x:.1f}%" if x >= threshold else "")
-
-    df_command_count = count_attribute(df_jobs, "command", "name")
-    # add percent and label cols to display only the traces with percentages bigger than threshold
-    df_command_count['percent'] = df_command_count['count'] / df_command_count['count'].sum() * 100
-    df_command_count['label'] = df_command_count['percent'].apply(lambda x: f"{x:.1f}%" if x >= threshold else "")
+    status = None if showPending else ('failed', 'finished', 'running')
+    df_status, df_sensor_count, df_command_count = query_counts(figure_cache.get_version(), status, None, None)
 
     # give each sensor a discrete color
     values = df_sensor_count.sensors
@@ -109,8 +149,9 @@ def layout(**kwargs):
     ###
 
     # define all charts
-    fig_status = px.pie(df_jobs,
+    fig_status = px.pie(df_status,
                         names='status',
+                        values='count',
                         color='status',
                         color_discrete_map={
                             "failed": "#a80049",
@@ -158,7 +199,6 @@ def layout(**kwargs):
 
     # layout of site
     return dbc.Container([
-        dcc.Store(id="jobs", data=df_jobs.to_json(orient='split')),
         dcc.Store(id="color_map", data=color_map),
         dbc.Row([
             dbc.Col(
@@ -179,8 +219,8 @@ def layout(**kwargs):
                             # Checklist of Status
                             dbc.Checklist(
                                 id='statusCheck',
-                                options=df_jobs['status'].unique(),
-                                value=df_jobs['status'].unique(),
+                                options=df_status['status'],
+                                value=df_status['status'],
                                 inline=True,
                                 style=checklist_style
                             )])],
@@ -204,8 +244,8 @@ def layout(**kwargs):
                             # Checkbox of Sensors
                             dbc.Checklist(
                                 id='sensorCheck',
-                                options=df_sensor_count['sensors'].unique(),
-                                value=df_sensor_count['sensors'].unique(),
+                                options=df_sensor_count['sensors'],
+                                value=df_sensor_count['sensors'],
                                 style=checklist_style
                             )
                         ])
@@ -228,8 +268,8 @@ def layout(**kwargs):
                             # Checkbox of Command
                             dbc.Checklist(
                                 id='commandCheck',
-                                options=df_jobs['command'].unique(),
-                                value=df_jobs['command'].unique(),
+                                options=df_command_count['command'],
+                                value=df_command_count['command'],
                                 style=checklist_style
                             )
                         ])
@@ -251,36 +291,22 @@ def layout(**kwargs):
         Output('commandPie', 'figure'),
     ],
     [
-        State("jobs", "data"),
         State("color_map", "data"),
         Input('statusCheck', 'value'),
         Input('sensorCheck', 'value'),
         Input('commandCheck', 'value'),
     ]
 )
-def updateCharts(jobs, color_map, status, sensor, command):
-    df_jobs = pd.read_json(StringIO(jobs), orient='split')
-
-    # filter all dataframes by active values of checkboxes
-    df_updated = df_jobs[df_jobs.status.isin(status)]
-    df_updated = df_updated[df_updated.command.isin(command)]
-    df_updated = filterSensors(df_updated, sensor)
-
-    # to filter sensors the col is exploded because it's a list, so we only keep rows with unique job_name for StatusPie
-    # and CommandPie
-    df_updated_unique = df_updated.copy().drop_duplicates(subset=["name"], keep="first")
-
-    # count sensors attribute (explode sensors because sensors is a list)
-    df_updatedSensorCount = count_attribute(df_updated, "sensors", "name")
-    # add percent and label cols to display only the traces with percentages bigger than threshold
-    df_updatedSensorCount['percent'] = df_updatedSensorCount['count'] / df_updatedSensorCount['count'].sum() * 100
-    df_updatedSensorCount['label'] = df_updatedSensorCount['percent'].apply(lambda x: f"{x:.1f}%" if x >= threshold else "")
-    df_updatedCommandCount = count_attribute(df_updated_unique, "command", "name")
-    df_updatedCommandCount['percent'] = df_updatedCommandCount['count'] / df_updatedCommandCount['count'].sum() * 100
-    df_updatedCommandCount['label'] = df_updatedCommandCount['percent'].apply(lambda x: f"{x:.1f}%" if x >= threshold else "")
-
-    updatedStatusPie = px.pie(df_updated_unique,
+def updateCharts(color_map, status, sensor, command):
+    # callbacks aren't covered by the login of the page, the statistics stay behind it
+    auth.require_login()
+    # filter all counts by active values of checkboxes inside the DB
+    df_updatedStatus, df_updatedSensorCount, df_updatedCommandCount = query_counts(
+        figure_cache.get_version(), to_filter(status), to_filter(sensor), to_filter(command))
+
+    updatedStatusPie = px.pie(df_updatedStatus,
                               names='status',
+                              values='count',
                               color='status',
                               color_discrete_map={
                                   "failed": "#a80049",
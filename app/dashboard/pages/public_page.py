@@ -5,6 +5,7 @@ from dash import dcc
 import dash_bootstrap_components as dbc
 import psycopg2 as ps
 import app.dashboard.credentials as credentials
+import app.dashboard.figure_cache as figure_cache
 
 
 dash.register_page(__name__, path_template="/public_page")
@@ -49,7 +50,8 @@ fig_pie_style = dict(
 graph_config = {"displayModeBar": "hover"}
 
 
-def layout(**kwargs):
+# returns dict with all figures of the page, only called by figure_cache if the data changed
+def build_figures():
     db_user, db_password, user, password = credentials.get()
     # Connect to postgres database
     conn = ps.connect(database="postgres",
@@ -123,14 +125,23 @@ def layout(**kwargs):
                       "Count: %{y:,}<extra></extra>"
     )
 
+    return {"packetLine": packetLine, "packetPie": packetPie, "packetBar": packetBar}
+
+
+def layout(**kwargs):
+    # the public page gets anonymous traffic, so the figures are only built once per data version
+    figures = figure_cache.get_figures("public_page", None, build_figures)
+
     # layout of site
     return dbc.Container([
+        # public page has no zoomable data
+        dcc.Store(id="zoom_source", data=None),
         dbc.Row([
             dbc.Col([
                 dbc.Card([
                     dcc.Graph(
                         id="packetLine",
-                        figure=packetLine,
+                        figure=figures["packetLine"],
                         config=graph_config
                     )],
                     style=card_style)])],
@@ -140,7 +151,7 @@ def layout(**kwargs):
                 dbc.Card([
                     dcc.Graph(
                         id="packetPie",
-                        figure=packetPie,
+                        figure=figures["packetPie"],
                         config=graph_config
                     )],
                     style=card_style)
@@ -151,7 +162,7 @@ def layout(**kwargs):
                 dbc.Card([
                     dcc.Graph(
                         id="packetBar",
-                        figure=packetBar,
+                        figure=figures["packetBar"],
                         config=graph_config
                     )],
                     style=card_style)
@@ -5,12 +5,16 @@ from dash import dcc
 import dash_bootstrap_components as dbc
 import psycopg2 as ps
 import app.dashboard.credentials as credentials
+import app.dashboard.buckets as buckets
+import app.dashboard.figure_cache as figure_cache
 
 
 dash.register_page(__name__, path_template="/sensor_details/<name>")
 
 # threshold under which percent traces are not shown in fig_sensor & fig_command
 threshold = 0.2
+# num of datapoints the signal data of all jobs gets aggregated to
+num_datapoints = 500
 
 ##
 # Styles
@@ -50,7 +54,8 @@ card_class = "text-white shadow p-0 rounded w-100"
 graph_config = {"displayModeBar": "hover"}
 
 
-def layout(name=None, **kwargs):
+# returns dict with all figures of sensor name, only called by figure_cache if the data changed
+def build_figures(name):
     db_user, db_password, user, password = credentials.get()
     # Connect to postgres database
     conn = ps.connect(database="postgres",
@@ -60,13 +65,13 @@ def layout(name=None, **kwargs):
                       port=5432)
     cur = conn.cursor()
 
-    # get signal data
-    cur.execute("""SELECT s.timestamp, s.count, j.job_name 
+    # get signal data of all jobs aggregated to num_datapoints timeslots
+    source = """(SELECT s.* 
                 FROM signal as s, sensor_job as j 
                 WHERE j.id = s.id 
-                AND j.sensor_name = %s 
-                ORDER BY s.timestamp""", (name,))
-    df_signal = pd.DataFrame(cur.fetchall(), columns=['timestamp', 'count', 'job_name'])
+                AND j.sensor_name = %(name)s)"""
+    df_signal = buckets.fetch_buckets(cur, source, [], num_datapoints, {"name": name}, count_col="count")
+    df_signal = df_signal.rename(columns={"time": "timestamp"})
     df_signal["timestamp"] = pd.to_datetime(df_signal["timestamp"], unit='s')
 
     df_signal['sum'] = df_signal['count'].cumsum()
@@ -123,14 +128,22 @@ def layout(name=None, **kwargs):
                       "Sum: %{y}<extra></extra>"
     )
 
+    return {"packetLine": packetLine, "packetPie": packetPie, "packetBar": packetBar}
+
+
+def layout(name=None, **kwargs):
+    figures = figure_cache.get_figures("sensor_details", name, lambda: build_figures(name))
+
     # layout of site
     return dbc.Container([
+            # zooming into packetLine shows the data of this sensor in higher resolution
+            dcc.Store(id="zoom_source", data={"job": None, "sensor": name}),
             dbc.Row([
                 dbc.Col(
                     dbc.Card([
                         dcc.Graph(
                             id="packetLine",
-                            figure=packetLine,
+                            figure=figures["packetLine"],
                             config=graph_config
                         )],
                         className=card_class,
@@ -140,7 +153,7 @@ def layout(name=None, **kwargs):
                     dbc.Card([
                         dcc.Graph(
                             id="packetPie",
-                            figure=packetPie,
+                            figure=figures["packetPie"],
                             config=graph_config
                         )],
                         className=card_class,
@@ -150,7 +163,7 @@ def layout(name=None, **kwargs):
                     dbc.Card([
                         dcc.Graph(
                             id="packetBar",
-                            figure=packetBar,
+                            figure=figures["packetBar"],
                             config=graph_config
                         )],
                         className=card_class,
@@ -8,17 +8,29 @@ from zipfile import ZipFile
 import pandas as pd
 from pathlib import Path
 import app.dashboard.credentials as credentials
-from parser_iridium import agg_to_df
+import app.dashboard.buckets as buckets
+import parse_queue
 
 
 # num of datapoints the signal data gets aggregated to
 num_datapoints = 100
+# seconds between two checks of the parse queue
+poll_interval = 5
+# seconds between two updates of the fixed jobs mirror (DB.jobs & DB.job_sensors) used by the job tracker
+mirror_interval = 60
 # path to temp folder, assume script gets run by startup.sh in root folder
 temp_path = Path("./app/dashboard/parser/temp")
 temp_path.mkdir(exist_ok=True)
 
 
-# aggregate all data from DB.signal and DB.packets so public page has only num_datapoints many datapoints
+# new data version lets the dashboard pages rebuild their cached figures, gets committed with the new data
+def bump_data_version(cur):
+    cur.execute("""INSERT INTO data_version (id, version) VALUES (1, 1) 
+                ON CONFLICT (id) DO UPDATE SET version = data_version.version + 1""")
+
+
+# merge DB.signal and DB.packets of all jobs that are not part of the public page yet into the public page aggregate
+# (num_datapoints many datapoints), so the cost only depends on the number of new jobs
 def agg_all_data(conn, cur):
     cur.execute("""INSERT INTO jobs (name) VALUES (%s) ON CONFLICT DO NOTHING""", ("public_page", ))
 
@@ -31,60 +43,115 @@ def agg_all_data(conn, cur):
     # save returned id
     index = cur.fetchone()[0]
 
-    # aggregate packets data
-    sql = ("""SELECT p.type, SUM(p.count) 
-            FROM packets as p, sensor_job as s 
-            WHERE s.job_name != %s
-            AND s.id = p.id
-            GROUP BY p.type""")
-    cur.execute(sql, ("public_page", ))
-    data = cur.fetchall()
-    
-    if data:
-        df_packets = pd.DataFrame(data=data, columns=["type", "count"])
-        for i, r in df_packets.iterrows():
-            sql = """INSERT INTO packets (id, type, count) 
-                    VALUES (%s, %s, %s) 
-                    ON CONFLICT ("id", "type") DO UPDATE SET
-                    type = EXCLUDED.type, 
-                    count = EXCLUDED.count"""
-            cur.execute(sql, (index, r["type"], int(r["count"])))
-
-    # aggregate signal data
-    sql = ("SELECT s.timestamp AS time, s.signal_level, s.background_noise, s.snr, s.count AS counter "
-           "FROM signal as s, sensor_job as j "
-           "WHERE s.id = j.id "
-           "AND j.job_name != %s "
-           "ORDER BY s.timestamp")
+    # databases of the old full aggregation have public page data but no merged jobs, remerge all jobs from scratch
+    # instead of adding them a second time
+    cur.execute("SELECT EXISTS (SELECT 1 FROM public_page_jobs)")
+    if not cur.fetchone()[0]:
+        cur.execute("DELETE FROM signal WHERE id = %s", (index, ))
+        cur.execute("DELETE FROM packets WHERE id = %s", (index, ))
+
+    # find all jobs which are not merged into the public page yet
+    sql = ("""SELECT s.id 
+            FROM sensor_job as s 
+            WHERE s.job_name != %s 
+            AND s.id NOT IN (SELECT id FROM public_page_jobs)""")
     cur.execute(sql, ("public_page", ))
+    new_ids = [r[0] for r in cur.fetchall()]
+
+    if not new_ids:
+        conn.commit()
+        return
+
+    # add packet counts of the new jobs to the public counts
+    sql = """INSERT INTO packets (id, type, count) 
+            SELECT %s, p.type, SUM(p.count) 
+            FROM packets as p 
+            WHERE p.id = ANY(%s) 
+            GROUP BY p.type 
+            ON CONFLICT ("id", "type") DO UPDATE SET 
+            count = packets.count + EXCLUDED.count"""
+    cur.execute(sql, (index, new_ids))
+
+    # merge signal data of the new jobs with the public signal data inside the DB, if the new jobs are outside of the
+    # current time range the timeslots get re-derived for the whole range
+    cols = ['signal_level', 'background_noise', 'snr']
+    source = "(SELECT * FROM signal WHERE id = %(index)s OR id = ANY(%(new_ids)s))"
+    df_signal_agg = buckets.fetch_buckets(cur, source, cols, num_datapoints, {"index": index, "new_ids": new_ids},
+                                          count_col="count")
+
+    if not df_signal_agg.empty:
+        cur.execute("DELETE FROM signal WHERE id = %s", (index, ))
+        cur.executemany("""INSERT INTO signal (id, timestamp, "signal_level", "background_noise", snr, count) 
+                        VALUES (%s, %s, %s, %s, %s, %s)""",
+                        [(index, float(r.time), float(r.signal_level), float(r.background_noise), float(r.snr),
+                          float(r.count)) for r in df_signal_agg.itertuples()])
+
+    # remember merged jobs, commit everything at once so no job gets merged twice
+    cur.executemany("INSERT INTO public_page_jobs (id) VALUES (%s)", [(i, ) for i in new_ids])
+    bump_data_version(cur)
+    conn.commit()
+
 
-    rows = cur.fetchall()
-    if rows:
-        colnames = [desc[0] for desc in cur.description]
-        # convert to list of dicts
-        result = [dict(zip(colnames, row)) for row in rows]
-
-        # get upper and lower bound for time
-        time_lower = result[0]["time"]
-        time_upper = result[len(result)-1]["time"]
-
-        cols = ['signal_level', 'background_noise', 'snr']
-        df_signal_agg = agg_to_df(result, num_datapoints, time_lower, time_upper, cols, None, ["counter"])
-
-        for i, r in df_signal_agg.iterrows():
-            cur.execute("""INSERT INTO signal (id, timestamp, "signal_level", "background_noise", snr, count) 
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT ("id", "timestamp") DO UPDATE SET 
-                        "signal_level" = EXCLUDED."signal_level", 
-                        "background_noise" = EXCLUDED."background_noise", 
-                        snr = EXCLUDED.snr, 
-                        count = EXCLUDED.count""",
-                        (index, float(r['time']), float(r['signal_level']), float(r['background_noise']),
-                         float(r['snr']), float(r['counter'])))
+# mirror all fixed jobs of the server into DB.jobs (command, times & status) and the state of every sensor of a job
+# into DB.job_sensors, so the dashboard doesn't have to request them from the server
+# returns False if the fixed jobs couldn't be downloaded
+def mirror_fixed_jobs(session, conn, cur, auth):
+    response = session.get("http://127.0.0.1:8000/fixedjobs/")
+    # the daemon keeps its session for days, login again once the token expired
+    if response.status_code == 401:
+        session.post('http://127.0.0.1:8000/login/userlogin', auth)
+        response = session.get("http://127.0.0.1:8000/fixedjobs/")
+    if response.status_code != 200:
+        print("Server error ", response.status_code)
+        return False
+    # a row can only be upserted once per statement, so drop duplicates
+    fixed_jobs = list({j["name"]: j for j in response.json().get("data", [])}.values())
+
+    names = [j["name"] for j in fixed_jobs]
+    sensor_rows = list({(j["name"], s): (j["name"], s, (j.get("states") or {}).get(s))
+                        for j in fixed_jobs for s in j.get("sensors") or []}.values())
+
+    # upsert all jobs at once, rows only count as changed if a value is different
+    sql = """INSERT INTO jobs (name, command, start_time, end_time, status) 
+            SELECT * FROM unnest(%s::text[], %s::text[], %s::int4[], %s::int4[], %s::text[]) 
+            ON CONFLICT (name) DO UPDATE SET 
+            command = EXCLUDED.command, 
+            start_time = EXCLUDED.start_time, 
+            end_time = EXCLUDED.end_time, 
+            status = EXCLUDED.status 
+            WHERE (jobs.command, jobs.start_time, jobs.end_time, jobs.status) 
+            IS DISTINCT FROM (EXCLUDED.command, EXCLUDED.start_time, EXCLUDED.end_time, EXCLUDED.status)"""
+    cur.execute(sql, (names, [j.get("command") for j in fixed_jobs], [j.get("start_time") for j in fixed_jobs],
+                      [j.get("end_time") for j in fixed_jobs], [j.get("status") for j in fixed_jobs]))
+    changes = cur.rowcount
+
+    sql = """INSERT INTO job_sensors (job_name, sensor_name, state) 
+            SELECT * FROM unnest(%s::text[], %s::text[], %s::text[]) 
+            ON CONFLICT (job_name, sensor_name) DO UPDATE SET 
+            state = EXCLUDED.state 
+            WHERE job_sensors.state IS DISTINCT FROM EXCLUDED.state"""
+    cur.execute(sql, tuple(list(col) for col in zip(*sensor_rows)) if sensor_rows else ([], [], []))
+    changes += cur.rowcount
+
+    # jobs that got deleted on the server keep their data but aren't tracked anymore
+    sql = """DELETE FROM job_sensors as s 
+            WHERE NOT EXISTS (
+                SELECT 1 FROM unnest(%s::text[], %s::text[]) as m(job_name, sensor_name) 
+                WHERE m.job_name = s.job_name 
+                AND m.sensor_name = s.sensor_name)"""
+    cur.execute(sql, ([r[0] for r in sensor_rows], [r[1] for r in sensor_rows]))
+    changes += cur.rowcount
+    cur.execute("UPDATE jobs SET status = NULL WHERE status IS NOT NULL AND NOT (name = ANY(%s::text[]))", (names, ))
+    changes += cur.rowcount
+
+    # job tracker and heatmaps show jobs that haven't got data yet
+    if changes > 0:
+        bump_data_version(cur)
     conn.commit()
+    return True
 
 
-def check_for_new_data(session, conn, cur):
+def check_for_new_data(session, conn, cur, auth):
     # download metadata of all jobs
     response = session.get('http://127.0.0.1:8000/data/?just_metadata=1')
     # if download was successfull, write into df_data
@@ -94,26 +161,9 @@ def check_for_new_data(session, conn, cur):
     data = response.json()
     df_data = pd.json_normalize(data.get("data", []), max_level=0)
 
-    # download job data and write into df_jobs to get command
-    response = session.get("http://127.0.0.1:8000/fixedjobs/")
-    if response.status_code != 200:
-        print("Server error ", response.status_code)
+    # insert fixed jobs into DB.jobs to get command
+    if not mirror_fixed_jobs(session, conn, cur, auth):
         return None
-    data = response.json()
-    df_jobs = pd.json_normalize(data.get("data", []), max_level=0)
-    df_jobs = df_jobs.drop(columns=["arguments", "states"])
-
-    # insert df_jobs into DB.jobs
-    for i, r in df_jobs.iterrows():
-        name = r["name"]
-        cmd = r["command"]
-        start = r["start_time"]
-        end = r["end_time"]
-
-        sql = "INSERT INTO jobs (name, command, start_time, end_time) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING"
-        cur.execute(sql, (name, cmd, start, end))
-
-    conn.commit()
 
     # find all sensor_name, job_name combinations which are not in DB.sensor_job and append to jobs_to_add
     jobs_to_add = []
@@ -133,147 +183,158 @@ def check_for_new_data(session, conn, cur):
 def handle_new_data(session, conn, cur, auth, jobs_to_add):
     # get command for job_to_add and download file if command is some kind of sniffing
     for job_to_add in jobs_to_add:
-        id = job_to_add["id"]
-        sensor_name = job_to_add["sensor_name"]
-        job_name = job_to_add["job_name"]
+        if handle_job(session, conn, cur, auth, job_to_add):
+            # job is in the DB now, drop leftover tasks of the consumer for it
+            parse_queue.remove(conn, cur, job_to_add["id"])
+
+
+# handle a single uploaded file (download, parse, agg, save in DB)
+# returns False if the job couldn't be handled and should be retried later
+def handle_job(session, conn, cur, auth, job_to_add):
+    id = job_to_add["id"]
+    sensor_name = job_to_add["sensor_name"]
+    job_name = job_to_add["job_name"]
+
+    cur.execute("SELECT command FROM jobs WHERE name = %s", (job_name, ))
+    res = cur.fetchone()
+    print("Dashboard Parser: adding", job_name)
+    # skip jobs without command
+    if res is None:
+        print("No command found for job: " + job_name)
+        return False
+    command = res[0]
+
+    # if command is some kind of control, only insert into DB.sensor_job
+    if any(i in command for i in ["log", "config", "restart", "reset", "reboot", "status"]):
+        # add to DB.sensor_job
+        sql = ("""INSERT INTO sensor_job (sensor_name, job_name) 
+               VALUES (%s, %s) 
+               ON CONFLICT DO NOTHING""")
+        cur.execute(sql, (sensor_name, job_name))
+        conn.commit()
+        print("No relevant data to download for command", command)
+    # download and extract files for sniffing jobs
+    elif "sniff" in command:
+        uri = 'http://127.0.0.1:8000/data/download/' + id
+        response = session.get(uri)
+
+        # if token expired while running, login and download file again
+        if response.status_code == 401:
+            session.post('http://127.0.0.1:8000/login/userlogin', auth)
+            response = session.get(uri)
 
-        cur.execute("SELECT command FROM jobs WHERE name = %s", (job_name, ))
-        res = cur.fetchone()
-        print("Dashboard Parser: adding", job_name)
-        # skip jobs without command
-        if res is None:
-            print("No command found for job: " + job_name)
-            continue
-        command = res[0]
-
-        # if command is some kind of control, only insert into DB.sensor_job
-        if any(i in command for i in ["log", "config", "restart", "reset", "reboot", "status"]):
-            # add to DB.sensor_job
-            sql = ("""INSERT INTO sensor_job (sensor_name, job_name) 
-                   VALUES (%s, %s) 
-                   ON CONFLICT DO NOTHING""")
-            cur.execute(sql, (sensor_name, job_name))
+        # skip job if file couldn't be downloaded, so we can retry later
+        if response.status_code != 200:
+            print("Server error ", response.status_code)
+            return False
+
+        # fallback values
+        index = None
+        lat = None
+        lon = None
+        sample_rate = None
+        center_freq = None
+        bandwidth = None
+        gain = None
+        if_gain = None
+        bb_gain = None
+        decimation = None
+        try:
+            zip_path = Path(temp_path / 'temp.zip')
+            # write file into ./temp/temp.zip
+            with open(zip_path, 'wb') as file:
+                file.write(response.content)
+                file.close()
+
+            # extract all files into ./temp
+            with ZipFile(zip_path) as fileObject:
+                fileObject.extractall(temp_path)
+
+            # get coordinates out of endStatus file
+            status_file = Path(temp_path / str(job_name + "_endStatus.txt"))
+            if status_file.exists():
+                with open(status_file, "r") as output:
+                    data = output.readlines()
+                for line in data[:1]:
+                    loc = json.loads(line.replace("'", '"'))
+                    lat = loc['location_lat']
+                    lon = loc['location_lon']
+
+            # get configuration out of hackrf.conf file
+            conf_file = Path(temp_path/ "hackrf.conf")
+            if conf_file.exists():
+                with open(conf_file, "r") as output:
+                    data = output.readlines()
+                conf_list = []
+                for line in data:
+                    conf_list.append(line)
+                sample_rate = next((s for s in conf_list if "sample_rate" in s), "=0").split("=")[1]
+                center_freq = next((s for s in conf_list if "center_freq" in s), "=0").split("=")[1]
+                bandwidth = next((s for s in conf_list if "bandwidth" in s), "=0").split("=")[1]
+                gain = next((s for s in conf_list if "gain" in s), "=0").split("=")[1]
+                if_gain = next((s for s in conf_list if "if_gain" in s), "=0").split("=")[1]
+                bb_gain = next((s for s in conf_list if "bb_gain" in s), "=0").split("=")[1]
+                decimation = next((s for s in conf_list if "decimation" in s), "=0").split("=")[1]
+
+            # only add to DB.sensor_job if file could be downloaded, so we can retry later
+            sql = """INSERT INTO sensor_job (sensor_name, job_name, lat, lon, sample_rate, center_freq, bandwidth, 
+                  gain, if_gain, bb_gain, decimation) 
+                  VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) 
+                  ON CONFLICT (sensor_name, job_name) DO UPDATE SET  
+                  lat = EXCLUDED.lat, 
+                  lon = EXCLUDED.lon, 
+                  sample_rate = EXCLUDED.sample_rate, 
+                  center_freq = EXCLUDED.center_freq, 
+                  bandwidth = EXCLUDED.bandwidth, 
+                  gain = EXCLUDED.gain, 
+                  if_gain = EXCLUDED.if_gain, 
+                  bb_gain = EXCLUDED.bb_gain, 
+                  decimation = EXCLUDED.decimation 
+                  RETURNING id"""
+            cur.execute(sql, (sensor_name, job_name, lat, lon, sample_rate, center_freq, bandwidth,
+                  gain, if_gain, bb_gain, decimation))
+            # save returned id
+            index = cur.fetchone()[0]
+            # commit changes so the respective parser can insert
             conn.commit()
-            print("No relevant data to download for command", command)
-        # download and extract files for sniffing jobs
-        elif "sniff" in command:
-            uri = 'http://127.0.0.1:8000/data/download/' + id
-            response = session.get(uri)
 
-            # if token expired while running, login and download file again
-            if response.status_code == 401:
-                session.post('http://127.0.0.1:8000/login/userlogin', auth)
-                response = session.get(uri)
-
-            # skip job if file couldn't be downloaded, so we can retry later
-            if response.status_code != 200:
-                print("Server error ", response.status_code)
-                continue
-
-            # fallback values
-            index = None
-            lat = None
-            lon = None
-            sample_rate = None
-            center_freq = None
-            bandwidth = None
-            gain = None
-            if_gain = None
-            bb_gain = None
-            decimation = None
-            try:
-                zip_path = Path(temp_path / 'temp.zip')
-                # write file into ./temp/temp.zip
-                with open(zip_path, 'wb') as file:
-                    file.write(response.content)
-                    file.close()
-
-                # extract all files into ./temp
-                with ZipFile(zip_path) as fileObject:
-                    fileObject.extractall(temp_path)
-
-                # get coordinates out of endStatus file
-                status_file = Path(temp_path / str(job_name + "_endStatus.txt"))
-                if status_file.exists():
-                    with open(status_file, "r") as output:
-                        data = output.readlines()
-                    for line in data[:1]:
-                        loc = json.loads(line.replace("'", '"'))
-                        lat = loc['location_lat']
-                        lon = loc['location_lon']
-
-                # get configuration out of hackrf.conf file
-                conf_file = Path(temp_path/ "hackrf.conf")
-                if conf_file.exists():
-                    with open(conf_file, "r") as output:
-                        data = output.readlines()
-                    conf_list = []
-                    for line in data:
-                        conf_list.append(line)
-                    sample_rate = next((s for s in conf_list if "sample_rate" in s), "=0").split("=")[1]
-                    center_freq = next((s for s in conf_list if "center_freq" in s), "=0").split("=")[1]
-                    bandwidth = next((s for s in conf_list if "bandwidth" in s), "=0").split("=")[1]
-                    gain = next((s for s in conf_list if "gain" in s), "=0").split("=")[1]
-                    if_gain = next((s for s in conf_list if "if_gain" in s), "=0").split("=")[1]
-                    bb_gain = next((s for s in conf_list if "bb_gain" in s), "=0").split("=")[1]
-                    decimation = next((s for s in conf_list if "decimation" in s), "=0").split("=")[1]
-
-                # only add to DB.sensor_job if file could be downloaded, so we can retry later
-                sql = """INSERT INTO sensor_job (sensor_name, job_name, lat, lon, sample_rate, center_freq, bandwidth, 
-                      gain, if_gain, bb_gain, decimation) 
-                      VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) 
-                      ON CONFLICT (sensor_name, job_name) DO UPDATE SET  
-                      lat = EXCLUDED.lat, 
-                      lon = EXCLUDED.lon, 
-                      sample_rate = EXCLUDED.sample_rate, 
-                      center_freq = EXCLUDED.center_freq, 
-                      bandwidth = EXCLUDED.bandwidth, 
-                      gain = EXCLUDED.gain, 
-                      if_gain = EXCLUDED.if_gain, 
-                      bb_gain = EXCLUDED.bb_gain, 
-                      decimation = EXCLUDED.decimation 
-                      RETURNING id"""
-                cur.execute(sql, (sensor_name, job_name, lat, lon, sample_rate, center_freq, bandwidth,
-                      gain, if_gain, bb_gain, decimation))
-                # save returned id
-                index = cur.fetchone()[0]
-                # commit changes so the respective parser can insert
+            # start respective parser through subprocess, so data_deamon is blocked and doesn't download next files
+            if "iridium" in command:
+                #print("Iridium found")
+                #parser_iridium.start(index)
+                subprocess.run(["python3", "./app/dashboard/parser/parser_iridium.py", str(index)], check=True)
+            elif "globestar" in command:
+                # parser_globestar.start(index)
+                print("Globestar found")
+            elif "starlink" in command:
+                # parser_starlink.start(index)
+                print("Starlink found")
+            else:
+                print("Sniffing command " + command + " unknown")
+
+        # if exception occurred while handling files, delete from DB so we can retry later
+        except Exception as e:
+            if index is not None:
+                sql = "DELETE FROM packets WHERE id = %s"
+                cur.execute(sql, (index,))
+                sql = "DELETE FROM signal WHERE id = %s"
+                cur.execute(sql, (index,))
+                sql = "DELETE FROM stderr WHERE id = %s"
+                cur.execute(sql, (index,))
+                sql = "DELETE FROM sensor_job WHERE id = %s"
+                cur.execute(sql, (index,))
                 conn.commit()
-
-                # start respective parser through subprocess, so data_deamon is blocked and doesn't download next files
-                if "iridium" in command:
-                    #print("Iridium found")
-                    #parser_iridium.start(index)
-                    subprocess.run(["python3", "./app/dashboard/parser/parser_iridium.py", str(index)], check=True)
-                elif "globestar" in command:
-                    # parser_globestar.start(index)
-                    print("Globestar found")
-                elif "starlink" in command:
-                    # parser_starlink.start(index)
-                    print("Starlink found")
-                else:
-                    print("Sniffing command " + command + " unknown")
-
-            # if exception occurred while handling files, delete from DB so we can retry later
-            except Exception as e:
-                if index is not None:
-                    sql = "DELETE FROM packets WHERE id = %s"
-                    cur.execute(sql, (index,))
-                    sql = "DELETE FROM signal WHERE id = %s"
-                    cur.execute(sql, (index,))
-                    sql = "DELETE FROM stderr WHERE id = %s"
-                    cur.execute(sql, (index,))
-                    sql = "DELETE FROM sensor_job WHERE id = %s"
-                    cur.execute(sql, (index,))
-                print("Warning: An exception occurred while handling of files for job '" + job_name + "' with sensor '"
-                      + sensor_name + "': " + str(e) + "\n\t\t Skipping extraction...")
-            finally:
-                # remove all files in ./temp
-                for file in temp_path.iterdir():
-                    if file.is_file():
-                        file.unlink()
-        else:
-            print("Command " + command + " unknown")
+            print("Warning: An exception occurred while handling of files for job '" + job_name + "' with sensor '"
+                  + sensor_name + "': " + str(e) + "\n\t\t Skipping extraction...")
+            return False
+        finally:
+            # remove all files in ./temp
+            for file in temp_path.iterdir():
+                if file.is_file():
+                    file.unlink()
+    else:
+        print("Command " + command + " unknown")
+    return True
 
 
 def start():
@@ -293,7 +354,7 @@ def start():
         session.post('http://127.0.0.1:8000/login/userlogin', auth)
 
         # check if there are new jobs to add
-        jobs_to_add = check_for_new_data(session, conn, cur)
+        jobs_to_add = check_for_new_data(session, conn, cur, auth)
         # if there are, handle data (download, parse, agg, save in DB) and agg signal data for all jobs to display on
         # public page
         if jobs_to_add is not None:
@@ -305,17 +366,66 @@ def start():
     conn.close()
 
 
+# handle all tasks the server queued after uploads, so new data shows up within seconds instead of the next nightly run
+def consume(session, conn, cur, auth):
+    handled = False
+    task = parse_queue.claim(conn, cur)
+    while task is not None:
+        # job may already be in the DB if the nightly run was faster
+        cur.execute("SELECT id FROM sensor_job WHERE job_name = %s AND sensor_name = %s",
+                    (task["job_name"], task["sensor_name"]))
+        if cur.fetchone() is not None or handle_job(session, conn, cur, auth, task):
+            parse_queue.complete(conn, cur, task)
+            handled = True
+        else:
+            parse_queue.retry(conn, cur, task)
+        task = parse_queue.claim(conn, cur)
+
+    # update public page once for all handled tasks
+    if handled:
+        agg_all_data(conn, cur)
+
+
 def run():
+    # nightly run stays as reconciliation for uploads that couldn't be queued or failed too often
     schedule.every().day.at("00:00").do(start)
 
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    db_user, db_password, user, password = credentials.get()
+    auth = ' {"username":"' + user + '"' + ', "password":"' + password + '"}'
+    conn = None
+    cur = None
+    last_mirror = 0
+
+    with requests.sessions.Session() as session:
+        # login to server
+        session.post('http://127.0.0.1:8000/login/userlogin', auth)
+
+        while True:
+            schedule.run_pending()
+            try:
+                # (re)connect to postgres database if connection got lost
+                if conn is None or conn.closed:
+                    conn = parse_queue.connect()
+                    cur = conn.cursor()
+                    parse_queue.reset_running(conn, cur)
+                # keep status of fixed jobs up to date for the job tracker
+                if time.monotonic() - last_mirror >= mirror_interval:
+                    last_mirror = time.monotonic()
+                    mirror_fixed_jobs(session, conn, cur, auth)
+                consume(session, conn, cur, auth)
+            except ps.Error as e:
+                print("Warning: An exception occurred while consuming the parse queue: " + str(e))
+                if conn is not None:
+                    conn.close()
+                conn = None
+            except requests.RequestException as e:
+                print("Warning: Could not reach the server: " + str(e))
+            time.sleep(poll_interval)
 
 
 if __name__ == "__main__":
     # run once on server restart but wait for everything to initialize
     time.sleep(10)
     start()
-    # then run every day at midnight
+    # then handle uploads as they come in and run every day at midnight
     run()
@@ -0,0 +1,118 @@
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from pathlib import Path
+import app.dashboard.parser.frame_archive as frame_archive
+
+
+###
+# Constant definitions
+###
+
+# statistics of the extractor of every job are kept here as parquet, one row per second, partitioned by sensor and job
+# (health/sensor=<sensor_name>/job=<job_name>/health.parquet, names percent-encoded like the frame archive)
+health_path = Path(__file__).parent / "health"
+
+# once per second iridium-extractor writes a line like
+# 1713996050 | i: 123/s | i_avg: 101/s | q_max:    4 | i_ok:  52% | o:   64/s | ok:  48% | ok:  31/s | ok_avg:  50% |
+#   ok:      12345 | ok_avg:  30/s | d: 0
+# (label in the line, column name, unit), labels aren't unique so the fields are matched in this order
+stats_fields = [("i", "i", "/s"),  # bursts detected per second
+                ("i_avg", "i_avg", "/s"),  # average of bursts per second since start
+                ("q_max", "q_max", ""),  # longest burst queue since the last line
+                ("i_ok", "i_ok", "%"),  # percentage of bursts that were decoded into a frame
+                ("o", "o", "/s"),  # frames per second
+                ("ok", "ok_p", "%"),  # percentage of frames that are ok
+                ("ok", "ok_s", "/s"),  # ok frames per second
+                ("ok_avg", "ok_avg_p", "%"),  # average percentage of ok frames since start
+                ("ok", "ok", ""),  # ok frames since start
+                ("ok_avg", "ok_avg", "/s"),  # average of ok frames per second since start
+                ("d", "d", "")]  # bursts dropped since start because the queue was full
+# lines sometimes start with O's (overflows of the SDR), d is missing in older versions of the extractor
+stats_pattern = r'^O*(?P<time>\d+(?:\.\d+)?)' + ''.join(
+    rf' *\| {label}: *(?P<{name}>\d+(?:\.\d+)?){unit}' for label, name, unit in stats_fields[:-1]) + \
+    r'(?: *\| d: *(?P<d>\d+))?'
+stats_cols = [name for label, name, unit in stats_fields]
+
+# bursts the extractor queues before it drops new ones (--queuelen of iridium-extractor)
+queue_len = 500
+# a second in which more bursts get dropped or the queue is fuller than this, the sensor can't keep up
+max_drop_rate = 0.01
+max_queue_saturation = 0.9
+
+# types of the stored columns, all rates are small integers
+health_dtypes = dict({'time': 'float64'}, **{col: 'int32' for col in stats_cols},
+                     **{'drops': 'int32', 'drop_rate': 'float32', 'queue_saturation': 'float32', 'behind': 'bool'})
+
+
+###
+# Function definitions
+###
+
+# returns dataframe with one row per second and all fields of the statistic lines in the stderr of the extractor,
+# lines of gr-osmosdr etc. are skipped, lines that start like statistics but don't match are reported
+def read_stats(stderr_path):
+    with open(stderr_path, "r", errors="replace") as output:
+        lines = pa.array(output.read().splitlines(), type=pa.string())
+
+    fields = pc.extract_regex(lines, stats_pattern)
+    matched = pc.is_valid(fields)
+    rejects = pc.sum(pc.and_(pc.invert(matched), pc.match_substring_regex(lines, r'^O*\d+(?:\.\d+)? *\|'))).as_py()
+    if rejects:
+        print(f"Warning: Skipped {rejects} statistic lines while parsing {str(stderr_path.name)} that don't match the "
+              f"format of the extractor")
+
+    fields = fields.filter(matched)
+    df = pd.DataFrame({"time": pc.cast(pc.struct_field(fields, ["time"]), pa.float64()).to_numpy()})
+    for col in stats_cols:
+        values = pc.struct_field(fields, [col])
+        # empty if the optional field is missing
+        values = pc.if_else(pc.equal(values, ""), "0", values)
+        df[col] = pc.cast(pc.cast(values, pa.float64()), pa.int64()).to_numpy()
+
+    # the extractor writes one line per second, keep the last one if a second occurs more than once
+    df = df.drop_duplicates(subset="time", keep="last").sort_values(by="time").reset_index(drop=True)
+    return add_indicators(df)
+
+
+# adds the columns drops (bursts dropped since the previous line), drop_rate (part of the bursts of the second that got
+# dropped), queue_saturation (longest queue relative to queue_len) and behind (the extractor can't keep up)
+def add_indicators(df):
+    d = df['d'].to_numpy(dtype=np.int64)
+    # d counts since the start of the extractor, it starts at 0 again if the extractor got restarted
+    drops = np.diff(d, prepend=0)
+    drops = np.where(drops < 0, d, drops)
+    bursts = df['i'].to_numpy(dtype=float) + drops
+    df['drops'] = drops
+    df['drop_rate'] = np.divide(drops, bursts, out=np.zeros(len(df)), where=bursts > 0)
+    df['queue_saturation'] = np.minimum(df['q_max'].to_numpy(dtype=float) / queue_len, 1.0)
+    df['behind'] = (df['drop_rate'] > max_drop_rate) | (df['queue_saturation'] > max_queue_saturation)
+    return df.astype(dtype=health_dtypes)
+
+
+# write statistics of the extractor of a job (see read_stats), replaces older data of the job
+def write_health(df, sensor_name, job_name):
+    path = frame_archive.partition_path(health_path, sensor_name, job_name)
+    path.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path / "health.parquet", index=False, compression="zstd")
+    return path
+
+
+# read statistics of the extractor as dataframe, sensor_name and job_name are optional filters
+def read_health(sensor_name=None, job_name=None, columns=None):
+    if not health_path.exists():
+        return pd.DataFrame(columns=columns or list(health_dtypes.keys()))
+
+    # partition values are always strings, otherwise a sensor named "123" would become an int
+    partitioning = ds.partitioning(pa.schema([("sensor", pa.string()), ("job", pa.string())]), flavor="hive")
+    dataset = ds.dataset(health_path, format="parquet", partitioning=partitioning)
+
+    expression = None
+    if sensor_name is not None:
+        expression = ds.field("sensor") == sensor_name
+    if job_name is not None:
+        f = ds.field("job") == job_name
+        expression = f if expression is None else expression & f
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
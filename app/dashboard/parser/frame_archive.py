@@ -0,0 +1,77 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pathlib import Path
+from urllib.parse import quote
+
+
+###
+# Constant definitions
+###
+
+# every decoded frame of every job is kept here as parquet, partitioned by sensor and job
+# (archive/sensor=<sensor_name>/job=<job_name>/frames.parquet, names percent-encoded)
+archive_path = Path(__file__).parent / "archive"
+# frames are sorted by time, so the statistics of a row group let readers skip everything outside a time range
+row_group_size = 64 * 1024
+
+# types of the archived columns, sat_id and beam_id are only available for some frame types
+archive_dtypes = {'time': 'float64', 'frame_type': 'category', 'frequency': 'Int64', 'confidence': 'Int16',
+                  'signal_level': 'float32', 'background_noise': 'float32', 'snr': 'float32', 'sat_id': 'Int16',
+                  'beam_id': 'Int16'}
+
+
+###
+# Function definitions
+###
+
+# returns folder of the partition of sensor_name and job_name below root, the names are percent-encoded so "/", "="
+# or ".." can't write outside or across partitions (pyarrow decodes them again when reading the hive partitions)
+def partition_path(root, sensor_name, job_name):
+    return root / f"sensor={quote(str(sensor_name), safe='')}" / f"job={quote(str(job_name), safe='')}"
+
+
+# write dataframe or list of dicts of frames (see parser_iridium.read_parsed_output) into the archive, replaces older
+# data of the job
+def write_frames(frames, sensor_name, job_name):
+    df = pd.DataFrame(data=frames, columns=list(archive_dtypes.keys()))
+    df = df.astype(dtype=archive_dtypes)
+    df = df.sort_values(by="time").reset_index(drop=True)
+
+    path = partition_path(archive_path, sensor_name, job_name)
+    path.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path / "frames.parquet", index=False, compression="zstd", row_group_size=row_group_size)
+    return path
+
+
+# returns a pyarrow dataset over the whole archive, sensor and job are available as columns
+def dataset():
+    # partition values are always strings, otherwise a sensor named "123" would become an int
+    partitioning = ds.partitioning(pa.schema([("sensor", pa.string()), ("job", pa.string())]), flavor="hive")
+    return ds.dataset(archive_path, format="parquet", partitioning=partitioning)
+
+
+# read frames from the archive as dataframe, only the requested columns and the row groups that can contain matching
+# frames are read
+# every filter is optional, time_lower & time_upper are unix timestamps in seconds
+def read_frames(sensor_name=None, job_name=None, columns=None, time_lower=None, time_upper=None, frame_types=None):
+    if not archive_path.exists():
+        return pd.DataFrame(columns=columns or list(archive_dtypes.keys()))
+
+    filters = []
+    if sensor_name is not None:
+        filters.append(ds.field("sensor") == sensor_name)
+    if job_name is not None:
+        filters.append(ds.field("job") == job_name)
+    if time_lower is not None:
+        filters.append(ds.field("time") >= time_lower)
+    if time_upper is not None:
+        filters.append(ds.field("time") <= time_upper)
+    if frame_types is not None:
+        filters.append(ds.field("frame_type").isin(frame_types))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+
+    return dataset().to_table(columns=columns, filter=expression).to_pandas()
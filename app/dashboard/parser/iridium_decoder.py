@@ -0,0 +1,151 @@
+import os
+import sys
+import types
+import argparse
+import itertools
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import app.dashboard.parser.frame_archive as frame_archive
+
+
+###
+# Constant definitions
+###
+
+server_path = Path(__file__).parent.parent.parent.parent
+# iridium-toolkit gets cloned into tools/ (see README), fall back to the copy in the repository
+toolkit_path = server_path / "tools/iridium-toolkit"
+if not toolkit_path.exists():
+    toolkit_path = server_path / "iridium-toolkit-master"
+# bitsparser imports the other modules of the toolkit without package name
+if str(toolkit_path) not in sys.path:
+    sys.path.insert(0, str(toolkit_path))
+import bitsparser
+
+# number of lines of a .bits file that one worker decodes at once
+shard_lines = 20000
+# files with less lines get decoded in the calling process, starting the workers takes longer than decoding them
+min_pool_lines = 2 * shard_lines
+
+# decoded frames have the columns of the frame archive
+columns = list(frame_archive.archive_dtypes.keys())
+int_cols = ['frequency', 'confidence', 'sat_id', 'beam_id']
+
+# same options as `iridium-parser.py -p`, frames that needed error correction are dropped
+options = argparse.Namespace(perfect=True, errorfree=False, uwec=False, harder=False, freqclass=True,
+                             forcetype=None, channelize=False, errorfile=None,
+                             linefilter={'type': 'All', 'attr': None, 'check': None})
+bitsparser.set_opts(options)
+
+# bitsparser reads the number of the current line from fileinput, which only works inside of fileinput.input()
+# the lines are counted by decode_shard instead
+current_line = 0
+bitsparser.fileinput = types.SimpleNamespace(lineno=lambda: current_line)
+
+
+###
+# Function definitions
+###
+
+# decodes one line of a .bits file, returns the upgraded bitsparser message or None if the frame couldn't be decoded
+# without errors
+def decode_line(line):
+    q = bitsparser.Message(line.strip()).upgrade()
+    if q.error or q.__dict__.get("fixederrs", 0) > 0:
+        return None
+    q.descramble_extra = ""
+    return q
+
+
+# returns the frame of a decoded message as tuple with the values of columns or None if the extractor didn't measure
+# noise and snr of the frame
+def to_record(q):
+    if "snr" not in q.__dict__:
+        return None
+    # the type is only part of the text output, every frame class writes it in front of the header
+    frame_type = q.pretty().partition(":")[0]
+
+    sat_id = beam_id = None
+    if isinstance(q, bitsparser.IridiumRAMessage):
+        sat_id, beam_id = q.ra_sat, q.ra_cell
+    elif isinstance(q, bitsparser.IridiumBCMessage) and q.bc_type == 0:
+        sat_id = q.sv_id
+    return (q.globalns / 10**9, frame_type, q.frequency, q.confidence, q.leveldb, q.noise, q.snr, sat_id,
+            beam_id)
+
+
+# decodes num_lines lines of path starting at byte offset, first_line is the line number of the first line
+# returns (list of records, number of skipped frames) or (list of lines like the output of iridium-parser.py, 0)
+def decode_shard(path, offset, first_line, num_lines, pretty=False):
+    global current_line
+    results = []
+    skipped = 0
+    with open(path, "rb") as file:
+        file.seek(offset)
+        for current_line, line in enumerate(itertools.islice(file, num_lines), start=first_line):
+            q = decode_line(line.decode("utf-8", errors="replace"))
+            if q is None:
+                continue
+            if pretty:
+                results.append(q.pretty())
+                continue
+            record = to_record(q)
+            if record is None:
+                skipped += 1
+            else:
+                results.append(record)
+    return results, skipped
+
+
+# splits path into ranges of shard_lines lines, returns list of (path, byte offset, first line number, number of lines)
+def find_shards(path):
+    shards = []
+    offset = 0
+    num_lines = 0
+    with open(path, "rb") as file:
+        for line in file:
+            if num_lines % shard_lines == 0:
+                shards.append((path, offset, num_lines + 1, shard_lines))
+            offset += len(line)
+            num_lines += 1
+    return shards
+
+
+# yields (path, results, skipped) of every shard of every path in order, large files are decoded by a pool of
+# processes (one per core if processes is None)
+def decode_shards(paths, pretty=False, processes=None):
+    shards = [shard for path in paths for shard in find_shards(Path(path))]
+    if len(shards) * shard_lines < min_pool_lines or processes == 1:
+        for shard in shards:
+            yield shard[0], *decode_shard(*shard, pretty)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as pool:
+        futures = [pool.submit(decode_shard, *shard, pretty) for shard in shards]
+        for shard, future in zip(shards, futures):
+            yield shard[0], *future.result()
+
+
+# returns dataframe with the columns of the frame archive of all frames of all .bits files in paths
+def decode_files(paths, processes=None):
+    records = []
+    skipped = {}
+    for path, results, skipped_frames in decode_shards(paths, processes=processes):
+        records.extend(results)
+        skipped[path] = skipped.get(path, 0) + skipped_frames
+
+    for path, skipped_frames in skipped.items():
+        if skipped_frames > 0:
+            print(f"Warning: Skipped {skipped_frames} frames of {path.name} without noise and snr")
+
+    frames = pd.DataFrame(records, columns=columns)
+    return frames.astype({col: "Int64" for col in int_cols})
+
+
+# writes the frames of all .bits files in paths into out_path in the format of `iridium-parser.py -p`
+def write_parsed(paths, out_path, processes=None):
+    with open(out_path, "w") as output:
+        for path, lines, skipped_frames in decode_shards(paths, pretty=True, processes=processes):
+            for line in lines:
+                output.write(line + "\n")
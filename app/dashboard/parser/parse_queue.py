@@ -0,0 +1,99 @@
+import psycopg2 as ps
+import app.dashboard.credentials as credentials
+
+
+###
+# Constant definitions
+###
+
+# number of attempts after which a task is marked as failed and left for the nightly reconciliation run
+max_attempts = 5
+# seconds a failed task waits before it can be claimed again
+retry_delay = 60
+
+
+###
+# Function definitions
+###
+
+def connect():
+    db_user, db_password, user, password = credentials.get()
+    # Connect to postgres database
+    return ps.connect(database="postgres",
+                      user=db_user,
+                      host="localhost",
+                      password=db_password,
+                      port=5432)
+
+
+# add a parse task for an uploaded file, job is the fixed job dict from the server (if known) so the job row exists
+# before the consumer picks up the task
+def enqueue(conn, cur, data_id, sensor_name, job_name, job=None):
+    if job is not None:
+        cur.execute("""INSERT INTO jobs (name, command, start_time, end_time)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT DO NOTHING""",
+                    (job_name, job.get("command"), job.get("start_time"), job.get("end_time")))
+    cur.execute("""INSERT INTO parse_queue (data_id, sensor_name, job_name)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (data_id) DO NOTHING""", (data_id, sensor_name, job_name))
+    conn.commit()
+
+
+# called by the server after an upload was finalized, never raises so a missing dashboard DB doesn't break uploads
+# (the nightly run of the data_daemon picks up everything that couldn't be queued)
+def enqueue_upload(data_id, sensor_name, job_name, job=None):
+    try:
+        conn = connect()
+        try:
+            enqueue(conn, conn.cursor(), data_id, sensor_name, job_name, job)
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"Warning: Could not queue parse task for '{job_name}' with sensor '{sensor_name}': {str(e)}")
+
+
+# claim the oldest pending task, SKIP LOCKED lets multiple consumers run without handing out a task twice
+# returns dict with task data or None if queue is empty
+def claim(conn, cur):
+    cur.execute("""UPDATE parse_queue
+                SET status = 'running', attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM parse_queue
+                    WHERE status = 'pending'
+                    AND available_at <= now()
+                    ORDER BY id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1)
+                RETURNING id, data_id, sensor_name, job_name, attempts""")
+    row = cur.fetchone()
+    conn.commit()
+    if row is None:
+        return None
+    return dict(zip(["task_id", "id", "sensor_name", "job_name", "attempts"], row))
+
+
+def complete(conn, cur, task):
+    cur.execute("DELETE FROM parse_queue WHERE id = %s", (task["task_id"], ))
+    conn.commit()
+
+
+# put task back into the queue with a delay, give up after max_attempts
+def retry(conn, cur, task):
+    status = "failed" if task["attempts"] >= max_attempts else "pending"
+    cur.execute("""UPDATE parse_queue
+                SET status = %s, available_at = now() + make_interval(secs => %s)
+                WHERE id = %s""", (status, retry_delay, task["task_id"]))
+    conn.commit()
+
+
+# tasks that are still running when the consumer starts were interrupted (e.g. server restart), queue them again
+def reset_running(conn, cur):
+    cur.execute("UPDATE parse_queue SET status = 'pending' WHERE status = 'running'")
+    conn.commit()
+
+
+# failed tasks are removed once the nightly run handled the job
+def remove(conn, cur, data_id):
+    cur.execute("DELETE FROM parse_queue WHERE data_id = %s", (data_id, ))
+    conn.commit()
@@ -2,10 +2,15 @@ import sys
 import math
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as csv
+import pyarrow.compute as pc
 import psycopg2 as ps
 from pathlib import Path
-import subprocess
 import app.dashboard.credentials as credentials
+import app.dashboard.parser.frame_archive as frame_archive
+import app.dashboard.parser.iridium_decoder as iridium_decoder
+import app.dashboard.parser.extractor_health as extractor_health
 
 
 ###
@@ -17,10 +22,21 @@ num_datapoints = 100
 # path to temp folder, assume script gets run by data_deamon which is run in root folder
 temp_path = Path("./app/dashboard/parser/temp")
 
-current_path = Path(__file__)
-server_path = current_path.parent.parent.parent.parent
-python_path = server_path / "env/bin/python"
-iridium_parser_path = server_path / "tools/iridium-toolkit/iridium-parser.py"
+# number of bytes of a .parsed file that get tokenized at once
+chunk_size = 16 * 1024 * 1024
+
+# a decoded frame starts with whitespace separated columns, e.g.
+# IRA: p-1713996046-e000 000001278.7213 1626270080  95% -68.40|-117.34|18.59 120 DL sat:016 beam:37 ...
+# the recording name may end with the error count of the extractor (-e000), the frequency has the format
+# subband.access|offset if the extractor channelizes, satellite and spot beam are only part of some frame types
+# a line is only a valid frame if each of the leading columns matches its pattern
+number = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+column_patterns = [r'^[^:]+:$',  # frame type
+                   r'^p-\d+(?:-e\d+)?$',  # timestamp of recording start
+                   '^' + number + '$',  # ms since recording start
+                   r'.',  # frequency
+                   r'^\d+%$',  # confidence
+                   '^' + number + r'\|' + number + r'\|' + number + '$']  # level|noise|snr
 
 db_user, db_password, user, password = credentials.get()
 
@@ -36,178 +52,132 @@ def count_attribute(dataframe, attribute):
     return dataframe
 
 
-def run_external_parser(temp_path):
-    # run iridium-toolkit/iridium-parser.py on every .bits file
-    for file in temp_path.glob("*.bits"):
-        print('Started iridium-parser for', file.name)
-        subprocess.run([
-            python_path, iridium_parser_path, "-p", str(file.name)
-        ], cwd=temp_path)
-        print('Iridium-parser finished for', file.name)
+# tokenize the lines of a record batch, returns dataframe with one typed row per frame and the number of rejected lines
+# every step works on whole columns, so no python code runs per line
+def parse_lines(lines):
+    num_lines = len(lines)
+    # split off the leading columns, the rest of the line stays in the last element
+    parts = pc.ascii_split_whitespace(lines, max_splits=len(column_patterns))
+    valid = pc.greater_equal(pc.list_value_length(parts), len(column_patterns))
+    lines = lines.filter(valid)
+    parts = parts.filter(valid)
+
+    columns = [pc.list_element(parts, i) for i in range(len(column_patterns))]
+    matches = pc.match_substring_regex(columns[0], column_patterns[0])
+    for column, pattern in zip(columns[1:], column_patterns[1:]):
+        matches = pc.and_(matches, pc.match_substring_regex(column, pattern))
+    lines = lines.filter(matches)
+    frame_type, timestamp, time_in_rec, frequency, confidence, signal_vars = [c.filter(matches) for c in columns]
+    rejects = num_lines - len(lines)
+
+    # recording start without p- and error count
+    timestamp = pc.cast(pc.replace_substring_regex(timestamp, r'^p-(\d+).*$', r'\1'), pa.int64())
+    time_in_rec = pc.cast(time_in_rec, pa.float64())
+    signal_vars = pc.split_pattern(signal_vars, '|')
+
+    # satellite and spot beam only if the line contains them
+    sat_id = pc.struct_field(pc.extract_regex(lines, r'[ \t]sat:(?P<sat_id>\d+)'), [0])
+    beam_id = pc.struct_field(pc.extract_regex(lines, r'[ \t]beam:(?P<beam_id>\d+)'), [0])
+
+    table = pa.table({
+        "time": pc.add(pc.cast(timestamp, pa.float64()), pc.divide(time_in_rec, 1000.0)),
+        "frame_type": pc.utf8_rtrim(frame_type, ':'),
+        "frequency": pc.cast(pc.if_else(pc.match_substring_regex(frequency, r'^\d+$'), frequency, None), pa.int64()),
+        "confidence": pc.cast(pc.utf8_rtrim(confidence, '%'), pa.int64()),
+        "signal_level": pc.cast(pc.list_element(signal_vars, 0), pa.float64()),
+        "background_noise": pc.cast(pc.list_element(signal_vars, 1), pa.float64()),
+        "snr": pc.cast(pc.list_element(signal_vars, 2), pa.float64()),
+        "sat_id": pc.cast(sat_id, pa.int64()),
+        "beam_id": pc.cast(beam_id, pa.int64())})
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get), rejects
+
+
+# .parsed files are written by iridium-parser.py or iridium_decoder.write_parsed, the dashboard decodes the .bits
+# files directly (see iridium_decoder.decode_files)
+# yields dataframes of the frames of every chunk_size bytes of every .parsed file, lines that are no valid frames are
+# skipped and reported once per file
+def read_parsed_batches(temp_path):
+    for file in temp_path.glob("*.parsed"):
+        rejects = 0
+
+        # lines that contain the delimiter have more than one column
+        def skip_row(row):
+            nonlocal rejects
+            rejects += 1
+            return 'skip'
+
+        # read every line as a single string column, delimiter and quotes don't occur in the output of the parser
+        reader = csv.open_csv(file,
+                              read_options=csv.ReadOptions(column_names=["line"], block_size=chunk_size),
+                              parse_options=csv.ParseOptions(delimiter='\x1f', quote_char=False, escape_char=False,
+                                                             invalid_row_handler=skip_row),
+                              convert_options=csv.ConvertOptions(column_types={"line": pa.string()}))
+        for batch in reader:
+            df, rejected = parse_lines(batch.column(0))
+            rejects += rejected
+            if len(df) != 0:
+                yield df
+
+        if rejects > 0:
+            print(f"Warning: Skipped {rejects} lines while parsing {str(file.name)} that are no valid frames")
+
+
+# returns dataframe of all frames of all .parsed files and lowest and highest timestamp
+def read_parsed_output(temp_path):
+    batches = list(read_parsed_batches(temp_path))
+    if len(batches) == 0:
+        return pd.DataFrame(columns=list(frame_archive.archive_dtypes.keys())), math.inf, 0.0
 
+    frames = pd.concat(batches, ignore_index=True)
+    return frames, frames["time"].min(), frames["time"].max()
 
-def read_parsed_output(temp_path):
-    time_lower = math.inf
-    time_upper = 0.0
-    frames = []
-    for file in temp_path.glob("*.parsed"):
-        # turn every line of input file to string[]
-        with open(file, "r") as output:
-            data = output.readlines()
 
-        # add every line into frames[]
-        for line in data:
-            try:
-                # convert current line string to list
-                currLine = line.split()
-
-                # extract all relevant values out of line
-                frame_type = currLine[0].split(':')[0]
-                timestamp = currLine[1].split('p-')[1]
-                time_in_rec = currLine[2]
-                #frequency = currLine[3]
-                #confidence = currLine[4].rstrip("%")
-                signal_vars = currLine[5].split('|')
-                signal_level = signal_vars[0]
-                background_noise = signal_vars[1]
-                snr = signal_vars[2]
-
-                # store upper and lower bound of time
-                time = int(timestamp) + (float(time_in_rec) / 1000)
-                if float(time) <= time_lower:
-                    time_lower = float(time)
-                if float(time) >= time_upper:
-                    time_upper = float(time)
-
-                # add all rows into list first
-                frames.append({"time": time, "frame_type": frame_type, "signal_level": signal_level,
-                               "background_noise": background_noise, "snr": snr})
-            except Exception as e:
-                print(f"Warning: An exception occurred in line: {line} \t\t while parsing {str(file.name)}: "
-                      f"{str(e)} \n\t\t Skipping line...")
-                continue
-    return frames, time_lower, time_upper
-
-
-def read_stderr(stderr_path):
-    # Turns every line of input file to string[]
-    with open(stderr_path, "r") as output:
-        data = output.readlines()
-
-    time_lower = math.inf
-    time_upper = 0.0
-    stderr = []
-
-    # add data for every line into stderr[]
-    for line in data:
-        try:
-            # convert current line string to list
-            currLine = line.split(' | ')
-            firstElem = currLine[0].split()[0].lstrip("O")
-            if firstElem not in ('gr-osmosdr', 'built-in', 'Using', '(RF)', 'IF', 'BB', 'Bandwidth:', 'Warning:',
-                                 'WARNING:', 'Done.', 'Detector', 'Resetting'):
-                # extract all relevant values out of line
-                time = float(currLine[0].lstrip("O"))  # remove leading O's that appear sometimes
-
-                # save lowest and highest timestamps
-                if time <= time_lower:
-                    time_lower = time
-                if time >= time_upper:
-                    time_upper = time
-
-                # for data like 'name: value%' strip 'name:' and '%' and store 'value'
-                i = currLine[1].split()[1].split('/')[0]
-                # i_avg = currLine[2].split()[1].split('/')[0]
-                # q_max = currLine[3].split()[1]
-                # i_ok_p = currLine[4].split()[1].split('%')[0]
-                o = currLine[5].split()[1].split('/')[0]
-                # ok_p = currLine[6].split()[1].split('%')[0]
-                ok_s = currLine[7].split()[1].split('/')[0]
-                # ok_avg_p = currLine[8].split()[1].split('%')[0]
-                ok = currLine[9].split()[1]
-                # ok_avg = currLine[10].split()[1].split('/')[0]
-                # d = currLine[11].split()[1]select * from sensor_job as j where j.sensor_name = 'Sim';
-
-                stderr.append({"time": time, "i": i, "o": o, "ok_s": ok_s, "ok": ok, })
-        except Exception as e:
-            print(f"Warning: An exception occurred in line: {line} \t\t while parsing {str(stderr_path.name)}: "
-                  f"{str(e)} \n\t\t Skipping line...")
-    return stderr, time_lower, time_upper
-
-
-def fill_df(data, dtype):
-    # fill dataframe with list, set types and sort by time
-    df = pd.DataFrame(data=data)
-    df = df.astype(dtype=dtype)
-    df = df.sort_values(by="time").reset_index()
-    return df
-
-
-# aggregates a list of dicts into a dataframe with num_datapoints many equally spaced timeslots between time_lower &
-# time_upper
+# aggregates a dataframe or a list of dicts into a dataframe with num_datapoints many equally spaced timeslots between
+# time_lower & time_upper
 # keys to aggregate are in agg_cols
 # if key max_cols is provided, these columns will not be aggregated but every slot is the max value
 # if sum_cols is provided these columns are summed up
 # if min_col provided these columns are min value
-def agg_to_df(list, num_datapoints, time_lower, time_upper, agg_cols, max_cols=None, sum_cols=None, min_cols=None):
+def agg_to_df(data, num_datapoints, time_lower, time_upper, agg_cols, max_cols=None, sum_cols=None, min_cols=None):
+    max_cols = max_cols or []
+    sum_cols = sum_cols or []
+    min_cols = min_cols or []
+    data = pd.DataFrame(data)
+
     # slice timeframe of recording into 100 equally spaced timeslots
     interval = np.linspace(time_lower, time_upper, num=num_datapoints, dtype=float)
     # number of seconds in one timeslot
     secs = (time_upper - time_lower) / num_datapoints
-    zero_array = np.zeros(len(interval), dtype=float)
+
+    # calculate the slot of every item, bound the slot between 0 and num_datapoints - 1 to prevent index out of bounds
+    # error because of floating-point rounding
+    times = data['time'].to_numpy(dtype=float)
+    if secs > 0:
+        slots = ((times - time_lower) / secs).astype(int)
+    else:
+        slots = np.zeros(len(times), dtype=int)
+    slots = np.clip(slots, 0, num_datapoints - 1)
+
     # add time and count column for plotting and calculating the avg
-    columns = agg_cols.copy()
-    columns.append('time')
-    columns.append('count')
-    # fill time with interval, every other column with zeros
-    d = {'time': interval, 'count': zero_array}
-    for col in agg_cols:
-        d[col] = zero_array
-    if max_cols is not None:
-        for col in max_cols:
-            d[col] = zero_array
-            columns.append(col)
-    if sum_cols is not None:
-        for col in sum_cols:
-            d[col] = zero_array
-            columns.append(col)
-    if min_cols is not None:
-        for col in min_cols:
-            d[col] = zero_array
-            columns.append(col)
-    df = pd.DataFrame(columns=columns, data=d)
-
-    # for every item: calculate the slot, increment the count and update value according to aggregation function
-    for l in list:
-        secs_in_rec = l['time'] - time_lower
-        slot = int(secs_in_rec / secs)
-        # bound the slot between 0 and num_datapoints - 1 to prevent index out of bounds error because of
-        # floating-point rounding
-        slot = max(0, min(slot, num_datapoints - 1))
-        # increment count for slot
-        df.loc[slot, 'count'] += 1
-        # add up all values in a slot for all cols in agg_col
-        for col in agg_cols:
-            df.loc[slot, col] += float(l[col])
-        # if max_col is provided, save max value in max_col
-        if max_cols is not None:
-            for col in max_cols:
-                #df.loc[slot, col] = max(df.loc[slot, col], float(l[col]))
-                df.loc[slot, col] = np.maximum(df.loc[slot, col], float(l[col]))
-        # if sum_col is provided, save sum of value in sum_col
-        if sum_cols is not None:
-            for col in sum_cols:
-                df.loc[slot, col] += float(l[col])
-        # if min_col is provided, save min of value in min_col
-        if min_cols is not None:
-            for col in min_cols:
-                #df.loc[slot, col] = min(df.loc[slot, col], float(l[col]))
-                df.loc[slot, col] = np.minimum(df.loc[slot, col], float(l[col]))
+    df = pd.DataFrame({'time': interval, 'count': np.bincount(slots, minlength=num_datapoints).astype(float)})
+    # add up all values in a slot for all cols in agg_col and sum_cols
+    for col in agg_cols + sum_cols:
+        df[col] = np.bincount(slots, weights=data[col].to_numpy(dtype=float), minlength=num_datapoints)
+    # max and min of the slots start at zero
+    for col in max_cols:
+        values = np.zeros(num_datapoints, dtype=float)
+        np.maximum.at(values, slots, data[col].to_numpy(dtype=float))
+        df[col] = values
+    for col in min_cols:
+        values = np.zeros(num_datapoints, dtype=float)
+        np.minimum.at(values, slots, data[col].to_numpy(dtype=float))
+        df[col] = values
+
     # divide all agg_cols by the package count of the respective timeslot, count column can be used for running_sum
     for col in agg_cols:
         df[col] = np.ceil(df[col] / df['count'])
 
-    return df
+    return df[agg_cols + ['time', 'count'] + max_cols + sum_cols + min_cols]
 
 
 def start(index):
@@ -220,22 +190,31 @@ def start(index):
     cur = conn.cursor()
     print("parser_iridium called")
 
+    cur.execute("SELECT sensor_name, job_name FROM sensor_job WHERE id = %s", (index, ))
+    sensor_name, job_name = cur.fetchone()
+
     ###
     # aggregate output.bits files and add to DB.signal, DB.packets
     ###
 
     # if any file with .bits ending exists
     if any(temp_path.glob("*.bits")):
-        run_external_parser(temp_path)
-        frames, time_lower, time_upper = read_parsed_output(temp_path)
+        bits_files = sorted(temp_path.glob("*.bits"))
+        print('Started decoding', ', '.join(file.name for file in bits_files))
+        frames = iridium_decoder.decode_files(bits_files)
+        print('Finished decoding', len(frames), 'frames')
 
         if len(frames) != 0:
-            type_dict = {'time': float, 'frame_type': str, 'signal_level': float, 'background_noise': float,
-                         'snr': float}
-            df_frames = fill_df(frames, type_dict)
+            time_lower, time_upper = frames["time"].min(), frames["time"].max()
+            # keep every decoded frame, the .bits files get deleted after the job is handled
+            try:
+                frame_archive.write_frames(frames, sensor_name, job_name)
+                print("Finished writing frame archive")
+            except Exception as e:
+                print(f"Warning: An exception occurred while writing the frame archive: {str(e)}")
 
             # add Packet Type and Count into DB.packets
-            df_packet_count = count_attribute(df_frames, 'frame_type')
+            df_packet_count = count_attribute(frames[['time', 'frame_type']], 'frame_type')
 
             for i, r in df_packet_count.iterrows():
                 cur.execute("""INSERT INTO packets (id, type, count) 
@@ -274,22 +253,39 @@ def start(index):
     stderr_path = Path(temp_path / "output.stderr")
 
     if stderr_path.exists():
-        stderr, time_lower, time_upper = read_stderr(stderr_path)
+        stats = extractor_health.read_stats(stderr_path)
+
+        if len(stats) != 0:
+            # keep the statistics of every second, the DB only gets num_datapoints slots for the plots
+            try:
+                extractor_health.write_health(stats, sensor_name, job_name)
+                print("Finished writing extractor health")
+            except Exception as e:
+                print(f"Warning: An exception occurred while writing the extractor health: {str(e)}")
 
-        if len(stderr) != 0:
+            time_lower, time_upper = stats["time"].min(), stats["time"].max()
             cols = ["i", "o", "ok_s"]
-            df_stderr_agg = agg_to_df(stderr, num_datapoints, time_lower, time_upper, cols, ["ok"])
+            df_stderr_agg = agg_to_df(stats, num_datapoints, time_lower, time_upper, cols,
+                                      ["ok", "q_max", "drop_rate", "queue_saturation"], ["drops"])
+            # slots without statistics (e.g. the extractor got restarted) aren't stored
+            df_stderr_agg = df_stderr_agg[df_stderr_agg['count'] > 0]
 
             # insert dataframe into DB.stderr
             for i, r in df_stderr_agg.iterrows():
-                cur.execute("""INSERT INTO stderr (id, timestamp, i, o, ok_s, ok)
-                                        VALUES (%s, %s, %s, %s, %s, %s)
+                cur.execute("""INSERT INTO stderr (id, timestamp, i, o, ok_s, ok, q_max, drops, drop_rate,
+                                        queue_saturation)
+                                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                                         ON CONFLICT ("id", "timestamp") DO UPDATE SET
                                         i = EXCLUDED.i, 
                                         o = EXCLUDED.o, 
                                         ok_s = EXCLUDED.ok_s, 
-                                        ok = EXCLUDED.ok""",
-                            (index, float(r['time']), int(r['i']), int(r['o']), int(r['ok_s']), int(r['ok'])))
+                                        ok = EXCLUDED.ok,
+                                        q_max = EXCLUDED.q_max,
+                                        drops = EXCLUDED.drops,
+                                        drop_rate = EXCLUDED.drop_rate,
+                                        queue_saturation = EXCLUDED.queue_saturation""",
+                            (index, float(r['time']), int(r['i']), int(r['o']), int(r['ok_s']), int(r['ok']),
+                             int(r['q_max']), int(r['drops']), float(r['drop_rate']), float(r['queue_saturation'])))
             print("Finished inserting into DB.Stderr")
             conn.commit()
         else:
@@ -0,0 +1,220 @@
+import functools
+import numpy as np
+import pandas as pd
+from dash import Input, Output, State, callback, Patch, no_update
+import psycopg2 as ps
+import pyarrow.dataset as ds
+import app.dashboard.credentials as credentials
+import app.dashboard.buckets as buckets
+import app.dashboard.parser.frame_archive as frame_archive
+import app.dashboard.figure_cache as figure_cache
+import app.dashboard.auth as auth
+
+
+###
+# Constant definitions
+###
+
+# number of datapoints a zoomed line gets, roughly the width of a plot in pixels
+screen_points = 1000
+# number of zoomed windows that are kept in memory
+cache_size = 256
+signal_cols = ['signal_level', 'background_noise', 'snr']
+
+
+###
+# Function definitions
+###
+
+# largest-triangle-three-buckets downsampling, returns the indices of num_points points of x, y that keep the shape of
+# the line (peaks are kept in contrast to averaging), x has to be sorted
+def lttb(x, y, num_points):
+    n = len(x)
+    if num_points >= n or num_points < 3:
+        return np.arange(n)
+
+    indices = np.zeros(num_points, dtype=int)
+    indices[-1] = n - 1
+    # first and last point are always kept, the points between are split into num_points - 2 buckets
+    edges = np.linspace(1, n - 1, num_points - 1).astype(int)
+    a = 0
+    for i in range(num_points - 2):
+        start, end = edges[i], edges[i + 1]
+        # average of the next bucket, for the last bucket this is the last point
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x = x[n - 1]
+            next_y = y[n - 1]
+        # keep the point that spans the largest triangle with the last kept point and the average of the next bucket
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+# returns (time_lower, time_upper) as unix timestamps of the visible x range from the relayoutData of a graph,
+# (None, None) if the graph got reset to show everything or None if the x range didn't change
+def get_window(relayout):
+    if not relayout:
+        return None
+    if relayout.get("xaxis.autorange"):
+        return None, None
+    if "xaxis.range[0]" in relayout and "xaxis.range[1]" in relayout:
+        x_range = relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+    elif "xaxis.range" in relayout:
+        x_range = relayout["xaxis.range"]
+    else:
+        return None
+    # x axis shows utc dates without timezone
+    return tuple(pd.Timestamp(x).tz_localize(None).timestamp() for x in x_range)
+
+
+def connect():
+    db_user, db_password, user, password = credentials.get()
+    # Connect to postgres database
+    return ps.connect(database="postgres",
+                      user=db_user,
+                      host="localhost",
+                      password=db_password,
+                      port=5432)
+
+
+# returns all (sensor_name, job_name) pairs with signal data for the job and/or sensor
+def get_scope(cur, job_name, sensor_name):
+    cur.execute("""SELECT j.sensor_name, j.job_name
+                FROM sensor_job as j
+                WHERE (%(job)s IS NULL OR j.job_name = %(job)s)
+                AND (%(sensor)s IS NULL OR j.sensor_name = %(sensor)s)
+                AND j.job_name != 'public_page'
+                AND EXISTS (SELECT 1 FROM signal as s WHERE s.id = j.id)""",
+                {"job": job_name, "sensor": sensor_name})
+    return cur.fetchall()
+
+
+# read frames of the window out of the frame archive and downsample every line to width points
+def load_from_archive(job_name, sensor_name, time_lower, time_upper, width):
+    df = frame_archive.read_frames(sensor_name=sensor_name, job_name=job_name, columns=['time'] + signal_cols,
+                                   time_lower=time_lower, time_upper=time_upper)
+    df = df.sort_values(by="time")
+    times = df['time'].to_numpy()
+
+    # number of frames before the window so the sum continues where the window starts
+    offset = 0
+    if time_lower is not None:
+        expression = ds.field("time") < time_lower
+        if sensor_name is not None:
+            expression = expression & (ds.field("sensor") == sensor_name)
+        if job_name is not None:
+            expression = expression & (ds.field("job") == job_name)
+        offset = frame_archive.dataset().count_rows(filter=expression)
+
+    lines = {}
+    packets = offset + np.arange(1, len(times) + 1, dtype=float)
+    index = lttb(times, packets, width)
+    lines['sum'] = times[index], packets[index]
+    for col in signal_cols:
+        values = df[col].to_numpy(dtype=float)
+        index = lttb(times, values, width)
+        lines[col] = times[index], values[index]
+    return lines
+
+
+# fallback for jobs that were handled before the frame archive existed, aggregate the window inside the DB
+def load_from_db(cur, job_name, sensor_name, time_lower, time_upper, width):
+    params = {"job": job_name, "sensor": sensor_name}
+    source = """(SELECT s.*
+                FROM signal as s, sensor_job as j
+                WHERE s.id = j.id
+                AND (%(job)s IS NULL OR j.job_name = %(job)s)
+                AND (%(sensor)s IS NULL OR j.sensor_name = %(sensor)s)
+                AND j.job_name != 'public_page')"""
+    df = buckets.fetch_buckets(cur, source, signal_cols, width, params, count_col="count", time_lower=time_lower,
+                               time_upper=time_upper)
+
+    offset = 0
+    if time_lower is not None:
+        cur.execute(f"SELECT COALESCE(SUM(src.count), 0) FROM {source} AS src WHERE src.timestamp < %(time_lower)s",
+                    dict(params, time_lower=time_lower))
+        offset = cur.fetchone()[0]
+
+    times = df['time'].to_numpy(dtype=float)
+    lines = {'sum': (times, offset + df['count'].cumsum().to_numpy(dtype=float))}
+    for col in signal_cols:
+        values = df[col].to_numpy(dtype=float)
+        lines[col] = times[~np.isnan(values)], values[~np.isnan(values)]
+    return lines
+
+
+# returns dict line name -> (times, values) with at most width points for the packet sum and every signal col between
+# time_lower & time_upper for a job and/or sensor, windows are cached until the data_daemon changes the data version
+# (new jobs of a sensor or new sensors of a job change the lines)
+@functools.lru_cache(maxsize=cache_size)
+def load_window(version, job_name, sensor_name, time_lower, time_upper, width=screen_points):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        # use the frame archive only if it contains every job of the scope, otherwise sums would be incomplete
+        scope = get_scope(cur, job_name, sensor_name)
+        archived = all(frame_archive.partition_path(frame_archive.archive_path, s, j).exists() for s, j in scope)
+        if scope and archived:
+            return load_from_archive(job_name, sensor_name, time_lower, time_upper, width)
+        return load_from_db(cur, job_name, sensor_name, time_lower, time_upper, width)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def to_dates(times):
+    return pd.to_datetime(times, unit='s').strftime("%Y-%m-%d %H:%M:%S.%f").tolist()
+
+
+###
+# Callbacks
+###
+
+# every page with a zoomable packetLine has a store "zoom_source" with {"job": job_name, "sensor": sensor_name},
+# None disables zooming (e.g. when packetLine shows other data)
+@callback(
+    Output('packetLine', 'figure', allow_duplicate=True),
+    Input('packetLine', 'relayoutData'),
+    State('zoom_source', 'data'),
+    prevent_initial_call=True
+)
+def zoom_packet_line(relayout, source):
+    window = get_window(relayout)
+    if window is None or not source:
+        return no_update
+    # job and sensor come from the client, callbacks aren't covered by the login of the pages
+    auth.require_login()
+
+    lines = load_window(figure_cache.get_version(), source.get("job"), source.get("sensor"), *window)
+    times, values = lines['sum']
+    # only replace the data of the line, so style and zoom of the graph stay the same
+    figure = Patch()
+    figure['data'][0]['x'] = to_dates(times)
+    figure['data'][0]['y'] = values.tolist()
+    return figure
+
+
+@callback(
+    Output('signalLine', 'figure', allow_duplicate=True),
+    Input('signalLine', 'relayoutData'),
+    State('zoom_source', 'data'),
+    prevent_initial_call=True
+)
+def zoom_signal_line(relayout, source):
+    window = get_window(relayout)
+    if window is None or not source or source.get("sensor") is None:
+        return no_update
+    auth.require_login()
+
+    lines = load_window(figure_cache.get_version(), source.get("job"), source.get("sensor"), *window)
+    figure = Patch()
+    # traces are in the order of signal_cols
+    for i, col in enumerate(signal_cols):
+        times, values = lines[col]
+        figure['data'][i]['x'] = to_dates(times)
+        figure['data'][i]['y'] = values.tolist()
+    return figure
@@ -531,6 +531,12 @@ async def return_fixed_job_by_job_id(job_id: str):
         return fixed_jobs_helper(job)
 
 
+async def return_fixed_job_by_name(name: str):
+    job = await fixed_jobs_collection.find_one({"name": str(name)})
+    if job:
+        return fixed_jobs_helper(job)
+
+
 # -----------------------------------------
 # ----------- TOKEN METHODS ---------------
 # -----------------------------------------
@@ -14,10 +14,12 @@ from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import FileResponse
 from fastapi.background import BackgroundTasks
+from starlette.concurrency import run_in_threadpool
 from zipfile import ZipFile
 from os.path import basename
 from fastapi_another_jwt_auth import AuthJWT
 from app.server.routes.login import validate_access_token_rights
+from app.dashboard.parser.parse_queue import enqueue_upload
 
 from app.server.database import (
     add_data,
@@ -27,6 +29,7 @@ from app.server.database import (
     retrieve_all_data,
     return_user_role,
     return_fixed_job_by_job_id,
+    return_fixed_job_by_name,
 )
 from app.server.models.data import (
     ErrorResponseModel,
@@ -58,6 +61,11 @@ async def add_sensor_data(sensor_name: str, job_name: str, in_file: UploadFile =
     async with aiofiles.open(filepath, 'wb') as f:
         await f.write(file_content)
 
+    # let the dashboard parser pick up the new file, the job is passed along so the task doesn't depend on the
+    # fixed jobs mirror of the dashboard DB being up to date
+    job = await return_fixed_job_by_name(job_name)
+    await run_in_threadpool(enqueue_upload, file_id, sensor_name, job_name, job)
+
     return ResponseModel(new_file_db, "Sensor data added successfully.")
 
 
@@ -236,6 +244,9 @@ async def upload_sensor_data_chunk(sensor_name: str, job_id: str, chunk_nr: int,
         remove_file(os.path.join(temp_folder, file))
     shutil.rmtree(temp_folder)
 
+    # let the dashboard parser pick up the new file, psycopg2 is blocking so run it in the threadpool
+    await run_in_threadpool(enqueue_upload, file_id, sensor_name, job_name, job)
+
     return ResponseModel(new_file_db, "Data uploaded successfully.")
 
 
@@ -0,0 +1,252 @@
+"""Combined sensor coverage GeoJSON of `/clients_geojson`.
+
+All coverage files of a directory are merged into one FeatureCollection when the directory
+changes, instead of on every request. Features are found through a grid over their bounding
+boxes, so a map only downloads the coverage polygons in view. Rings can be simplified with
+Douglas-Peucker to a tolerance in degrees. Serialized bodies are kept with their gzip
+compressed version and an ETag.
+"""
+from typing import Optional, List, Tuple
+import os
+import json
+import gzip
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+# Edge length of the cells of the grid index in degrees
+_GRID_DEGREES = 10.0
+# Seconds the directory is not listed again
+_STAT_TTL = 2.0
+# Number of serialized responses kept per snapshot
+_RESPONSE_CACHE_SIZE = 128
+_GZIP_LEVEL = 6
+
+BBox = Tuple[float, float, float, float]
+
+
+class Body:
+    """Serialized response with its gzip compressed version and ETag."""
+
+    def __init__(self, data: dict):
+        self.raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        self.gzip = gzip.compress(self.raw, compresslevel=_GZIP_LEVEL, mtime=0)
+        self.etag = '"' + hashlib.sha1(self.raw).hexdigest()[:20] + '"'
+
+
+def _coordinates(geometry: Optional[dict]) -> np.ndarray:
+    """All positions of a geometry as (n, 2) array of lon/lat."""
+    positions = []
+
+    def collect(coords):
+        if len(coords) > 0 and isinstance(coords[0], (int, float)):
+            positions.append(coords[:2])
+        else:
+            for c in coords:
+                collect(c)
+
+    if geometry:
+        if geometry.get("type") == "GeometryCollection":
+            for g in geometry.get("geometries", []):
+                positions.extend(_coordinates(g).tolist())
+        else:
+            collect(geometry.get("coordinates", []))
+    return np.asarray(positions, dtype=float).reshape(-1, 2)
+
+
+def simplify_line(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas-Peucker simplification of a (n, 2) line, the first and last point are always kept."""
+    if len(points) < 3 or tolerance <= 0:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        rest = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(rest[:, 0], rest[:, 1])
+        else:
+            distances = np.abs(segment[0] * rest[:, 1] - segment[1] * rest[:, 0]) / length
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+
+def _simplify_ring(ring: list, tolerance: float) -> list:
+    points = np.asarray(ring, dtype=float)
+    if points.ndim != 2 or len(points) <= 4:
+        return ring
+    simplified = simplify_line(points, tolerance)
+    # a ring needs at least 4 positions (first = last), keep the original if it collapses
+    return simplified.tolist() if len(simplified) >= 4 else ring
+
+
+def simplify_geometry(geometry: Optional[dict], tolerance: float) -> Optional[dict]:
+    """Copy of a geometry with simplified lines and rings, points are returned as they are."""
+    if not geometry or tolerance <= 0:
+        return geometry
+    kind = geometry.get("type")
+    coords = geometry.get("coordinates")
+    if kind == "LineString":
+        simplified = simplify_line(np.asarray(coords, dtype=float), tolerance).tolist()
+    elif kind == "MultiLineString":
+        simplified = [simplify_line(np.asarray(line, dtype=float), tolerance).tolist() for line in coords]
+    elif kind == "Polygon":
+        simplified = [_simplify_ring(ring, tolerance) for ring in coords]
+    elif kind == "MultiPolygon":
+        simplified = [[_simplify_ring(ring, tolerance) for ring in polygon] for polygon in coords]
+    elif kind == "GeometryCollection":
+        return dict(geometry, geometries=[simplify_geometry(g, tolerance) for g in geometry.get("geometries", [])])
+    else:
+        return geometry
+    return dict(geometry, coordinates=simplified)
+
+
+def _cells(bbox: BBox) -> List[Tuple[int, int]]:
+    # Limited to the world, the number of cells of a box must not depend on its values
+    min_lon, max_lon = np.clip([bbox[0], bbox[2]], -180.0, 180.0)
+    min_lat, max_lat = np.clip([bbox[1], bbox[3]], -90.0, 90.0)
+    xs = range(int(np.floor(min_lon / _GRID_DEGREES)), int(np.floor(max_lon / _GRID_DEGREES)) + 1)
+    ys = range(int(np.floor(min_lat / _GRID_DEGREES)), int(np.floor(max_lat / _GRID_DEGREES)) + 1)
+    return [(x, y) for x in xs for y in ys]
+
+
+def parse_bbox(text: str) -> List[BBox]:
+    """Parse "min_lon,min_lat,max_lon,max_lat", a box across the antimeridian is split in two.
+
+    Longitudes are clamped to [-180, 180] and latitudes to [-90, 90]. Raises ValueError if the text
+    isn't a valid box.
+    """
+    values = [float(v) for v in text.split(",")]
+    if len(values) != 4:
+        raise ValueError("bbox needs 4 values: min_lon,min_lat,max_lon,max_lat")
+    min_lon, min_lat, max_lon, max_lat = values
+    if min_lat > max_lat or not all(np.isfinite(values)):
+        raise ValueError("bbox needs min_lat <= max_lat and finite values")
+    min_lon, max_lon = (float(v) for v in np.clip([min_lon, max_lon], -180.0, 180.0))
+    min_lat, max_lat = (float(v) for v in np.clip([min_lat, max_lat], -90.0, 90.0))
+    if min_lon > max_lon:
+        return [(min_lon, min_lat, 180.0, max_lat), (-180.0, min_lat, max_lon, max_lat)]
+    return [(min_lon, min_lat, max_lon, max_lat)]
+
+
+class _Snapshot:
+    """Features of one version of the directory and their grid index."""
+
+    def __init__(self, directory: str, key: tuple):
+        self.key = key
+        self.files = [name for name, _, _ in key]
+        self.features = []
+        for filename in self.files:
+            try:
+                with open(os.path.join(directory, filename), "r", encoding="utf-8") as fh:
+                    data = json.load(fh)
+            except (OSError, ValueError):
+                # Skip files that can't be loaded but don't fail completely
+                continue
+            if data.get("type") == "FeatureCollection" and "features" in data:
+                self.features.extend(data["features"])
+            elif data.get("type") == "Feature":
+                self.features.append(data)
+
+        # Bounding boxes of the features, features without positions are never in a bbox
+        self.bounds = np.full((len(self.features), 4), np.nan)
+        self.grid = {}
+        for i, feature in enumerate(self.features):
+            positions = _coordinates(feature.get("geometry"))
+            if len(positions) == 0:
+                continue
+            bounds = (*positions.min(axis=0), *positions.max(axis=0))
+            self.bounds[i] = bounds
+            for cell in _cells(bounds):
+                self.grid.setdefault(cell, []).append(i)
+
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+
+    def query(self, boxes: Optional[List[BBox]]) -> List[int]:
+        """Indices of the features whose bounding box intersects one of the boxes, in file order."""
+        if boxes is None:
+            return list(range(len(self.features)))
+        found = set()
+        for box in boxes:
+            candidates = {i for cell in _cells(box) for i in self.grid.get(cell, [])}
+            min_lon, min_lat, max_lon, max_lat = box
+            for i in candidates:
+                b = self.bounds[i]
+                if b[0] <= max_lon and b[2] >= min_lon and b[1] <= max_lat and b[3] >= min_lat:
+                    found.add(i)
+        return sorted(found)
+
+
+class CoverageCollection:
+    """Coverage GeoJSON files of a directory as one FeatureCollection, rebuilt when the directory changes."""
+
+    def __init__(self, directory: str, stat_ttl: float = _STAT_TTL):
+        self.directory = directory
+        self.stat_ttl = stat_ttl
+        self._snapshot = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _key(self) -> tuple:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".geojson") and entry.is_file():
+                    st = entry.stat()
+                    entries.append((entry.name, st.st_mtime_ns, st.st_size))
+        return tuple(sorted(entries))
+
+    def snapshot(self) -> _Snapshot:
+        """Return the features of the current version of the directory, raises FileNotFoundError."""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked < self.stat_ttl:
+            return snapshot
+        with self._lock:
+            key = self._key()
+            if self._snapshot is None or self._snapshot.key != key:
+                self._snapshot = _Snapshot(self.directory, key)
+            self._checked = time.monotonic()
+            return self._snapshot
+
+    def response(self, boxes: Optional[List[BBox]] = None, tolerance: float = 0.0) -> Body:
+        """Combined FeatureCollection of the features in boxes, serialized once per parameters and version."""
+        snapshot = self.snapshot()
+        key = (tuple(boxes) if boxes is not None else None, tolerance)
+        with snapshot.lock:
+            body = snapshot.responses.get(key)
+            if body is not None:
+                snapshot.responses.move_to_end(key)
+                return body
+
+        features = [snapshot.features[i] for i in snapshot.query(boxes)]
+        if tolerance > 0:
+            features = [dict(f, geometry=simplify_geometry(f.get("geometry"), tolerance)) for f in features]
+        body = Body({
+            "type": "FeatureCollection",
+            "features": features,
+            "metadata": {
+                "total_sensors": len(features),
+                "source_files": len(snapshot.files),
+                "description": "Combined sensor coverage areas from all available sensors"
+            }
+        })
+
+        with snapshot.lock:
+            snapshot.responses[key] = body
+            while len(snapshot.responses) > _RESPONSE_CACHE_SIZE:
+                snapshot.responses.popitem(last=False)
+        return body
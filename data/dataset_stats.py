@@ -0,0 +1,157 @@
+"""Statistics of the datasets served by the measurement API.
+
+The analysis pipeline writes them next to every `output_df.feather` as `output_df.stats.json`,
+so `/df/info` doesn't have to scan the dataset on every request. Distinct counts and quantiles
+are approximate: distinct counts come from a HyperLogLog sketch and quantiles from Arrow's
+t-digest, both need a single pass and little memory.
+"""
+from typing import Optional
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+
+# Bumped when the layout of the sidecar changes, older sidecars are ignored
+STATS_VERSION = 1
+# 2^12 HyperLogLog registers, relative error of the distinct counts is about 1.6%
+_HLL_PRECISION = 12
+_QUANTILES = [0.25, 0.5, 0.75]
+_HEAD_ROWS = 10
+
+
+def sidecar_path(feather_path: str) -> str:
+    """Path of the statistics sidecar of a Feather file."""
+    return os.path.splitext(str(feather_path))[0] + ".stats.json"
+
+
+def approx_distinct(values: pa.ChunkedArray) -> int:
+    """Estimate the number of distinct non-null values with a HyperLogLog sketch."""
+    values = values.drop_null()
+    if len(values) == 0:
+        return 0
+    hashes = pd.util.hash_array(np.asarray(values.to_pandas()))
+    m = 1 << _HLL_PRECISION
+    index = (hashes >> np.uint64(64 - _HLL_PRECISION)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - _HLL_PRECISION)) - 1)
+    # Position of the first 1 bit of the remaining bits, counted from their highest bit
+    bit_length = np.zeros(len(rest), dtype=np.int64)
+    nonzero = rest > 0
+    bit_length[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64) + 1
+    rank = (64 - _HLL_PRECISION) - bit_length + 1
+    registers = np.zeros(m, dtype=np.int64)
+    np.maximum.at(registers, index, rank)
+
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(2.0 ** -registers)
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros > 0:
+        # Linear counting is more accurate for small cardinalities
+        estimate = m * np.log(m / zeros)
+    return int(round(min(estimate, len(values))))
+
+
+def _plain(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Decode dictionary columns and turn NaN into null, like pandas treats them."""
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    if pa.types.is_floating(column.type):
+        column = pc.if_else(pc.is_nan(column), pa.scalar(None, column.type), column)
+    return column
+
+
+def _numeric_stats(column: pa.ChunkedArray) -> dict:
+    count = len(column) - column.null_count
+    stats = {"count": count, "mean": None, "std": None, "min": None, "max": None}
+    stats.update({f"{int(q * 100)}%": None for q in _QUANTILES})
+    if count == 0:
+        return stats
+    min_max = pc.min_max(column)
+    quantiles = pc.tdigest(column, q=_QUANTILES).to_pylist()
+    stats.update({"mean": pc.mean(column).as_py(),
+                  "std": pc.stddev(column, ddof=1).as_py() if count > 1 else None,
+                  "min": min_max["min"].as_py(), "max": min_max["max"].as_py()})
+    stats.update({f"{int(q * 100)}%": v for q, v in zip(_QUANTILES, quantiles)})
+    return stats
+
+
+def _string_stats(column: pa.ChunkedArray) -> dict:
+    counts = pc.value_counts(column.drop_null())
+    stats = {"count": len(column) - column.null_count, "unique": len(counts), "top": None, "freq": None}
+    if len(counts) > 0:
+        top = pc.index(counts.field("counts"), pc.max(counts.field("counts")))
+        stats["top"] = counts.field("values")[top.as_py()].as_py()
+        stats["freq"] = counts.field("counts")[top.as_py()].as_py()
+    return stats
+
+
+def compute_stats(table: pa.Table) -> dict:
+    """Compute the statistics of a dataset in one pass per column.
+
+    `describe_numeric` and `describe_objects` have the layout of pandas' `describe()`, with
+    approximate quantiles. `column_stats` holds null counts, min/max/mean and approximate
+    distinct counts of every column.
+    """
+    empty = table.schema.empty_table().to_pandas()
+    head = table.slice(0, _HEAD_ROWS).to_pandas()
+    stats = {
+        "version": STATS_VERSION,
+        "columns": [str(c) for c in empty.columns],
+        "dtypes": {str(col): str(dtype) for col, dtype in empty.dtypes.items()},
+        "shape": {"rows": table.num_rows, "columns": table.num_columns},
+        # Size of the decoded Arrow columns, pandas needs more for string columns
+        "memory_usage_bytes": table.nbytes,
+        "head": json.loads(head.to_json(orient="records")),
+        "describe_numeric": {},
+        "describe_objects": {},
+        "column_stats": {},
+    }
+
+    for name in table.schema.names:
+        column = _plain(table.column(name))
+        column_stats = {"nulls": column.null_count}
+        if pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+            numeric = _numeric_stats(column)
+            stats["describe_numeric"][name] = numeric
+            column_stats.update({"min": numeric["min"], "max": numeric["max"], "mean": numeric["mean"]})
+        elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            stats["describe_objects"][name] = _string_stats(column)
+        if not pa.types.is_nested(column.type):
+            column_stats["distinct_approx"] = approx_distinct(column)
+        stats["column_stats"][name] = column_stats
+    return stats
+
+
+def write_stats(feather_path: str) -> dict:
+    """Compute the statistics of a Feather file and write them into its sidecar.
+
+    The sidecar records mtime and size of the Feather file, so readers can tell when it is stale.
+    """
+    table = feather.read_table(str(feather_path), memory_map=True)
+    st = os.stat(feather_path)
+    stats = compute_stats(table)
+    stats["source"] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+    path = sidecar_path(feather_path)
+    with open(path + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(stats, fh)
+    os.replace(path + ".tmp", path)
+    return stats
+
+
+def read_stats(feather_path: str) -> Optional[dict]:
+    """Return the sidecar of a Feather file, None if it is missing, outdated or stale."""
+    try:
+        with open(sidecar_path(feather_path), "r", encoding="utf-8") as fh:
+            stats = json.load(fh)
+        st = os.stat(feather_path)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if stats.get("version") != STATS_VERSION:
+        return None
+    if stats.get("source") != {"mtime_ns": st.st_mtime_ns, "size": st.st_size}:
+        return None
+    return stats
@@ -0,0 +1,220 @@
+"""Parquet dataset of the Iridium Ring Alerts (IRAs) of all jobs, served by `/iridium_ira`.
+
+The analyser appends the IRAs of every processed zip to a dataset partitioned by month
+(`month=YYYY-MM/`, `append_partition`), nothing that is already stored gets rewritten. Every file is
+sorted by time with small row groups. Parquet keeps min/max statistics per row group, so a query for
+a time window skips the months and row groups it doesn't overlap. Queries are read month by month,
+callers can stream the rows without holding the result in memory. IRAs of an older monolithic
+`ira.feather` are added with
+
+    python ira_store.py ../ideas/data/parsed/ira --feather ../ideas/data/parsed/ira.feather
+"""
+from typing import Optional, List, Tuple, Iterator, Iterable
+import io
+import os
+import json
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as pads
+import pyarrow.feather as feather
+
+
+# Rows per row group, the unit a time window query skips or reads
+_ROW_GROUP_ROWS = 64 * 1024
+# Rows per batch of a query
+_BATCH_ROWS = 16 * 1024
+# Columns with few distinct values, stored dictionary encoded
+_DICTIONARY_COLUMNS = ["frame_type", "direction", "job_name", "sensor_name"]
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """Add the `time` column (unix seconds) and turn sat_id and beam_id into nullable integers."""
+    df = df.copy()
+    if "time" not in df.columns:
+        df["time"] = df["timestamp_ms"].astype("float64") / 1000
+    for col in ["sat_id", "beam_id"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int16")
+    return df.sort_values(by="time", kind="stable").reset_index(drop=True)
+
+
+def _month(time: pd.Series) -> pd.Series:
+    """Partition key (YYYY-MM, UTC) of unix seconds."""
+    return pd.to_datetime(time, unit="s", utc=True).dt.strftime("%Y-%m")
+
+
+def append_partition(df: pd.DataFrame, root: str, basename: str,
+                     row_group_rows: int = _ROW_GROUP_ROWS) -> None:
+    """Add IRAs like the ones of `ira_parser` to the dataset at root, one file per month `month=YYYY-MM/`.
+
+    Any rows with a `time` (unix seconds) column can be stored this way, the analyser uses it for the
+    frames of `metadata_parser` as well. Files are named after basename, writing the same basename
+    again replaces its files instead of adding duplicates.
+    """
+    if len(df) == 0:
+        return
+    df = _normalize(df)
+    df["month"] = _month(df["time"])
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    file_format = pads.ParquetFileFormat()
+    options = file_format.make_write_options(
+        compression="zstd", use_dictionary=[c for c in _DICTIONARY_COLUMNS if c in table.schema.names])
+    pads.write_dataset(table, root, format=file_format, file_options=options,
+                       partitioning=["month"], partitioning_flavor="hive", preserve_order=True,
+                       basename_template=basename + "-{i}.parquet",
+                       existing_data_behavior="overwrite_or_ignore",
+                       min_rows_per_group=row_group_rows, max_rows_per_group=row_group_rows)
+
+
+def remove_partition(root: str, basename: str) -> None:
+    """Delete the files of basename from the dataset at root."""
+    if not os.path.isdir(root):
+        return
+    for month in os.listdir(root):
+        folder = os.path.join(root, month)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if name.startswith(basename + "-") and name.endswith(".parquet"):
+                os.remove(os.path.join(folder, name))
+
+
+def _month_of(time: Optional[float]) -> Optional[str]:
+    """Partition key of one unix time, None if there is no time or it is out of range (no pruning)."""
+    if time is None:
+        return None
+    try:
+        return _month(pd.Series([time]))[0]
+    except (OverflowError, pd.errors.OutOfBoundsDatetime, ValueError):
+        return None
+
+
+def _month_folders(root: str, time_from: Optional[float] = None,
+                   time_to: Optional[float] = None) -> List[Tuple[str, List[str]]]:
+    """(folder, Parquet files) of the months of the dataset at root that overlap the time window, in time order."""
+    first = _month_of(time_from)
+    last = _month_of(time_to)
+    months = []
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        if not name.startswith("month=") or not os.path.isdir(folder):
+            continue
+        month = name[len("month="):]
+        if (first is not None and month < first) or (last is not None and month > last):
+            continue
+        files = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".parquet"))
+        if files:
+            months.append((folder, files))
+    return months
+
+
+def schema(root: str) -> pa.Schema:
+    """Schema of the dataset at root without the partition column, read from the Parquet footers.
+
+    Raises FileNotFoundError if the dataset has no files.
+    """
+    if not os.path.isdir(root) or not _month_folders(root):
+        raise FileNotFoundError(root)
+    dataset_schema = pads.dataset(root, format="parquet", partitioning="hive").schema
+    return pa.schema([f for f in dataset_schema if f.name != "month"])
+
+
+def build_filter(time_from: Optional[float] = None, time_to: Optional[float] = None,
+                 sat_ids: Optional[List[int]] = None, beam_ids: Optional[List[int]] = None,
+                 sensor: Optional[str] = None, min_confidence: Optional[float] = None,
+                 min_snr: Optional[float] = None):
+    """Combine the filters into one dataset expression, None if no filter is set."""
+    filters = []
+    if time_from is not None:
+        filters.append(pads.field("time") >= time_from)
+    if time_to is not None:
+        filters.append(pads.field("time") <= time_to)
+    if sat_ids:
+        filters.append(pads.field("sat_id").isin(sat_ids))
+    if beam_ids:
+        filters.append(pads.field("beam_id").isin(beam_ids))
+    if sensor is not None:
+        filters.append(pads.field("sensor_name") == sensor)
+    if min_confidence is not None:
+        filters.append(pads.field("confidence") >= min_confidence)
+    if min_snr is not None:
+        filters.append(pads.field("snr") >= min_snr)
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+    return expression
+
+
+def _month_batches(files: List[str], target: pa.Schema, columns: List[str], expression) -> Iterator[pa.RecordBatch]:
+    """Matching rows of the files of one month in time order.
+
+    A single file is streamed as it is sorted already. Files of several zips overlap in time, their
+    matching rows are merged by sorting, which holds at most one month of the result.
+    """
+    dataset = pads.dataset(files, schema=target, format="parquet")
+    if len(files) == 1:
+        yield from dataset.scanner(columns=columns, filter=expression, batch_size=_BATCH_ROWS,
+                                   use_threads=False).to_batches()
+        return
+    # time is needed to sort even if it isn't requested
+    read_columns = columns if "time" in columns else columns + ["time"]
+    table = dataset.to_table(columns=read_columns, filter=expression, use_threads=False)
+    table = table.sort_by("time").select(columns)
+    yield from table.to_batches(max_chunksize=_BATCH_ROWS)
+
+
+def scan(root: str, columns: Optional[List[str]] = None, expression=None, limit: Optional[int] = None,
+         time_from: Optional[float] = None, time_to: Optional[float] = None) -> Iterator[pa.RecordBatch]:
+    """Yield the matching rows of the dataset in time order, batch by batch, at most limit rows.
+
+    time_from and time_to skip whole months, the rows are filtered by expression (see `build_filter`).
+    """
+    target = schema(root)
+    columns = columns or target.names
+    found = 0
+    for _, files in _month_folders(root, time_from, time_to):
+        for batch in _month_batches(files, target, columns, expression):
+            if len(batch) == 0:
+                continue
+            if limit is not None and found + len(batch) >= limit:
+                yield batch.slice(0, limit - found)
+                return
+            found += len(batch)
+            yield batch
+
+
+def to_ndjson(batches: Iterable[pa.RecordBatch]) -> Iterator[bytes]:
+    """Encode batches as newline-delimited JSON, one chunk per batch, NaN becomes null."""
+    for batch in batches:
+        arrays = []
+        for column in batch.columns:
+            if pa.types.is_dictionary(column.type):
+                column = column.dictionary_decode()
+            if pa.types.is_floating(column.type):
+                column = pc.if_else(pc.is_nan(column), pa.scalar(None, column.type), column)
+            arrays.append(column)
+        rows = pa.RecordBatch.from_arrays(arrays, names=batch.schema.names).to_pylist()
+        yield "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows).encode("utf-8")
+
+
+def to_arrow_stream(batches: Iterable[pa.RecordBatch], schema: pa.Schema) -> Iterator[bytes]:
+    """Encode batches as Arrow IPC stream, one chunk per batch."""
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the IRAs of an ira.feather to the dataset of /iridium_ira")
+    parser.add_argument("dataset", help="IRA dataset of the analyser (ira/ in the parsed folder)")
+    parser.add_argument("--feather", required=True, help="monolithic ira.feather of older analyser runs")
+    args = parser.parse_args()
+    append_partition(feather.read_feather(args.feather), args.dataset, "ira-feather")
@@ -1,13 +1,24 @@
 from typing import Optional, List
 import os
+import time
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
-from fastapi import FastAPI, HTTPException, Query
+import pyarrow as pa
+import pyarrow.dataset as pads
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import uvicorn
 import json
+import dataset_stats
+import tle_catalog
+import coverage_geojson
+import ira_store
     
 
 app = FastAPI(title="Measurement API")
@@ -26,6 +37,128 @@ _PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 _DATA_ROOT = os.path.join(_PROJECT_ROOT, "ideas", "data")
 _PARSED_ROOT = os.path.join(_DATA_ROOT, "parsed")
 
+# Upper limit for the Arrow tables kept by the dataset registry (bytes of the decoded columns)
+_CACHE_MAX_BYTES = int(os.getenv("MEASUREMENT_API_CACHE_BYTES", str(1024 * 1024 * 1024)))
+# Seconds a file is not stat'ed again, so repeat requests don't touch the disk at all
+_STAT_TTL = 2.0
+# Rows of a dataset that `/df` filters at once, scanning stops as soon as a page is full
+_SCAN_BATCH_ROWS = 64 * 1024
+# Response formats of `/df` for bulk consumers besides JSON
+_MEDIA_TYPES = {"arrow": "application/vnd.apache.arrow.stream", "parquet": "application/vnd.apache.parquet"}
+
+
+class DatasetRegistry:
+    """Cache of the Arrow tables of the Feather files served by this API.
+
+    Files are opened memory-mapped, so uncompressed Feather files are not copied into memory at all and
+    compressed ones are only decoded once. Tables are keyed by (path, mtime, size): after the analysis
+    pipeline rewrote a file, the next request loads the new version. The least recently used tables are
+    dropped once more than `max_bytes` are cached.
+    """
+
+    def __init__(self, max_bytes: int = _CACHE_MAX_BYTES, stat_ttl: float = _STAT_TTL):
+        self.max_bytes = max_bytes
+        self.stat_ttl = stat_ttl
+        # (path, mtime, size) -> table, ordered from least to most recently used
+        self._tables = OrderedDict()
+        # (path, mtime, size) -> {name: value computed from the table}, dropped together with the table
+        self._derived = {}
+        # path -> ((path, mtime, size), time of the stat)
+        self._keys = {}
+        self._total_bytes = 0
+        # sync endpoints run in a thread pool
+        self._lock = threading.Lock()
+
+    def _key(self, path: str) -> tuple:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._keys.get(path)
+        if cached is not None and now - cached[1] < self.stat_ttl:
+            return cached[0]
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            self._keys[path] = (key, now)
+        return key
+
+    def _drop(self, key: tuple) -> None:
+        self._total_bytes -= self._tables.pop(key).nbytes
+        self._derived.pop(key, None)
+
+    def table(self, path: str) -> pa.Table:
+        """Return the Arrow table of a Feather file, raises FileNotFoundError if it doesn't exist."""
+        key = self._key(path)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                return table
+            stale = [k for k in self._tables if k[0] == path]
+
+        try:
+            table = feather.read_table(path, memory_map=True)
+        except FileNotFoundError:
+            raise
+        except (pa.ArrowInvalid, OSError):
+            # The file is being rewritten, serve the previous version until the new one is complete
+            with self._lock:
+                self._keys.pop(path, None)
+                previous = next((self._tables[k] for k in reversed(stale) if k in self._tables), None)
+            if previous is None:
+                raise
+            return previous
+
+        with self._lock:
+            for old in [k for k in self._tables if k[0] == path]:
+                self._drop(old)
+            self._tables[key] = table
+            self._total_bytes += table.nbytes
+            # The newest table is always kept, even if it is bigger than max_bytes on its own
+            while self._total_bytes > self.max_bytes and len(self._tables) > 1:
+                self._drop(next(iter(self._tables)))
+        return table
+
+    def dataframe(self, path: str) -> pd.DataFrame:
+        """Return the Feather file as DataFrame, raises FileNotFoundError if it doesn't exist."""
+        return self.table(path).to_pandas()
+
+    def derived(self, path: str, name: str, compute):
+        """Return compute(table) of a Feather file, computed once per version of the file."""
+        table = self.table(path)
+        key = self._key(path)
+        with self._lock:
+            cached = self._derived.get(key, {})
+            if name in cached:
+                return cached[name]
+        value = compute(table)
+        with self._lock:
+            if key in self._tables:
+                self._derived.setdefault(key, {})[name] = value
+        return value
+
+
+_REGISTRY = DatasetRegistry()
+
+_TLE_PATH = os.path.join(_PROJECT_ROOT, "ideas", "step1_pull", "output", "tles.json")
+# Indexed TLEs of `/tle`, the propagation code gets parsed Satrec objects from it as well
+_TLE_CATALOG = tle_catalog.TLECatalog(_TLE_PATH)
+
+_SENSOR_GEOJSON_DIR = os.path.join(_PARSED_ROOT, "sensor_geojson")
+# Combined coverage of all sensors for `/clients_geojson`
+_COVERAGE = coverage_geojson.CoverageCollection(_SENSOR_GEOJSON_DIR)
+
+# Ring alerts of all jobs, partitioned by month and appended by the analyser (see `ira_store.append_partition`)
+_IRA_DATASET_PATH = os.path.join(_PARSED_ROOT, "ira")
+_IRA_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "arrow": "application/vnd.apache.arrow.stream"}
+
+
+def _load_feather(path: str) -> pd.DataFrame:
+    """Load a Feather file through the dataset registry or raise 404 if it doesn't exist."""
+    try:
+        return _REGISTRY.dataframe(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Feather file not found at {path}")
+
 
 def list_datasets() -> List[str]:
     """Return folder names in `data/tmp` that contain `output_df.feather`.
@@ -62,54 +195,191 @@ def _resolve_dataset(dataset: Optional[str]) -> str:
 
 def load_df_for_dataset(dataset: str) -> pd.DataFrame:
     path = os.path.join(_PARSED_ROOT, dataset, "output_df.feather")
-    if not os.path.exists(path):
+    try:
+        return _REGISTRY.dataframe(path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"Feather file not found for dataset '{dataset}'")
-    return pd.read_feather(path)
+
+
+def _split(values: Optional[str]) -> Optional[List[str]]:
+    """Split a comma-separated query parameter, None if it is omitted."""
+    if values is None:
+        return None
+    return [v.strip() for v in values.split(",") if v.strip()]
+
+
+def _dataset_sensor(dataset: str) -> Optional[str]:
+    """Sensor of a dataset folder named `<job>_sensor_<sensor>`, None for other names."""
+    parts = dataset.split("_sensor_")
+    return parts[1] if len(parts) > 1 else None
+
+
+def _build_filter(schema: pa.Schema, dataset: str, time_from: Optional[float], time_to: Optional[float],
+                  frame_types: Optional[List[str]], sensor: Optional[str], sat_ids: Optional[List[str]],
+                  beam_ids: Optional[List[str]]):
+    """Combine the row filters of `/df` into one dataset expression.
+
+    Returns (expression or None if no filter is set, columns the expression reads). Raises 400 if
+    a filter needs a column the dataset doesn't have.
+    """
+    filters = []
+    used = []
+
+    def require(column: str) -> None:
+        if column not in schema.names:
+            raise HTTPException(status_code=400, detail=f"Dataset '{dataset}' has no column '{column}' to filter on")
+        if column not in used:
+            used.append(column)
+
+    if time_from is not None:
+        require("time")
+        filters.append(pads.field("time") >= time_from)
+    if time_to is not None:
+        require("time")
+        filters.append(pads.field("time") <= time_to)
+    if frame_types:
+        require("frame_type")
+        filters.append(pads.field("frame_type").isin(frame_types))
+    for column, values in (("sat_id", sat_ids), ("beam_id", beam_ids)):
+        if values:
+            require(column)
+            try:
+                filters.append(pads.field(column).isin([int(v) for v in values]))
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"'{column}' has to be a comma-separated list of integers")
+    if sensor is not None:
+        if "sensor_name" in schema.names:
+            require("sensor_name")
+            filters.append(pads.field("sensor_name") == sensor)
+        elif _dataset_sensor(dataset) != sensor:
+            # Datasets of a single sensor only contain its name in the folder name
+            filters.append(pads.scalar(False))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+    return expression, used
+
+
+def _scan(table: pa.Table, columns: List[str], expression, filter_columns: List[str], cursor: int, offset: int,
+          limit: Optional[int]):
+    """Return (rows, next cursor) of a page of `table`.
+
+    The page starts `offset` matching rows after row `cursor` of the table. Only the projected and filtered
+    columns are read, batch by batch, and scanning stops once `limit` rows are found. The next cursor is None
+    if the table has no rows left.
+    """
+    needed = list(columns) + [c for c in filter_columns if c not in columns]
+    source = table.select(needed).slice(cursor)
+
+    pieces = []
+    found = 0
+    position = cursor
+    next_cursor = None
+    for batch in source.to_batches(max_chunksize=_SCAN_BATCH_ROWS):
+        rows = pa.Table.from_batches([batch]).append_column("__row", pa.array(np.arange(position, position + len(batch))))
+        position += len(batch)
+        if expression is not None:
+            rows = rows.filter(expression)
+        if offset >= len(rows):
+            offset -= len(rows)
+            continue
+        rows = rows.slice(offset)
+        offset = 0
+        if limit is not None and found + len(rows) >= limit:
+            rows = rows.slice(0, limit - found)
+            pieces.append(rows)
+            last_row = rows.column("__row")[-1].as_py()
+            if last_row + 1 < table.num_rows:
+                next_cursor = last_row + 1
+            break
+        pieces.append(rows)
+        found += len(rows)
+
+    if not pieces:
+        return table.select(columns).slice(0, 0), next_cursor
+    return pa.concat_tables(pieces).select(columns), next_cursor
 
 
 @app.get("/df")
 def get_df(dataset: Optional[str] = Query(None, description="Dataset subfolder name inside data/tmp."),
-           limit: Optional[int] = Query(None, ge=1, description="Max number of rows to return; returns all if omitted")):
+           limit: Optional[int] = Query(None, ge=1, description="Max number of rows to return; returns all if omitted"),
+           offset: int = Query(0, ge=0, description="Number of matching rows to skip"),
+           cursor: Optional[int] = Query(None, ge=0, description="Continue after the previous page, value of the "
+                                                                 "X-Next-Cursor header of its response"),
+           columns: Optional[str] = Query(None, description="Comma-separated list of columns; all if omitted"),
+           time_from: Optional[float] = Query(None, description="Only rows with time >= time_from (unix seconds)"),
+           time_to: Optional[float] = Query(None, description="Only rows with time <= time_to (unix seconds)"),
+           frame_type: Optional[str] = Query(None, description="Comma-separated list of frame types, e.g. IRA,IBC"),
+           sensor: Optional[str] = Query(None, description="Only rows of this sensor"),
+           sat_id: Optional[str] = Query(None, description="Comma-separated list of satellite ids"),
+           beam_id: Optional[str] = Query(None, description="Comma-separated list of beam ids"),
+           output_format: str = Query("json", alias="format", pattern="^(json|arrow|parquet)$",
+                                      description="Response format: json (list of records), arrow (Arrow IPC "
+                                                  "stream) or parquet")):
     """
-    Return the requested dataset's DataFrame as JSON (list of records). If `dataset`
-    is omitted and exactly one dataset exists, it will be selected automatically.
-    Use `limit` to restrict rows.
+    Return rows of the requested dataset's DataFrame. If `dataset` is omitted and exactly one
+    dataset exists, it will be selected automatically.
+
+    Only the selected `columns` and the rows matching all filters are read. Use `limit` and
+    `offset` to page through the result. For large datasets prefer `cursor`: every limited
+    response carries the cursor of the next page in the `X-Next-Cursor` header (missing on the
+    last page), so later pages don't scan the rows before them again.
     """
     ds = _resolve_dataset(dataset)
-    df = load_df_for_dataset(ds)
-    records = df.to_dict(orient="records")
-    if limit is not None:
-        records = records[:limit]
-    return jsonable_encoder(records)
+    path = os.path.join(_PARSED_ROOT, ds, "output_df.feather")
+    try:
+        table = _REGISTRY.table(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Feather file not found for dataset '{ds}'")
+
+    selected = _split(columns) or table.schema.names
+    unknown = [c for c in selected if c not in table.schema.names]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns {unknown}; available: {table.schema.names}")
+
+    expression, filter_columns = _build_filter(table.schema, ds, time_from, time_to, _split(frame_type), sensor, _split(sat_id),
+                               _split(beam_id))
+    result, next_cursor = _scan(table, selected, expression, filter_columns, cursor or 0, offset, limit)
+    headers = {} if next_cursor is None else {"X-Next-Cursor": str(next_cursor)}
+
+    if output_format == "arrow":
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, result.schema) as writer:
+            writer.write_table(result)
+        return Response(content=sink.getvalue().to_pybytes(), media_type=_MEDIA_TYPES["arrow"], headers=headers)
+    if output_format == "parquet":
+        sink = pa.BufferOutputStream()
+        pq.write_table(result, sink)
+        return Response(content=sink.getvalue().to_pybytes(), media_type=_MEDIA_TYPES["parquet"], headers=headers)
+
+    df = result.to_pandas()
+    # NaN isn't valid JSON
+    df = df.astype(object).where(df.notna(), None)
+    return JSONResponse(content=jsonable_encoder(df.to_dict(orient="records")), headers=headers)
 
 
 @app.get("/df/info")
 def get_df_info(dataset: Optional[str] = Query(None, description="Dataset subfolder name inside data/tmp.")):
     """
     Return metadata about the chosen dataset's DataFrame: columns, dtypes, shape, memory usage, head and descriptive stats.
+
+    The statistics are read from the sidecar the analysis pipeline writes next to the dataset
+    (see `dataset_stats`). Datasets without an up-to-date sidecar are scanned once per version
+    of the file. Quantiles and distinct counts are approximate.
     """
     ds = _resolve_dataset(dataset)
-    df = load_df_for_dataset(ds)
-
-    # columns and dtypes
-    dtypes = {str(col): str(dtype) for col, dtype in df.dtypes.items()}
+    path = os.path.join(_PARSED_ROOT, ds, "output_df.feather")
 
-    # basic stats
-    info = {
-        "dataset": ds,
-        "columns": list(df.columns.astype(str)),
-        "dtypes": dtypes,
-        "shape": {"rows": int(df.shape[0]), "columns": int(df.shape[1])},
-        "memory_usage_bytes": int(df.memory_usage(deep=True).sum()),
-        "head": df.head(10).to_dict(orient="records"),
-    }
-
-    desc_num = df.describe(include=[np.number]).to_dict()
-    desc_obj = df.describe(include=[object]).to_dict()
-
-    info["describe_numeric"] = desc_num
-    info["describe_objects"] = desc_obj
+    stats = dataset_stats.read_stats(path)
+    if stats is None:
+        try:
+            stats = _REGISTRY.derived(path, "stats", dataset_stats.compute_stats)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Feather file not found for dataset '{ds}'")
 
+    info = {"dataset": ds}
+    info.update({k: v for k, v in stats.items() if k not in ("version", "source")})
     return jsonable_encoder(info)
 
 
@@ -123,6 +393,8 @@ def get_datasets():
 @app.get("/tle")
 def get_tle(
     name: Optional[str] = Query(None, description="Filter by satellite name (substring match)."),
+    prefix: Optional[str] = Query(None, description="Filter by satellite name (prefix match)."),
+    norad_id: Optional[int] = Query(None, description="Filter by NORAD catalog number."),
     type_filter: Optional[str] = Query(None, description="Filter by type ('Communications' or 'Other')."),
     system: Optional[str] = Query(None, description="Filter by system: 'iridium', 'starlink', 'orbcomm', 'oneweb', 'globalstar', or 'other' (everything else)."),
     fields: Optional[str] = Query(None, description="Comma-separated list of fields to include ('name', 'line1', 'line2', 'type', 'system'). If omitted, all fields are returned."),
@@ -132,95 +404,72 @@ def get_tle(
 
     Parameters:
     - name: Filter by satellite name (substring match, case-insensitive)
+    - prefix: Filter by satellite name (prefix match, case-insensitive)
+    - norad_id: Filter by NORAD catalog number
     - type_filter: Filter by type field
     - system: Filter by system (iridium, starlink, orbcomm, oneweb, globalstar, or other)
     - fields: Comma-separated list of fields to include in response
     - limit: Max number of results
 
-    The path is resolved relative to the repository root (parent of this `data` folder).
-    If the file is missing a 404 is returned.
+    The file is indexed once by `_TLE_CATALOG` and reloaded when it changes, responses are
+    serialized once per combination of parameters. If the file is missing a 404 is returned.
     """
-    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-    tle_path = os.path.join(repo_root, "ideas", "step1_pull", "output", "tles.json")
-    if not os.path.exists(tle_path):
-        raise HTTPException(status_code=404, detail=f"TLE file not found at {tle_path}")
+    field_list = tuple(f.strip() for f in fields.split(",")) if fields else None
     try:
-        with open(tle_path, "r", encoding="utf-8") as fh:
-            data = json.load(fh)
+        body = _TLE_CATALOG.response(name=name, prefix=prefix, type_filter=type_filter, system=system,
+                                     norad_id=norad_id, fields=field_list, limit=limit)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"TLE file not found at {_TLE_PATH}")
     except json.JSONDecodeError as exc:
         raise HTTPException(status_code=500, detail=f"Failed to parse JSON: {exc}")
-
-    # Filter by name (substring, case-insensitive)
-    if name:
-        data = [item for item in data if name.lower() in item.get("name", "").lower()]
-
-    # Filter by type
-    if type_filter:
-        data = [item for item in data if item.get("type") == type_filter]
-
-    # Filter by system
-    if system:
-        system_lower = system.lower()
-        if system_lower == "other":
-            # "other" means everything except the known systems
-            known_systems = {"iridium", "starlink", "orbcomm", "oneweb", "globalstar"}
-            data = [item for item in data if item.get("system", "").lower() not in known_systems]
-        else:
-            # Filter by specific system (case-insensitive)
-            data = [item for item in data if item.get("system", "").lower() == system_lower]
-
-    # Select specific fields if requested
-    if fields:
-        field_list = [f.strip() for f in fields.split(",")]
-        data = [{k: item.get(k) for k in field_list if k in item} for item in data]
-
-    # Apply limit
-    if limit is not None:
-        data = data[:limit]
-
-    return jsonable_encoder(data)
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/iridium_ira")
-def iridium_ira():
-
-    return {}
-
-    # TODO: implement filtering for ring alerts 
-    """Get Iridium IRA data as JSON"""
-
-    # feather_path = os.path.join(_DATA_ROOT, "dummy_ira.feather")
-    feather_path = os.path.join(_PARSED_ROOT, "ira.feather")
-    # Ensure the feather file exists
-    if not os.path.exists(feather_path):
-        raise HTTPException(status_code=404, detail=f"Feather file not found at {feather_path}")
-    df = pd.read_feather(feather_path)
-
-    # Replace pandas NA with None so JSON encoders don't choke
-    df = df.where(pd.notnull(df), None)
-
-    # Convert to records (this may still include numpy types); serialize via
-    # json.dumps with a fallback that converts numpy / array-like types to lists.
-    records = df.to_dict(orient="records")
+def iridium_ira(
+    time_from: Optional[float] = Query(None, description="Only ring alerts at or after this unix time (seconds)."),
+    time_to: Optional[float] = Query(None, description="Only ring alerts at or before this unix time (seconds)."),
+    sat_id: Optional[str] = Query(None, description="Comma-separated satellite ids."),
+    beam_id: Optional[str] = Query(None, description="Comma-separated beam ids."),
+    sensor: Optional[str] = Query(None, description="Only ring alerts received by this sensor."),
+    min_confidence: Optional[int] = Query(None, ge=0, le=100, description="Minimum confidence in percent."),
+    min_snr: Optional[float] = Query(None, description="Minimum SNR in dB."),
+    columns: Optional[str] = Query(None, description="Comma-separated list of columns to return; all if omitted."),
+    limit: Optional[int] = Query(None, ge=1, description="Max number of ring alerts to return; returns all if omitted"),
+    output_format: str = Query("ndjson", alias="format", pattern="^(ndjson|arrow)$", description="'ndjson' or 'arrow' (IPC stream)."),
+):
+    """Stream the Iridium ring alerts (IRAs) of all jobs in time order.
 
-    def _default(o):
-        # numpy arrays or pandas arrays
-        if hasattr(o, "tolist"):
-            return o.tolist()
-        # datetimes etc. fall back to string
+    Ring alerts are read from the month-partitioned Parquet dataset of the analyser, a time window
+    only reads the months and row groups it overlaps. The rows are sent batch by batch as
+    newline-delimited JSON or as Arrow IPC stream, the server holds at most one month of the result.
+    """
+    path = _IRA_DATASET_PATH
+    try:
+        schema = ira_store.schema(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"IRA dataset not found at {path}")
+
+    selected = _split(columns) or schema.names
+    unknown = [c for c in selected if c not in schema.names]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns {unknown}; available: {schema.names}")
+    ids = {}
+    for column, values in (("sat_id", sat_id), ("beam_id", beam_id)):
         try:
-            return str(o)
-        except Exception:
-            return None
-
-    safe_json = json.loads(json.dumps(records, default=_default))
-
-    # If single record, return JSON object; otherwise return list
-    if isinstance(safe_json, list) and len(safe_json) == 1:
-        return JSONResponse(content=safe_json[0])
-    return JSONResponse(content=safe_json)
-
-    
+            ids[column] = [int(v) for v in _split(values)] if values is not None else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"'{column}' has to be a comma-separated list of integers")
+
+    expression = ira_store.build_filter(time_from, time_to, ids["sat_id"], ids["beam_id"], sensor,
+                                        min_confidence, min_snr)
+    batches = ira_store.scan(path, selected, expression, limit, time_from, time_to)
+    if output_format == "arrow":
+        projected = pa.schema([schema.field(c) for c in selected])
+        content = ira_store.to_arrow_stream(batches, projected)
+    else:
+        content = ira_store.to_ndjson(batches)
+    return StreamingResponse(content, media_type=_IRA_MEDIA_TYPES[output_format])
 
 
 @app.get("/network_stats_packets_over_time")
@@ -231,7 +480,7 @@ def network_stats_packets_over_time():
     Use `limit` to restrict rows.
     """
     feather_path = os.path.join(_PARSED_ROOT, "df_packets_over_time.feather")
-    df = pd.read_feather(feather_path)
+    df = _load_feather(feather_path)
 
     records = df.to_dict(orient="records")
     return jsonable_encoder(records)
@@ -245,7 +494,7 @@ def network_stats_number_of_packets():
     Use `limit` to restrict rows.
     """
     feather_path = os.path.join(_PARSED_ROOT, "df_packets.feather")
-    df = pd.read_feather(feather_path)
+    df = _load_feather(feather_path)
  
     records = df.to_dict(orient="records")
     return jsonable_encoder(records)
@@ -259,15 +508,18 @@ def network_stats_number_of_jobs_per_month():
     Use `limit` to restrict rows.
     """
     feather_path = os.path.join(_PARSED_ROOT, "df_jobs_per_month.feather")
-    df = pd.read_feather(feather_path)
+    df = _load_feather(feather_path)
     
     records = df.to_dict(orient="records")
     return jsonable_encoder(records)
 
 @app.get("/clients_geojson")
 def clients_geojson(
+    request: Request,
     sensor: Optional[str] = Query(None, description="Specific sensor name to get GeoJSON for. If omitted, returns all available sensor files as a combined FeatureCollection."),
-    list_files: bool = Query(False, description="If true, returns a list of available GeoJSON files instead of the actual data.")
+    list_files: bool = Query(False, description="If true, returns a list of available GeoJSON files instead of the actual data."),
+    bbox: Optional[str] = Query(None, description="Only features whose bounding box intersects min_lon,min_lat,max_lon,max_lat (combined FeatureCollection only)."),
+    tolerance: float = Query(0.0, ge=0, description="Simplify polygons to this tolerance in degrees (combined FeatureCollection only).")
 ):
     """
     Return sensor GeoJSON data as JSON. Can return data for a specific sensor, all sensors combined, or list available files.
@@ -275,8 +527,13 @@ def clients_geojson(
     Parameters:
     - sensor: Specific sensor name (without file extension) to get GeoJSON for
     - list_files: If true, returns list of available files instead of GeoJSON data
+    - bbox: Only return features in view, min_lon > max_lon crosses the antimeridian
+    - tolerance: Douglas-Peucker tolerance in degrees for the polygons
+
+    The combined FeatureCollection is built once per change of the directory. It is sent gzip
+    compressed if the client accepts it and with an ETag, a matching If-None-Match gets a 304.
     """
-    sensor_geojson_dir = os.path.join(_PARSED_ROOT, "sensor_geojson")
+    sensor_geojson_dir = _SENSOR_GEOJSON_DIR
     
     if not os.path.exists(sensor_geojson_dir):
         raise HTTPException(status_code=404, detail=f"Sensor GeoJSON directory not found at {sensor_geojson_dir}")
@@ -331,38 +588,28 @@ def clients_geojson(
         # Return all sensors combined into one FeatureCollection
         if not available_files:
             raise HTTPException(status_code=404, detail="No GeoJSON files found in sensor directory")
-        
-        combined_features = []
-        for filename in sorted(available_files):
-            file_path = os.path.join(sensor_geojson_dir, filename)
-            try:
-                with open(file_path, "r", encoding="utf-8") as fh:
-                    data = json.load(fh)
-                    if data.get("type") == "FeatureCollection" and "features" in data:
-                        combined_features.extend(data["features"])
-                    elif data.get("type") == "Feature":
-                        combined_features.append(data)
-            except Exception as e:
-                # Skip files that can't be loaded but don't fail completely
-                continue
-        
-        combined_geojson = {
-            "type": "FeatureCollection",
-            "features": combined_features,
-            "metadata": {
-                "total_sensors": len(combined_features),
-                "source_files": len(available_files),
-                "description": "Combined sensor coverage areas from all available sensors"
-            }
-        }
-        
-        return jsonable_encoder(combined_geojson)
+        try:
+            boxes = coverage_geojson.parse_bbox(bbox) if bbox else None
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid bbox '{bbox}': {exc}")
+
+        body = _COVERAGE.response(boxes, tolerance)
+        use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+        # gzip and plain body are different representations and need different ETags
+        etag = body.etag[:-1] + '-gz"' if use_gzip else body.etag
+        headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+        if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            return Response(content=body.gzip, media_type="application/json", headers=headers)
+        return Response(content=body.raw, media_type="application/json", headers=headers)
 
 
 @app.get("/clients")
 def clients():
     feather_path = os.path.join(_PARSED_ROOT, "clients.feather")
-    df = pd.read_feather(feather_path)
+    df = _load_feather(feather_path)
     # Convert binary _id to string and handle numpy arrays
     df_tst_clean = df.copy()
     if '_id' in df_tst_clean.columns:
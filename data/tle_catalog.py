@@ -0,0 +1,185 @@
+"""In-memory catalog of the TLEs written by `ideas/step1_pull/tle_pull.py`.
+
+The catalog loads `tles.json` once and reloads it when the file changes. Every load builds an
+immutable snapshot with per-system and per-type buckets, a NORAD id map and a name index, so
+`/tle` never reads the file or scans all entries per request.
+"""
+from typing import Optional, List, Tuple
+import os
+import json
+import time
+import bisect
+import threading
+from collections import OrderedDict
+
+
+# Systems that get their own bucket, everything else is "other"
+KNOWN_SYSTEMS = ("iridium", "starlink", "orbcomm", "oneweb", "globalstar")
+# Seconds the file is not stat'ed again
+_STAT_TTL = 2.0
+# Number of serialized responses kept per snapshot
+_RESPONSE_CACHE_SIZE = 256
+
+
+class _Snapshot:
+    """Indexes of one version of the TLE file, never modified after it was built."""
+
+    def __init__(self, items: List[dict], key: tuple):
+        self.key = key
+        self.items = items
+        self.systems = [item.get("system", "").lower() for item in items]
+        self.types = [item.get("type") for item in items]
+
+        self.by_system = {}
+        for i, system in enumerate(self.systems):
+            bucket = system if system in KNOWN_SYSTEMS else "other"
+            self.by_system.setdefault(bucket, []).append(i)
+            if bucket == "other" and system and system != "other":
+                self.by_system.setdefault(system, []).append(i)
+
+        self.by_norad = {}
+        for i, item in enumerate(items):
+            try:
+                self.by_norad[int(item.get("line1", "")[2:7])] = i
+            except ValueError:
+                pass
+
+        # All lower case names in one string, a substring search is a single str.find per match
+        names = [item.get("name", "").lower() for item in items]
+        self.name_starts = []
+        position = 0
+        for name in names:
+            self.name_starts.append(position)
+            position += len(name) + 1
+        self.names = "\n".join(names)
+        # (lower case name, index) sorted for prefix searches
+        self.sorted_names = sorted((name, i) for i, name in enumerate(names))
+
+        self.responses = OrderedDict()
+        self.satrecs = {}
+        self.lock = threading.Lock()
+
+    def search_substring(self, text: str) -> List[int]:
+        """Indices of all entries whose name contains text (case-insensitive), in file order."""
+        text = text.lower()
+        if "\n" in text:
+            return []
+        found = []
+        position = self.names.find(text)
+        while position != -1:
+            i = bisect.bisect_right(self.name_starts, position) - 1
+            found.append(i)
+            # Continue after the name, every entry is reported once
+            next_start = self.name_starts[i + 1] if i + 1 < len(self.name_starts) else len(self.names)
+            position = self.names.find(text, next_start)
+        return found
+
+    def search_prefix(self, prefix: str) -> List[int]:
+        """Indices of all entries whose name starts with prefix (case-insensitive), in file order."""
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.sorted_names, (prefix, -1))
+        found = []
+        for name, i in self.sorted_names[start:]:
+            if not name.startswith(prefix):
+                break
+            found.append(i)
+        return sorted(found)
+
+    def filter(self, name: Optional[str] = None, prefix: Optional[str] = None, type_filter: Optional[str] = None,
+               system: Optional[str] = None, norad_id: Optional[int] = None) -> List[int]:
+        """Indices of the entries matching all given filters, in file order."""
+        candidates = None
+
+        def narrow(indices: List[int]) -> None:
+            nonlocal candidates
+            if candidates is None:
+                candidates = indices
+            else:
+                keep = set(indices)
+                candidates = [i for i in candidates if i in keep]
+
+        if norad_id is not None:
+            narrow([self.by_norad[norad_id]] if norad_id in self.by_norad else [])
+        if system:
+            narrow(self.by_system.get(system.lower(), []))
+        if prefix:
+            narrow(self.search_prefix(prefix))
+        if name:
+            narrow(self.search_substring(name))
+        if candidates is None:
+            candidates = range(len(self.items))
+        if type_filter:
+            candidates = [i for i in candidates if self.types[i] == type_filter]
+        return list(candidates)
+
+
+class TLECatalog:
+    """TLE entries of a JSON file with fast filters, reloaded when the file changes."""
+
+    def __init__(self, path: str, stat_ttl: float = _STAT_TTL):
+        self.path = path
+        self.stat_ttl = stat_ttl
+        self._snapshot = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> _Snapshot:
+        """Return the indexes of the current version of the file, raises FileNotFoundError or ValueError."""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked < self.stat_ttl:
+            return snapshot
+        with self._lock:
+            st = os.stat(self.path)
+            key = (st.st_mtime_ns, st.st_size)
+            if self._snapshot is None or self._snapshot.key != key:
+                with open(self.path, "r", encoding="utf-8") as fh:
+                    items = json.load(fh)
+                self._snapshot = _Snapshot(items, key)
+            self._checked = time.monotonic()
+            return self._snapshot
+
+    def filter(self, name: Optional[str] = None, prefix: Optional[str] = None, type_filter: Optional[str] = None,
+               system: Optional[str] = None, norad_id: Optional[int] = None) -> List[int]:
+        """Indices of the entries matching all given filters, in file order."""
+        return self.snapshot().filter(name, prefix, type_filter, system, norad_id)
+
+    def response(self, name: Optional[str] = None, prefix: Optional[str] = None, type_filter: Optional[str] = None,
+                 system: Optional[str] = None, norad_id: Optional[int] = None, fields: Optional[Tuple[str]] = None,
+                 limit: Optional[int] = None) -> bytes:
+        """JSON list of the matching entries, serialized once per filter combination and version of the file."""
+        snapshot = self.snapshot()
+        key = (name, prefix, type_filter, system, norad_id, fields, limit)
+        with snapshot.lock:
+            body = snapshot.responses.get(key)
+            if body is not None:
+                snapshot.responses.move_to_end(key)
+                return body
+
+        # indices of the same snapshot, the file may be reloaded in between
+        items = [snapshot.items[i] for i in snapshot.filter(name, prefix, type_filter, system, norad_id)]
+        if fields:
+            items = [{k: item.get(k) for k in fields if k in item} for item in items]
+        if limit is not None:
+            items = items[:limit]
+        body = json.dumps(items).encode("utf-8")
+
+        with snapshot.lock:
+            snapshot.responses[key] = body
+            while len(snapshot.responses) > _RESPONSE_CACHE_SIZE:
+                snapshot.responses.popitem(last=False)
+        return body
+
+    def satrecs(self, indices: List[int]) -> list:
+        """Parsed `sgp4.api.Satrec` objects of the entries, parsed once per version of the file."""
+        from sgp4.api import Satrec
+
+        snapshot = self.snapshot()
+        result = []
+        for i in indices:
+            satrec = snapshot.satrecs.get(i)
+            if satrec is None:
+                item = snapshot.items[i]
+                satrec = Satrec.twoline2rv(item["line1"], item["line2"])
+                snapshot.satrecs[i] = satrec
+            result.append(satrec)
+        return result
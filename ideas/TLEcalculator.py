@@ -10,6 +10,37 @@ from astropy import units as u
 
 import numpy as np
 
+
+# Rotates positions (km) and velocities (km/s) from TEME into ITRS like sgp4lib.TEME_to_ITRF, but for a whole time grid
+# at once. jDay/jDayF have shape (n_times,), pos_TEME/vel_TEME shape (..., n_times, 3), e.g. (n_sats, n_times, 3) as
+# returned by SatrecArray.sgp4. xp/yp are the polar motion in radians. Returns new contiguous arrays of the same shape
+def teme_to_itrs_batch(jDay: np.ndarray, jDayF: np.ndarray, pos_TEME: np.ndarray, vel_TEME: np.ndarray,
+                       xp: float = 0.0, yp: float = 0.0) -> (np.ndarray, np.ndarray):
+    # Greenwich mean sidereal time (GMST 1982) of every time, theta_dot is in rad/day
+    theta, theta_dot = sgp4lib.theta_GMST1982(np.asarray(jDay, dtype=np.float64), np.asarray(jDayF, dtype=np.float64))
+    cos_t = np.cos(theta)
+    sin_t = np.sin(theta)
+    omega = theta_dot / 86400
+
+    pos_ITRS = np.empty_like(pos_TEME, dtype=np.float64, order="C")
+    vel_ITRS = np.empty_like(vel_TEME, dtype=np.float64, order="C")
+    # rotation about z by -theta (TEME -> PEF), z stays the same
+    pos_ITRS[..., 0] = cos_t * pos_TEME[..., 0] + sin_t * pos_TEME[..., 1]
+    pos_ITRS[..., 1] = cos_t * pos_TEME[..., 1] - sin_t * pos_TEME[..., 0]
+    pos_ITRS[..., 2] = pos_TEME[..., 2]
+    # the PEF frame rotates with the earth, subtract the earth's angular velocity x position
+    vel_ITRS[..., 0] = cos_t * vel_TEME[..., 0] + sin_t * vel_TEME[..., 1] + omega * pos_ITRS[..., 1]
+    vel_ITRS[..., 1] = cos_t * vel_TEME[..., 1] - sin_t * vel_TEME[..., 0] - omega * pos_ITRS[..., 0]
+    vel_ITRS[..., 2] = vel_TEME[..., 2]
+
+    if xp != 0.0 or yp != 0.0:
+        # polar motion (PEF -> ITRS) is the same rotation for all times
+        W = sgp4lib.rot_x(yp).dot(sgp4lib.rot_y(xp))
+        pos_ITRS = np.ascontiguousarray(pos_ITRS @ W.T)
+        vel_ITRS = np.ascontiguousarray(vel_ITRS @ W.T)
+    return pos_ITRS, vel_ITRS
+
+
 # The SGP4 propagator returns raw x,y,z Cartesian coordinates in a “True Equator Mean Equinox” (TEME)
 # reference frame that’s centered on the Earth but does not rotate with it — an “Earth centered inertial” (ECI)
 # reference frame.
@@ -102,6 +133,34 @@ class TLEcalculator:
         err, pos, vel = self.satrec.sgp4(np.array(jTimeDay), np.array(jTimeFr))
         return pos, vel
 
+    # Propagates all satellites over a grid of times, jTimeDay/jTimeFr have shape (n_times,) (see time_grid).
+    # Returns err (n_sats, n_times) and contiguous pos (km) and vel (km/s) arrays of shape (n_sats, n_times, 3), in
+    # ITRS if itrs is True and in TEME otherwise. Positions of satellites with err != 0 are NaN
+    def propagate_batch(self, jTimeDay: np.ndarray, jTimeFr: np.ndarray, itrs: bool = True, xp: float = 0.0,
+                        yp: float = 0.0) -> (np.ndarray, np.ndarray, np.ndarray):
+        jTimeDay = np.ascontiguousarray(jTimeDay, dtype=np.float64)
+        jTimeFr = np.ascontiguousarray(jTimeFr, dtype=np.float64)
+        err, pos, vel = self.satrec.sgp4(jTimeDay, jTimeFr)
+        if itrs:
+            pos, vel = teme_to_itrs_batch(jTimeDay, jTimeFr, pos, vel, xp, yp)
+        return err, pos, vel
+
+    # Same as propagate_batch, but yields (index of the first time, err, pos, vel) for chunk_size times at once.
+    # A whole grid rarely fits into memory: 10k satellites for 1 day at 1 s are ~20 GB per array
+    def propagate_chunks(self, jTimeDay: np.ndarray, jTimeFr: np.ndarray, chunk_size: int = 60, itrs: bool = True,
+                         xp: float = 0.0, yp: float = 0.0):
+        for start in range(0, len(jTimeDay), chunk_size):
+            err, pos, vel = self.propagate_batch(jTimeDay[start:start + chunk_size], jTimeFr[start:start + chunk_size],
+                                                 itrs, xp, yp)
+            yield start, err, pos, vel
+
+    # Returns (jTimeDay, jTimeFr) arrays of a time grid starting at jDay + jDayF, duration and step are in seconds.
+    # The fraction is kept in [0, 1), the sum of both would lose ~20 us of precision
+    def time_grid(self, jDay: float, jDayF: float, duration: float, step: float) -> (np.ndarray, np.ndarray):
+        fractions = jDayF + np.arange(0, duration, step, dtype=np.float64) * self.one_sec_jDay
+        days = np.floor(fractions)
+        return jDay + days, fractions - days
+
     #"utc_time_to_jDay"
     def abs_time_to_jDay(self, year: int, month: int, day: int, hour:int, minute: int, second: int) -> (float, float):
         return jday(year, month, day, hour, minute, second)
@@ -126,17 +185,13 @@ class TLEcalculator:
 
 
 
+    # pos_TEME/vel_TEME have shape (n_sats, 3), all satellites are rotated at once (see teme_to_itrs_batch)
     def TEME_2_ITRS(self, jDay: float, jDayF: float, pos_TEME: [float], vel_TEME: [float]):
-        pos_TEME = np.array(pos_TEME)
-        vel_TEME = np.array(vel_TEME)
-        pos_ITRS = []
-        vel_ITRS = []
-        for sat_index in range(len(pos_TEME)):
-            pos_temp, vel_temp = sgp4lib.TEME_to_ITRF(jDay + jDayF, np.asarray(pos_TEME[sat_index,:]), np.asarray(vel_TEME[sat_index,:]) * 86400)
-            vel_temp = vel_temp / 86400
-            pos_ITRS.append(pos_temp)
-            vel_ITRS.append(vel_temp)
-        return np.array(pos_ITRS), np.array(vel_ITRS)
+        pos_TEME = np.asarray(pos_TEME, dtype=np.float64)
+        vel_TEME = np.asarray(vel_TEME, dtype=np.float64)
+        pos_ITRS, vel_ITRS = teme_to_itrs_batch(np.array([jDay]), np.array([jDayF]), pos_TEME[:, np.newaxis, :],
+                                                vel_TEME[:, np.newaxis, :])
+        return pos_ITRS[:, 0, :], vel_ITRS[:, 0, :]
 
     def epoch_to_utc(self, epochYr: int, epochDay: float)-> (int, int, int, int, int):
         # returns (month, day, hour, minute, second)
@@ -188,17 +243,14 @@ class TLEcalculator:
         
         #find satellites with positive distance (negative distance = below plane = below horizon)
         index_positives = np.nonzero(signed_distances > 0)[0] #index of satellites with non-negative distance
-        visible_satellites = []
-        vis_sat_pos_ITRS = []
-        for index in list(index_positives):
-            #sat_pos_ITRS = pos_ITRS[index, :]
-            sat_pos_ITRS = coord.ITRS(x=pos_ITRS[index, 0]*u.km,y=pos_ITRS[index, 1]*u.km,z=pos_ITRS[index, 2]*u.km,representation_type="cartesian")
-            sat_name = self.sat_names[index]
-            sat_distance = signed_distances[index]
-            visible_satellites.append((sat_distance, sat_name, sat_pos_ITRS)) #sat_pos_ITRS.tolist()
-            vis_sat_pos_ITRS.append(sat_pos_ITRS)
-
-        visible_satellites = sorted(visible_satellites, reverse=True) #sorted descending i.e. 1st satellite: biggest distance i.e. best match as close to the plane = close to the horizon
+        # one ITRS object for all visible satellites, sorted descending by distance
+        index_positives = index_positives[np.argsort(-signed_distances[index_positives], kind="stable")]
+        vis_pos_ITRS = pos_ITRS[index_positives]
+        vis_sat_pos_ITRS = coord.ITRS(x=vis_pos_ITRS[:, 0]*u.km, y=vis_pos_ITRS[:, 1]*u.km, z=vis_pos_ITRS[:, 2]*u.km,
+                                      representation_type="cartesian")
+        visible_satellites = [(signed_distances[index], self.sat_names[index], vis_sat_pos_ITRS[k])
+                              for k, index in enumerate(index_positives)]
+        #sorted descending i.e. 1st satellite: biggest distance i.e. best match as close to the plane = close to the horizon
         #print(f'{visible_satellites}\n')
         return visible_satellites #shape: [(distance, name, pos_ITRS)]
 
@@ -0,0 +1,68 @@
+import argparse
+import time
+import numpy as np
+import skyfield.sgp4lib as sgp4lib
+from sgp4.api import SatrecArray
+
+from TLEcalculator import TLEcalculator, teme_to_itrs_batch
+
+# Benchmark of the batch propagation of TLEcalculator: propagates --sats satellites over --duration seconds at --step
+# seconds resolution into ITRS, chunk by chunk, and compares a sample with the per-satellite rotation of sgp4lib.
+# Default is 10k satellites x 1 day at 1 s, run from the ideas folder:
+#   python benchmark_propagation.py --tle step1_pull/output/active_leos.tle
+
+parser = argparse.ArgumentParser(description="Benchmark of TLEcalculator.propagate_chunks")
+parser.add_argument("--tle", default="step1_pull/output/active_leos.tle", help="TLE file (3 lines per satellite)")
+parser.add_argument("--sats", type=int, default=10000, help="number of satellites")
+parser.add_argument("--duration", type=float, default=86400, help="length of the time grid in seconds")
+parser.add_argument("--step", type=float, default=1, help="resolution of the time grid in seconds")
+parser.add_argument("--chunk", type=int, default=60, help="times per chunk")
+args = parser.parse_args()
+
+calculator = TLEcalculator(args.tle, verbose=False)
+sat_list = calculator.satList[:args.sats]
+# repeat the satellites of the file if it has less
+sat_list = [sat_list[i % len(sat_list)] for i in range(args.sats)]
+calculator.update_sat_list([calculator.sat_names[i % len(calculator.sat_names)] for i in range(args.sats)], sat_list)
+
+first = calculator.satList[0]
+jDay, jDayF = calculator.time_grid(first.jdsatepoch, first.jdsatepochF, args.duration, args.step)
+print(f"{args.sats} satellites x {len(jDay)} times ({args.sats * len(jDay) / 1e6:.1f} M positions), "
+      f"chunks of {args.chunk} times ({args.sats * args.chunk * 3 * 8 * 2 / 1e6:.0f} MB pos+vel)")
+
+# accuracy: a few chunks against sgp4lib.TEME_to_ITRF, one satellite and time at a time
+sample_sats = np.linspace(0, args.sats - 1, 20).astype(int)
+err, pos, vel = calculator.propagate_batch(jDay[:args.chunk], jDayF[:args.chunk])
+_, pos_TEME, vel_TEME = SatrecArray([calculator.satList[i] for i in sample_sats]).sgp4(jDay[:args.chunk],
+                                                                                       jDayF[:args.chunk])
+max_error = 0.0
+for k, sat_index in enumerate(sample_sats):
+    for t in range(0, args.chunk, 7):
+        ref_pos, _ = sgp4lib.TEME_to_ITRF(jDay[t], pos_TEME[k, t], vel_TEME[k, t] * 86400, fraction_ut1=jDayF[t])
+        if not np.isnan(ref_pos).any():
+            max_error = max(max_error, np.abs(ref_pos - pos[sat_index, t]).max())
+print(f"max difference to sgp4lib.TEME_to_ITRF: {max_error * 1e6:.3f} mm")
+
+# reference: the per-satellite rotation TEME_2_ITRS used before, for one time step
+start = time.perf_counter()
+_, pos_TEME, vel_TEME = calculator.satrec.sgp4(jDay[:1], jDayF[:1])
+for sat_index in range(args.sats):
+    sgp4lib.TEME_to_ITRF(jDay[0] + jDayF[0], pos_TEME[sat_index, 0], vel_TEME[sat_index, 0] * 86400)
+per_step = time.perf_counter() - start
+print(f"per-satellite rotation: {per_step * 1e3:.1f} ms per time step, ~{per_step * len(jDay) / 3600:.1f} h for the grid")
+
+# batch propagation of the whole grid
+rotation = 0.0
+failed = 0
+start = time.perf_counter()
+for first_index, err, pos, vel in calculator.propagate_chunks(jDay, jDayF, args.chunk, itrs=False):
+    # rotated separately to time both steps, propagate_chunks(itrs=True) does the same
+    t0 = time.perf_counter()
+    teme_to_itrs_batch(jDay[first_index:first_index + args.chunk], jDayF[first_index:first_index + args.chunk], pos, vel)
+    rotation += time.perf_counter() - t0
+    failed += np.count_nonzero(err)
+total = time.perf_counter() - start
+propagation = total - rotation
+positions = args.sats * len(jDay)
+print(f"batch: {total:.1f} s total ({positions / total / 1e6:.1f} M positions/s), "
+      f"sgp4 {propagation:.1f} s, TEME->ITRS {rotation:.1f} s, {failed} positions with sgp4 errors")
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from TLEcalculator import TLEcalculator
+import pass_predictor
+
+# Observed vs expected coverage of the jobs: which Iridium satellites each sensor could have seen during a job
+# (predicted passes, see pass_predictor) and which of them it received (IRA/IBC frames, see ira_parser of the analyser).
+#
+# The frames only contain the Iridium internal satellite id, not the NORAD id of the TLEs. Ring alerts of beam 0 carry
+# the position of the satellite itself, identify_satellites matches them against the predicted positions of all
+# Iridium satellites and maps every sat_id to the TLE satellite that was closest most of the time.
+
+# Iridium terminals see satellites down to 8.2 deg elevation
+IRIDIUM_MIN_ELEVATION = 8.2
+# ring alert positions are in units of 4 km, positions above this altitude are satellites (below: spot beams)
+IRA_POS_UNIT = 4
+MIN_SAT_ALTITUDE = 400
+# a ring alert position farther than this from every predicted satellite isn't used to identify satellites
+MAX_MATCH_ANGLE = 2.0  # deg
+# share of the matched ring alerts of a sat_id that have to agree on the TLE satellite
+MIN_MATCH_SHARE = 0.5
+
+coverage_pass_columns = ["job_name"] + pass_predictor.pass_columns + ["frames", "first_seen", "last_seen", "received"]
+coverage_satellite_columns = ["job_name", "sensor", "satellite", "satnum", "expected_passes", "received_passes",
+                              "detection_ratio", "frames", "unexpected_frames", "first_seen", "last_seen"]
+
+
+# returns sgp4 (jDay, jDayF) arrays of unix times
+def unix_to_jDay(times) -> (np.ndarray, np.ndarray):
+    times = np.asarray(times, dtype=np.float64)
+    days = np.floor(times / 86400)
+    return pass_predictor.UNIX_EPOCH_JD + days, times / 86400 - days
+
+
+# returns a TLEcalculator with only the Iridium satellites of calculator
+def iridium_only(calculator: TLEcalculator) -> TLEcalculator:
+    keep = [i for i, name in enumerate(calculator.sat_names) if name.startswith("IRIDIUM")]
+    iridium = TLEcalculator(None, warnings=calculator.warnings, verbose=calculator.verbose)
+    iridium.update_sat_list([calculator.sat_names[i] for i in keep], [calculator.satList[i] for i in keep])
+    return iridium
+
+
+# maps the sat_id of the frames to TLE satellite names, frames need the columns time, sat_id, sat_pos (xyz of the
+# ring alert) and sat_alt. Only satellite positions (not spot beams) are used, all satellites are propagated once per
+# second that has such a frame. Returns dataframe with sat_id, satellite, satnum, matches and share
+def identify_satellites(calculator: TLEcalculator, frames: pd.DataFrame, chunk_size: int = 600) -> pd.DataFrame:
+    columns = ["sat_id", "satellite", "satnum", "matches", "share"]
+    frames = frames[(frames["sat_alt"] > MIN_SAT_ALTITUDE) & frames["sat_id"].notna()]
+    if len(frames) == 0 or len(calculator.satList) == 0:
+        return pd.DataFrame(columns=columns)
+
+    positions = np.stack(frames["sat_pos"].to_numpy()).astype(np.float64) * IRA_POS_UNIT
+    directions = positions / np.linalg.norm(positions, axis=1, keepdims=True)
+    seconds, time_index = np.unique(np.round(frames["time"].to_numpy(dtype=np.float64)), return_inverse=True)
+    jDays, jDayFs = unix_to_jDay(seconds)
+
+    # frames sorted by their second, every chunk of seconds is one slice of them
+    order = np.argsort(time_index, kind="stable")
+    bounds = np.searchsorted(time_index[order], np.arange(0, len(seconds) + chunk_size, chunk_size))
+    nearest = np.full(len(frames), -1, dtype=np.int64)
+    for first, err, pos, vel in calculator.propagate_chunks(jDays, jDayFs, chunk_size):
+        rows = order[bounds[first // chunk_size]:bounds[first // chunk_size + 1]]
+        sat_pos = pos[:, time_index[rows] - first, :]  # (n_sats, n_frames, 3)
+        cosine = np.einsum("sfk,fk->sf", sat_pos, directions[rows]) / np.linalg.norm(sat_pos, axis=2)
+        best = np.nanargmax(np.nan_to_num(cosine, nan=-1), axis=0)
+        angle = np.degrees(np.arccos(np.clip(cosine[best, np.arange(len(rows))], -1, 1)))
+        nearest[rows] = np.where(angle <= MAX_MATCH_ANGLE, best, -1)
+
+    votes = pd.DataFrame({"sat_id": frames["sat_id"].to_numpy(dtype=np.int64), "sat_index": nearest})
+    votes = votes[votes["sat_index"] >= 0]
+    counts = votes.groupby(["sat_id", "sat_index"]).size().rename("matches").reset_index()
+    counts["share"] = counts["matches"] / counts.groupby("sat_id")["matches"].transform("sum")
+    best = counts.sort_values(["sat_id", "matches"], ascending=[True, False]).drop_duplicates("sat_id")
+    best = best[best["share"] > MIN_MATCH_SHARE]
+    best["satellite"] = [calculator.sat_names[i] for i in best["sat_index"]]
+    best["satnum"] = [calculator.satList[i].satnum for i in best["sat_index"]]
+    return best[columns].reset_index(drop=True)
+
+
+# Observed vs expected coverage of every job of frames (columns time, job_name, sensor_name, sat_id, sat_pos, sat_alt;
+# IBC frames without position need sat_id only). receivers are {sensor name: (lat, lon, height in m)}, jobs of other
+# sensors are skipped. job_windows has one row per scheduled (job_name, sensor_name) with start_time and end_time in
+# unix seconds, e.g. from the dashboard DB:
+#   SELECT s.job_name, s.sensor_name, j.start_time, j.end_time FROM jobs j JOIN job_sensors s ON s.job_name = j.name
+# The passes of each job are predicted over its scheduled window, so passes missed at the start or end and jobs
+# without any frame show up as not received. Jobs of frames that have no window fall back to the time span of their
+# frames. Frames are assigned to the passes with a PassIndex (binary search over the rise times).
+# Returns (passes, satellites): one row per expected pass with the number of frames received during it, and one row
+# per (job, satellite) with expected/received passes, detection ratio and first/last seen times
+def job_coverage(calculator: TLEcalculator, frames: pd.DataFrame, receivers: dict, job_windows: pd.DataFrame,
+                 step: float = 10, min_elevation: float = IRIDIUM_MIN_ELEVATION,
+                 sat_ids: pd.DataFrame = None) -> (pd.DataFrame, pd.DataFrame):
+    iridium = iridium_only(calculator)
+    if sat_ids is None:
+        sat_ids = identify_satellites(iridium, frames)
+    frames = frames.assign(sat_id=frames["sat_id"].astype("Int64"))
+    frames = frames.merge(sat_ids[["sat_id", "satellite"]].astype({"sat_id": "Int64"}), on="sat_id", how="left")
+    satnums = dict(zip(iridium.sat_names, [sat.satnum for sat in iridium.satList]))
+
+    windows = {(job_name, sensor): (start, end) for job_name, sensor, start, end in
+               job_windows[["job_name", "sensor_name", "start_time", "end_time"]].itertuples(index=False)}
+    groups = frames.groupby(["job_name", "sensor_name"], sort=True).indices
+    no_frames = frames.iloc[0:0]
+
+    pass_tables = []
+    satellite_tables = []
+    for job_name, sensor in sorted(set(windows) | set(groups)):
+        if sensor not in receivers:
+            print(f"Warning: No location of sensor {sensor}, skipped job {job_name}")
+            continue
+        job_frames = frames.iloc[groups[(job_name, sensor)]] if (job_name, sensor) in groups else no_frames
+        start, end = windows.get((job_name, sensor), (np.nan, np.nan))
+        if pd.isna(start) or pd.isna(end):
+            if len(job_frames) == 0:
+                print(f"Warning: No time window of job {job_name}, skipped it")
+                continue
+            start, end = job_frames["time"].min(), job_frames["time"].max()
+        start = float(start)
+        duration = float(end) - start + step
+        passes = pass_predictor.predict_passes(iridium, {sensor: receivers[sensor]}, start, duration, step,
+                                               min_elevation)
+        index = pass_predictor.PassIndex(passes)
+        job_frames = index.join(job_frames.dropna(subset=["satellite"]), sensor_col="sensor_name")
+
+        received = job_frames[job_frames["pass_id"] >= 0].groupby("pass_id")["time"].agg(["size", "min", "max"])
+        passes["frames"] = received["size"].reindex(passes.index, fill_value=0).to_numpy()
+        passes["first_seen"] = received["min"].reindex(passes.index).to_numpy()
+        passes["last_seen"] = received["max"].reindex(passes.index).to_numpy()
+        passes["received"] = passes["frames"] > 0
+        passes.insert(0, "job_name", job_name)
+        pass_tables.append(passes)
+
+        # satellites that were received without a predicted pass are listed as well
+        satellites = passes.groupby("satellite").agg(expected_passes=("rise", "size"),
+                                                     received_passes=("received", "sum"), frames=("frames", "sum"))
+        seen = job_frames.groupby("satellite")["time"].agg(first_seen="min", last_seen="max", observed_frames="size")
+        satellites = satellites.join(seen, how="outer").rename_axis("satellite").reset_index()
+        for col in ["expected_passes", "received_passes", "frames", "observed_frames"]:
+            satellites[col] = satellites[col].fillna(0).astype(np.int64)
+        satellites["sensor"] = sensor
+        satellites["satnum"] = satellites["satellite"].map(satnums)
+        satellites["detection_ratio"] = satellites["received_passes"] / satellites["expected_passes"].replace(0, np.nan)
+        satellites["unexpected_frames"] = satellites.pop("observed_frames") - satellites["frames"]
+        satellites.insert(0, "job_name", job_name)
+        satellite_tables.append(satellites[coverage_satellite_columns])
+
+    if not pass_tables:
+        return pd.DataFrame(columns=coverage_pass_columns), pd.DataFrame(columns=coverage_satellite_columns)
+    return pd.concat(pass_tables, ignore_index=True), pd.concat(satellite_tables, ignore_index=True)
+
+
+# stores the result of job_coverage as coverage_passes.parquet and coverage_satellites.parquet in output_folder
+def write_coverage(passes: pd.DataFrame, satellites: pd.DataFrame, output_folder):
+    passes.to_parquet(f"{output_folder}/coverage_passes.parquet", index=False)
+    satellites.to_parquet(f"{output_folder}/coverage_satellites.parquet", index=False)
+
+
+# reads the result of write_coverage, optionally only of one job
+def read_coverage(output_folder, job_name: str = None) -> (pd.DataFrame, pd.DataFrame):
+    filters = [("job_name", "==", job_name)] if job_name is not None else None
+    return (pd.read_parquet(f"{output_folder}/coverage_passes.parquet", filters=filters),
+            pd.read_parquet(f"{output_folder}/coverage_satellites.parquet", filters=filters))
@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+
+from TLEcalculator import TLEcalculator
+
+# Predicts the passes of all satellites of a TLEcalculator over several receivers (sensors) in a time window.
+# All satellites are propagated once per chunk of times (TLEcalculator.propagate_chunks), elevation and azimuth of
+# all (satellite, time) pairs are computed for every receiver at once and the intervals above min_elevation are
+# extracted as passes (rise, culmination, set). The passes are kept in a PassIndex, so "which satellites could the
+# sensor see at time t" or "was this frame received during a pass" are interval lookups instead of propagations.
+
+# WGS84 ellipsoid
+WGS84_A = 6378.137  # km
+WGS84_F = 1 / 298.257223563
+UNIX_EPOCH_JD = 2440587.5
+
+pass_columns = ["sensor", "satellite", "satnum", "rise", "culmination", "set", "max_elevation", "rise_azimuth",
+                "set_azimuth", "partial"]
+
+
+# returns the ITRS position (km) of a location and the rotation matrix ITRS -> (east, north, up) of it
+# lat/lon in deg, height in m
+def receiver_frame(lat: float, lon: float, height: float) -> (np.ndarray, np.ndarray):
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    e2 = WGS84_F * (2 - WGS84_F)
+    n = WGS84_A / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+    h = height / 1000
+    pos = np.array([(n + h) * np.cos(lat) * np.cos(lon),
+                    (n + h) * np.cos(lat) * np.sin(lon),
+                    (n * (1 - e2) + h) * np.sin(lat)])
+    enu = np.array([[-np.sin(lon), np.cos(lon), 0.0],
+                    [-np.sin(lat) * np.cos(lon), -np.sin(lat) * np.sin(lon), np.cos(lat)],
+                    [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]])
+    return pos, enu
+
+
+# returns elevation and azimuth in deg (shape (n_sats, n_times)) of ITRS positions (n_sats, n_times, 3) seen from a
+# receiver (see receiver_frame), azimuth is clockwise from north
+def elevation_azimuth(pos_ITRS: np.ndarray, rec_pos: np.ndarray, rec_enu: np.ndarray) -> (np.ndarray, np.ndarray):
+    local = (pos_ITRS - rec_pos) @ rec_enu.T
+    east, north, up = local[..., 0], local[..., 1], local[..., 2]
+    elevation = np.degrees(np.arctan2(up, np.hypot(east, north)))
+    azimuth = np.degrees(np.arctan2(east, north)) % 360
+    return elevation, azimuth
+
+
+# time at which elevation crosses min_elevation between two samples, linearly interpolated
+def _crossing(t0, t1, el0, el1, min_elevation):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.clip((min_elevation - el0) / (el1 - el0), 0, 1)
+    return t0 + np.nan_to_num(fraction) * (t1 - t0)
+
+
+# passes of all satellites over one receiver, chunk by chunk. The state of the passes that are still in progress at
+# the end of a chunk is carried over to the next one
+class _ReceiverPasses:
+    def __init__(self, name: str, lat: float, lon: float, height: float, n_sats: int, min_elevation: float):
+        self.name = name
+        self.pos, self.enu = receiver_frame(lat, lon, height)
+        self.min_elevation = min_elevation
+        self.last_el = None  # elevation of the last time of the previous chunk
+        self.last_az = None
+        self.last_time = None
+        # passes in progress
+        self.open_rise = np.full(n_sats, np.nan)
+        self.open_rise_az = np.full(n_sats, np.nan)
+        self.open_partial = np.zeros(n_sats, dtype=bool)
+        self.open_max_el = np.full(n_sats, -np.inf)
+        self.open_max_time = np.full(n_sats, np.nan)
+        self.passes = []
+
+    def add_chunk(self, times: np.ndarray, pos_ITRS: np.ndarray):
+        el, az = elevation_azimuth(pos_ITRS, self.pos, self.enu)
+        if self.last_el is None:
+            # satellites above the horizon at the start of the window rise at its start
+            self.last_el, self.last_az, self.last_time = el[:, 0], az[:, 0], times[0]
+            self.open_rise[:] = times[0]
+            self.open_rise_az[:] = az[:, 0]
+            self.open_partial[:] = True
+
+        # column 0 is the last time of the previous chunk
+        el_ext = np.concatenate([self.last_el[:, None], el], axis=1)
+        az_ext = np.concatenate([self.last_az[:, None], az], axis=1)
+        times_ext = np.concatenate([[self.last_time], times])
+        above = el_ext >= self.min_elevation  # NaN (sgp4 errors) is never above
+
+        # runs of consecutive times above min_elevation: [start, end) per satellite
+        steps = np.diff(above.astype(np.int8), axis=1, prepend=0, append=0)
+        run_sat, run_start = np.nonzero(steps == 1)
+        _, run_end = np.nonzero(steps == -1)
+
+        # culmination of every run: highest elevation, first one on ties
+        visible = np.flatnonzero(above)
+        run_ids = np.cumsum((steps[:, :-1] == 1).ravel()[visible]) - 1
+        order = np.lexsort((-el_ext.ravel()[visible], run_ids))
+        _, first = np.unique(run_ids[order], return_index=True)
+        peak = visible[order[first]] % el_ext.shape[1]
+        peak_el = el_ext[run_sat, peak]
+        peak_time = times_ext[peak]
+
+        # runs that start in column 0 continue a pass of the previous chunk, the others start with a rise
+        continued = run_start == 0
+        rising = ~continued
+        rise = np.where(continued, self.open_rise[run_sat], np.nan)
+        rise[rising] = _crossing(times_ext[run_start[rising] - 1], times_ext[run_start[rising]],
+                                 el_ext[run_sat[rising], run_start[rising] - 1],
+                                 el_ext[run_sat[rising], run_start[rising]], self.min_elevation)
+        rise_az = np.where(continued, self.open_rise_az[run_sat], az_ext[run_sat, run_start])
+        partial = continued & self.open_partial[run_sat]
+        higher = ~continued | (peak_el > self.open_max_el[run_sat])
+        max_el = np.where(higher, peak_el, self.open_max_el[run_sat])
+        max_time = np.where(higher, peak_time, self.open_max_time[run_sat])
+
+        # runs that end before the last column are finished passes
+        finished = run_end < el_ext.shape[1]
+        f_sat, f_end = run_sat[finished], run_end[finished]
+        set_time = _crossing(times_ext[f_end - 1], times_ext[f_end], el_ext[f_sat, f_end - 1], el_ext[f_sat, f_end],
+                             self.min_elevation)
+        self.passes.append(pd.DataFrame({"sat_index": f_sat, "rise": rise[finished], "culmination": max_time[finished],
+                                         "set": set_time, "max_elevation": max_el[finished],
+                                         "rise_azimuth": rise_az[finished], "set_azimuth": az_ext[f_sat, f_end - 1],
+                                         "partial": partial[finished]}))
+
+        # the others are still in progress
+        running = ~finished
+        r_sat = run_sat[running]
+        self.open_rise[r_sat] = rise[running]
+        self.open_rise_az[r_sat] = rise_az[running]
+        self.open_partial[r_sat] = partial[running]
+        self.open_max_el[r_sat] = max_el[running]
+        self.open_max_time[r_sat] = max_time[running]
+        self.last_el, self.last_az, self.last_time = el[:, -1], az[:, -1], times[-1]
+
+    # passes still in progress at the end of the window set at its end
+    def finish(self) -> pd.DataFrame:
+        r_sat = np.flatnonzero(self.last_el >= self.min_elevation) if self.last_el is not None else np.array([], int)
+        self.passes.append(pd.DataFrame({"sat_index": r_sat, "rise": self.open_rise[r_sat],
+                                         "culmination": self.open_max_time[r_sat],
+                                         "set": np.full(len(r_sat), self.last_time),
+                                         "max_elevation": self.open_max_el[r_sat],
+                                         "rise_azimuth": self.open_rise_az[r_sat],
+                                         "set_azimuth": self.last_az[r_sat] if len(r_sat) else np.array([]),
+                                         "partial": np.ones(len(r_sat), dtype=bool)}))
+        passes = pd.concat(self.passes, ignore_index=True)
+        passes["sensor"] = self.name
+        return passes
+
+
+# Predicts the passes of all satellites of calculator over receivers {sensor name: (lat, lon, height in m)} from
+# the unix time start for duration seconds, sampled every step seconds. Passes that are in progress at the start or
+# end of the window are cut at the window and marked partial. Returns a dataframe with pass_columns, times are unix
+# times (rise/set interpolated between the samples), angles in deg
+def predict_passes(calculator: TLEcalculator, receivers: dict, start: float, duration: float, step: float = 10,
+                   min_elevation: float = 0.0, chunk_size: int = 360) -> pd.DataFrame:
+    jDay, jDayF = calculator.utc_timestamp_to_jDay(int(start))
+    jDays, jDayFs = calculator.time_grid(jDay, jDayF + (start - int(start)) / 86400, duration, step)
+    times = (jDays - UNIX_EPOCH_JD + jDayFs) * 86400
+
+    n_sats = len(calculator.satList)
+    states = [_ReceiverPasses(name, *location, n_sats, min_elevation) for name, location in receivers.items()]
+    for first, err, pos, vel in calculator.propagate_chunks(jDays, jDayFs, chunk_size):
+        chunk_times = times[first:first + chunk_size]
+        for state in states:
+            state.add_chunk(chunk_times, pos)
+
+    passes = pd.concat([state.finish() for state in states], ignore_index=True)
+    sat_index = passes.pop("sat_index").to_numpy(dtype=np.int64)
+    passes["satellite"] = np.asarray(calculator.sat_names, dtype=object)[sat_index]
+    passes["satnum"] = np.array([calculator.satList[i].satnum for i in sat_index], dtype=np.int64)
+    return passes[pass_columns].sort_values(by=["sensor", "rise"], kind="stable").reset_index(drop=True)
+
+
+# Interval index of predicted passes (see predict_passes) keyed by (sensor, satellite). The passes of one satellite
+# over one sensor never overlap, a lookup is a binary search over their rise times
+class PassIndex:
+    def __init__(self, passes: pd.DataFrame, key: str = "satellite"):
+        self.passes = passes.reset_index(drop=True)
+        self.key = key
+        self.intervals = {}
+        for group, df in self.passes.groupby(["sensor", key], sort=False):
+            df = df.sort_values(by="rise")
+            self.intervals[group] = (df["rise"].to_numpy(), df["set"].to_numpy(), df.index.to_numpy())
+        # per sensor all passes sorted by rise, for visible(); no pass is longer than max_duration
+        self.by_sensor = {}
+        for sensor, df in self.passes.groupby("sensor", sort=False):
+            df = df.sort_values(by="rise")
+            self.by_sensor[sensor] = (df["rise"].to_numpy(), df["set"].to_numpy(), df.index.to_numpy())
+        self.max_duration = float((self.passes["set"] - self.passes["rise"]).max()) if len(self.passes) else 0.0
+
+    @classmethod
+    def read(cls, path, key: str = "satellite"):
+        return cls(pd.read_parquet(path), key)
+
+    def write(self, path):
+        self.passes.to_parquet(path, index=False)
+
+    # row of the pass of satellite over sensor at every time in times, -1 where the satellite wasn't visible
+    def lookup(self, sensor: str, satellite, times) -> np.ndarray:
+        times = np.asarray(times, dtype=np.float64)
+        intervals = self.intervals.get((sensor, satellite))
+        if intervals is None:
+            return np.full(times.shape, -1, dtype=np.int64)
+        rise, set_, rows = intervals
+        i = np.searchsorted(rise, times, side="right") - 1
+        inside = (i >= 0) & (times <= set_[np.maximum(i, 0)])
+        return np.where(inside, rows[np.maximum(i, 0)], -1)
+
+    # passes of all satellites that are above the horizon of sensor at time t
+    def visible(self, sensor: str, t: float) -> pd.DataFrame:
+        if sensor not in self.by_sensor:
+            return self.passes.iloc[0:0]
+        rise, set_, rows = self.by_sensor[sensor]
+        lo = np.searchsorted(rise, t - self.max_duration, side="left")
+        hi = np.searchsorted(rise, t, side="right")
+        candidates = np.arange(lo, hi)
+        return self.passes.loc[rows[candidates[set_[candidates] >= t]]]
+
+    # adds the column pass_id (row of the pass in self.passes, -1 if none) to frames with the columns sensor_col,
+    # satellite_col (values of the key of the index) and time_col (unix time)
+    def join(self, frames: pd.DataFrame, sensor_col: str = "sensor_name", satellite_col: str = "satellite",
+             time_col: str = "time") -> pd.DataFrame:
+        frames = frames.copy()
+        pass_id = np.full(len(frames), -1, dtype=np.int64)
+        for (sensor, satellite), positions in frames.groupby([sensor_col, satellite_col], sort=False).indices.items():
+            pass_id[positions] = self.lookup(sensor, satellite, frames[time_col].to_numpy()[positions])
+        frames["pass_id"] = pass_id
+        return frames
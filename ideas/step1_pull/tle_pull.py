@@ -1,7 +1,20 @@
 import datetime
+import re
 import requests
 import json
-from skyfield.api import EarthSatellite, load, wgs84
+import numpy as np
+from sgp4.api import Satrec, SatrecArray, jday
+
+# WGS84 ellipsoid for the altitude of the satellites
+WGS84_A = 6378.137  # km
+WGS84_E2 = 1 / 298.257223563 * (2 - 1 / 298.257223563)
+
+# communication systems by the prefix of the satellite name, (pattern, system, key in stats)
+SYSTEMS = [(re.compile(r"IRIDIUM"), "Iridium", "iridium_satellites"),
+           (re.compile(r"STARLINK"), "Starlink", "starlink_satellites"),
+           (re.compile(r"ORBCOMM"), "Orbcomm", "orbcomm_satellites"),
+           (re.compile(r"GLOBALSTAR"), "Globalstar", "globalstar_satellites"),
+           (re.compile(r"ONEWEB"), "Oneweb", "oneweb_satellites")]
 
 # get data
 def pull_data():
@@ -10,10 +23,26 @@ def pull_data():
     data = requests.get(tle_url)
     return data.text.splitlines()
 
+def geodetic_height(pos):
+    """
+    height above the WGS84 ellipsoid in km of positions (n, 3) in km, the rotation of the earth doesn't change the
+    height so TEME positions can be used directly
+    """
+    p = np.hypot(pos[:, 0], pos[:, 1])
+    z = pos[:, 2]
+    lat = np.arctan2(z, p * (1 - WGS84_E2))
+    for _ in range(5):
+        n = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat) ** 2)
+        height = np.hypot(p, z + WGS84_E2 * n * np.sin(lat)) - n
+        lat = np.arctan2(z, p * (1 - WGS84_E2 * n / (n + height)))
+    return height
+
 def filter_data(data, timestamp, output_file):
     """
     function to filter out non-LEO, no-contact and deorbiting satellites
     additionally get some stats on the processed dataset
+    all TLEs are parsed once and propagated together to timestamp, the altitude at timestamp replaces the altitude at
+    the epoch of every satellite (at most 3 days apart for the kept ones)
     """
     stats = {
         "timestamp" : str(timestamp),
@@ -25,77 +54,66 @@ def filter_data(data, timestamp, output_file):
         "orbcomm_satellites": 0,
     }
     data_dicts = []
-    
-    for i in range(0, len(data)-3, 3):
-        try: 
-            #process 1 TLE entry (3 lines) at a time
-            line_name = data[i]
-            line1 = data[i+1]
-            line2 = data[i+2]
-            #check format of TLE
-            if not line_name or not line1 or not line2: break
-            #print(f"{line_name}\n{line1}\n{line2}\n\n")
-
-            #parse satellite data
-            ts = load.timescale()
-            satellite = EarthSatellite(line1,line2,line_name,ts)
-            sat_epoch = satellite.epoch                                         #get epoch i.e. point in time where TLE is most accurate
-            days_since_last_contact = ts.from_datetime(timestamp) - sat_epoch   #for freshness check
-
-            position = satellite.at(sat_epoch)                                  #calculate position at epoch time point
-            altitude = wgs84.height_of(position).km
-
-            #ignoring satellites that are de-orbiting (old data and/or descending)
-            if days_since_last_contact > 3 or altitude < 250:
-                continue
-            
-            #only consider LEO satellites (below 2000km altitude)
-            if altitude < 2000:
-                #store
-                output_file.write(line_name+"\n")
-                output_file.write(line1+"\n")
-                output_file.write(line2+"\n")
-
-                #create json:
-                data_dict = {
-                    "name": line_name,
-                    "line1": line1, 
-                    "line2": line2,
-                }
-
-
-                #stats
-                stats["leo_satellites"] += 1
-                if satellite.name.startswith("IRIDIUM"):
-                    stats["iridium_satellites"] += 1
-                    data_dict["type"] = "Communications"
-                    data_dict["system"] = "Iridium"
-                elif satellite.name.startswith("STARLINK"):
-                    stats["starlink_satellites"] += 1 
-                    data_dict["type"] = "Communications"
-                    data_dict["system"] = "Starlink"
-                elif satellite.name.startswith("ORBCOMM"):
-                    stats["orbcomm_satellites"] += 1 
-                    data_dict["type"] = "Communications"
-                    data_dict["system"] = "Orbcomm"
-                elif satellite.name.startswith("GLOBALSTAR"):
-                    stats["globalstar_satellites"] += 1 
-                    data_dict["type"] = "Communications"
-                    data_dict["system"] = "Globalstar"
-                elif satellite.name.startswith("ONEWEB"):
-                    stats["oneweb_satellites"] += 1
-                    data_dict["type"] = "Communications"
-                    data_dict["system"] = "Oneweb"
-                else:
-                    data_dict["type"] = "Other"
-                    data_dict["system"] = ""
-                data_dicts.append(data_dict)
 
+    #process 1 TLE entry (3 lines) at a time
+    entries = []
+    satellites = []
+    for i in range(0, len(data) - 2, 3):
+        line_name = data[i]
+        line1 = data[i+1]
+        line2 = data[i+2]
+        #check format of TLE
+        if not line_name or not line1 or not line2: break
+        try:
+            satellites.append(Satrec.twoline2rv(line1, line2))
         except Exception as e:
             print("Unable to decode TLE data. Make the sure TLE data is formatted correctly." + str(e))
             exit(1)
-        
-    return stats,data_dicts   
+        entries.append((line_name, line1, line2))
+    if not entries:
+        return stats, data_dicts
+
+    #freshness check: days between the epoch (point in time where TLE is most accurate) and timestamp
+    jd, fr = jday(timestamp.year, timestamp.month, timestamp.day, timestamp.hour, timestamp.minute,
+                  timestamp.second + timestamp.microsecond / 1e6)
+    epochs = np.array([sat.jdsatepoch + sat.jdsatepochF for sat in satellites])
+    days_since_last_contact = (jd + fr) - epochs
+
+    #altitude of all satellites at timestamp, satellites that sgp4 can't propagate (e.g. decayed) have none
+    err, position, _ = SatrecArray(satellites).sgp4(np.array([jd]), np.array([fr]))
+    altitude = geodetic_height(position[:, 0, :])
+    altitude[err[:, 0] != 0] = np.nan
+
+    #ignoring satellites that are de-orbiting (old data and/or descending), only consider LEO satellites (below 2000km)
+    keep = (days_since_last_contact <= 3) & (altitude >= 250) & (altitude < 2000)
+
+    for index in np.flatnonzero(keep):
+        line_name, line1, line2 = entries[index]
+        #store
+        output_file.write(line_name+"\n")
+        output_file.write(line1+"\n")
+        output_file.write(line2+"\n")
+
+        #create json:
+        data_dict = {
+            "name": line_name,
+            "line1": line1,
+            "line2": line2,
+            "type": "Other",
+            "system": "",
+        }
+
+        #stats
+        stats["leo_satellites"] += 1
+        for pattern, system, key in SYSTEMS:
+            if pattern.match(line_name):
+                stats[key] += 1
+                data_dict["type"] = "Communications"
+                data_dict["system"] = system
+                break
+        data_dicts.append(data_dict)
+
+    return stats,data_dicts
 
 
 if __name__ == '__main__':
@@ -1,11 +1,14 @@
 import bson
 import pandas as pd
 import zipfile
-import subprocess
 import sys
 import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import pyarrow.feather as feather
+import pyarrow.dataset as pads
 
 # Ensure repository root is on sys.path so `app` package is importable
 # when running this script from the `data/` folder directly.
@@ -13,22 +16,35 @@ repo_root = Path(__file__).resolve().parents[2]
 if str(repo_root) not in sys.path:
 	sys.path.insert(0, str(repo_root))
 from app.dashboard.parser import parser_iridium
+from app.dashboard.parser import iridium_decoder
+from data import dataset_stats
+from data import ira_store
 
+# datasets of the pipeline in the parsed folder, partitioned by month, one file per processed zip and month
+IRA_DATASET = "ira"
+NETWORK_STATS_DATASET = "network_stats"
+# zips processed by run_pipeline, keyed by the sha256 of their content
+PROCESSED_MANIFEST = "processed_zips.json"
 
 
-def raw_parser(path_to_zip: Path, output_folder: Path) -> None:
+def write_feather(df: pd.DataFrame, path: Path) -> None:
+    """
+    write df uncompressed into a temp file and move it to path, the measurement API memory-maps the feather files
+    and would read a half written file otherwise
+    """
+    tmp_path = Path(str(path) + ".tmp")
+    df.to_feather(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def raw_parser(path_to_zip: Path, output_folder: Path, processes=None) -> None:
     """
     function to parse raw leocommon file
     input: parsed_input_file; output.bits file from leocommon system
-    output: 
+    output: output.parsed in output_folder / job folder, same format as iridium-parser.py -p
+    processes: decoder processes for large files, one per core if None
     """
 
-    py = sys.executable  # python executable to use (default: current interpreter)
-    # root folder to search for .bits files (default: repo `ideas/`)
-    # data_root: Path = Path(__file__).resolve().parents[1]
-    # path to iridium-parser.py (default: repo `iridium-toolkit-master/iridium-parser.py`)
-    parser_path: Path = Path(__file__).resolve().parents[2] / "iridium-toolkit-master" / "iridium-parser.py"
-
     # job_folder_name = path_to_zip.name.replace('.zip', '')
     job_folder_name = os.path.basename(path_to_zip).replace('.zip', '')
 
@@ -39,41 +55,12 @@ def raw_parser(path_to_zip: Path, output_folder: Path) -> None:
         zip_ref.extractall(tmp_dir)
 
 
-    bits_files = list(tmp_dir.glob("*.bits"))
-    agg = False
+    bits_files = sorted(tmp_dir.glob("*.bits"))
 
     print(f"Found {len(bits_files)} .bits files")
 
-    if len(bits_files) > 1:
-        # Aggregate all .bits files into one
-        agg = True
-
-        output_path = tmp_dir / "tmp_output.bits"
-        with open(output_path, "wb") as outfile:
-            for bits_file in sorted(bits_files):
-                with open(bits_file, "rb") as infile:
-                    outfile.write(infile.read())
-        print(f"Aggregated {len(bits_files)} files into {output_path}")
-    else:
-        print("Only 0 or 1 file found, no aggregation needed")
-
-
-    cwd = tmp_dir
-    cmd = [py, str(parser_path)]
-    if agg:
-        cmd.extend(["-p", (tmp_dir / "tmp_output.bits").name])
-    else:
-        cmd.extend(["-p", (cwd / "output.bits").name])
-
-    print(f"Running: {cmd}  (cwd={cwd})")
-    proc = subprocess.run(cmd, cwd=str(cwd), capture_output=True, text=True)
-
-    if agg:
-        # Remove temporary aggregated file
-        remove_path = tmp_dir / "tmp_output.bits"
-        remove_path.unlink()
-        rename_path = tmp_dir / "tmp_output.parsed"
-        rename_path.replace(tmp_dir / "output.parsed")
+    # all .bits files are decoded into one output.parsed, large files are split up over all cores
+    iridium_decoder.write_parsed(bits_files, tmp_dir / "output.parsed", processes=processes)
 
     # TODO: At Some point, delete tmp folder?
 
@@ -94,7 +81,9 @@ def metadata_parser(zip_folder_name: str, output_folder: Path) -> None:
     df = df.astype(dtype=type_dict)
     df = df.sort_values(by="time").reset_index()
 
-    df.to_feather(output_folder / zip_folder_name / "output_df.feather")
+    write_feather(df, output_folder / zip_folder_name / "output_df.feather")
+    # statistics for /df/info of the measurement API, so it doesn't have to scan the dataset
+    dataset_stats.write_stats(output_folder / zip_folder_name / "output_df.feather")
 
 
 
@@ -195,10 +184,29 @@ def create_network_stats(parsed_folder: Path) -> pd.DataFrame:
     return df_combined
 
 
+def read_network_stats(parsed_folder: Path, columns=None) -> pd.DataFrame:
+    """
+    frames of all jobs: the network_stats dataset of run_pipeline if it exists, otherwise network_stats.feather
+    of create_network_stats. Only the given columns that exist are read
+    """
+    dataset_path = parsed_folder / NETWORK_STATS_DATASET
+    if dataset_path.is_dir() and any(dataset_path.glob("*/*.parquet")):
+        dataset = pads.dataset(dataset_path, format="parquet", partitioning="hive")
+        names = dataset.schema.names
+        if columns is not None:
+            names = [c for c in columns if c in names]
+        return dataset.to_table(columns=names).to_pandas()
+
+    names = feather.read_table(parsed_folder / "network_stats.feather", memory_map=True).schema.names
+    if columns is not None:
+        names = [c for c in columns if c in names]
+    return pd.read_feather(parsed_folder / "network_stats.feather", columns=names)
+
+
 def create_packets_over_time(parsed_folder: Path):
-    """Create a DataFrame counting packets over time (by year and month) from network_stats.feather."""
+    """Create a DataFrame counting packets over time (by year and month) from the network stats."""
     
-    df = pd.read_feather(parsed_folder / "network_stats.feather")
+    df = read_network_stats(parsed_folder, ["time", "timestamp"])
 
     # Group df by year and month and count datapoints per month
     # Ensure timestamp column exists
@@ -225,9 +233,9 @@ def create_packets_over_time(parsed_folder: Path):
 
 
 def create_number_of_packets(parsed_folder: Path) -> pd.DataFrame:
-    """Create a DataFrame counting total number of packets from network_stats.feather."""
+    """Create a DataFrame counting total number of packets from the network stats."""
     
-    df = pd.read_feather(parsed_folder / "network_stats.feather")
+    df = read_network_stats(parsed_folder, ["frame_type"])
 
     # Group df by number of packets
     df_packets = df.groupby("frame_type").size().reset_index(name="count").sort_values(by="count", ascending=False).reset_index(drop=True)
@@ -235,10 +243,9 @@ def create_number_of_packets(parsed_folder: Path) -> pd.DataFrame:
     return df_packets
 
 def create_number_of_jobs_per_month(parsed_folder: Path) -> pd.DataFrame:
-    """Create a DataFrame counting unique jobs per month from network_stats.feather."""
+    """Create a DataFrame counting unique jobs per month from the network stats."""
 
-    feather_path = os.path.join(parsed_folder, "network_stats.feather")
-    df = pd.read_feather(feather_path)
+    df = read_network_stats(parsed_folder, ["time", "timestamp", "job_name"])
 
     # Ensure timestamp column exists
     if "timestamp" not in df.columns:
@@ -285,49 +292,130 @@ def create_clients_stats(clients_bson_path: Path) -> pd.DataFrame:
 
 
 
-input_path = Path("ideas/data")
-parsed_folder = Path("ideas/data/parsed/")
-
+def file_hash(path: Path, chunk_size: int = 1 << 20) -> str:
+    """sha256 of the content of path, read chunk by chunk"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-# pd.DataFrame(create_network_stats(parsed_folder)).to_feather(parsed_folder / "network_stats.feather")
-# pd.DataFrame(create_packets_over_time(parsed_folder)).to_feather(parsed_folder / "df_packets_over_time.feather")
-# pd.DataFrame(create_number_of_packets(parsed_folder)).to_feather(parsed_folder / "df_packets.feather")
-pd.DataFrame(create_number_of_jobs_per_month(parsed_folder)).to_feather(parsed_folder / "df_jobs_per_month.feather")
-# pd.DataFrame(create_clients_stats(parsed_folder / "clients.bson")).to_feather(parsed_folder / "clients_stats.feather")
-
-# dfs = []
-
-# for zip_file in input_path.glob("*.zip"):
-
-#     job_folder_name = zip_file.name.replace('.zip', '')
-    
-#     print(zip_file)
-
-#     raw_parser(zip_file,parsed_folder)
-
-#     metadata_parser(job_folder_name, parsed_folder)
-
-#     df = ira_parser(open(parsed_folder / job_folder_name / "output.parsed","r")) 
-
-
-#     # Sensor and Job info
-#     df['job_name'] = job_folder_name.split('_sensor_')[0]
-#     df['sensor_name'] = job_folder_name.split('_sensor_')[1]
-
-#     print(df.head(1))
-
-    
-
-#     dfs.append(df)
-    
-# pd.concat(dfs, ignore_index=True).to_feather(parsed_folder / "ira.feather")
 
+def read_manifest(parsed_folder: Path) -> dict:
+    """processed zips of run_pipeline, {sha256: {zip, job_name, sensor_name, frames, iras}}"""
+    try:
+        with open(parsed_folder / PROCESSED_MANIFEST, "r") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
 
 
+def write_manifest(manifest: dict, parsed_folder: Path) -> None:
+    tmp_path = parsed_folder / (PROCESSED_MANIFEST + ".tmp")
+    with open(tmp_path, "w") as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(tmp_path, parsed_folder / PROCESSED_MANIFEST)
 
 
+def remove_zip_results(parsed_folder: Path, digest: str) -> None:
+    """delete the files a zip added to the datasets"""
+    for dataset in [IRA_DATASET, NETWORK_STATS_DATASET]:
+        ira_store.remove_partition(str(parsed_folder / dataset), digest[:16])
 
 
+def process_zip(zip_file: Path, parsed_folder: Path, digest: str) -> dict:
+    """
+    parses one zip (raw_parser, metadata_parser, ira_parser) and appends its frames and ring alerts to the
+    datasets of the parsed folder, files are named after the content hash of the zip
+    output: manifest entry of the zip
+    """
+    job_folder_name = zip_file.name.replace('.zip', '')
+    parts = job_folder_name.split('_sensor_')
+    job_name = parts[0]
+    sensor_name = parts[1] if len(parts) > 1 else ""
+
+    # the zips are already spread over the cores, the decoder of a single zip doesn't need a pool
+    raw_parser(zip_file, parsed_folder, processes=1)
+    metadata_parser(job_folder_name, parsed_folder)
+
+    frames = 0
+    frames_path = parsed_folder / job_folder_name / "output_df.feather"
+    if frames_path.exists():
+        df = pd.read_feather(frames_path)
+        df["job_name"] = job_name
+        df["sensor_name"] = sensor_name
+        ira_store.append_partition(df, str(parsed_folder / NETWORK_STATS_DATASET), digest[:16])
+        frames = len(df)
+
+    with open(parsed_folder / job_folder_name / "output.parsed", "r") as parsed_file:
+        df = ira_parser(parsed_file)
+    df['job_name'] = job_name
+    df['sensor_name'] = sensor_name
+    ira_store.append_partition(df, str(parsed_folder / IRA_DATASET), digest[:16])
+
+    return {"zip": zip_file.name, "job_name": job_name, "sensor_name": sensor_name, "frames": frames,
+            "iras": len(df)}
+
+
+def run_pipeline(input_path: Path, parsed_folder: Path, processes=None) -> dict:
+    """
+    processes the zips in input_path that aren't in the manifest yet (by content hash, renamed or copied zips
+    are skipped), one zip per worker process. The results are appended to the ira and network_stats datasets,
+    a zip that replaces an older one with the same name removes the results of the old one. Zips that fail are
+    retried on the next run. Finally the statistics feathers of the measurement API are updated
+    output: manifest
+    """
+    parsed_folder.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(parsed_folder)
+    by_zip = {entry["zip"]: digest for digest, entry in manifest.items()}
+
+    pending = {}
+    for zip_file in sorted(input_path.glob("*.zip")):
+        digest = file_hash(zip_file)
+        if digest not in manifest and digest not in pending:
+            pending[digest] = zip_file
+    print(f"Found {len(pending)} new zips, {len(manifest)} already processed")
+    if not pending:
+        return manifest
+
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as pool:
+        futures = {pool.submit(process_zip, zip_file, parsed_folder, digest): digest
+                   for digest, zip_file in pending.items()}
+        for future in as_completed(futures):
+            digest = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                print(f"Failed to process {pending[digest].name}: {e}")
+                remove_zip_results(parsed_folder, digest)
+                continue
+
+            old_digest = by_zip.get(entry["zip"])
+            if old_digest is not None and old_digest != digest:
+                remove_zip_results(parsed_folder, old_digest)
+                del manifest[old_digest]
+            manifest[digest] = entry
+            by_zip[entry["zip"]] = digest
+            # written after every zip, an interrupted run continues with the remaining ones
+            write_manifest(manifest, parsed_folder)
+            print(f"Processed {entry['zip']}: {entry['frames']} frames, {entry['iras']} ring alerts")
+
+    if any(entry["frames"] > 0 for entry in manifest.values()):
+        write_feather(pd.DataFrame(create_packets_over_time(parsed_folder)), parsed_folder / "df_packets_over_time.feather")
+        write_feather(pd.DataFrame(create_number_of_packets(parsed_folder)), parsed_folder / "df_packets.feather")
+        write_feather(pd.DataFrame(create_number_of_jobs_per_month(parsed_folder)), parsed_folder / "df_jobs_per_month.feather")
+    return manifest
+
+
+if __name__ == '__main__':
+    input_path = Path("ideas/data")
+    parsed_folder = Path("ideas/data/parsed/")
+
+    # ring alerts of the zips go to parsed/ira/, /iridium_ira of the measurement API reads them from there
+    run_pipeline(input_path, parsed_folder)
+
+    # write_feather(pd.DataFrame(create_network_stats(parsed_folder)), parsed_folder / "network_stats.feather")
+    # write_feather(pd.DataFrame(create_clients_stats(parsed_folder / "clients.bson")), parsed_folder / "clients_stats.feather")
 
 
 # for file in parsed_folder.iterdir():
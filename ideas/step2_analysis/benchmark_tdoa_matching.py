@@ -0,0 +1,84 @@
+import argparse
+import contextlib
+import io
+import time
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+from tdoa_impl import summarize_runs, overlapping_run_pairs, connected_runs, match_receiver_runs
+
+# Benchmark of the run matching of tdoa_impl on synthetic ring alerts of many receivers: the sweep line
+# (overlapping_run_pairs) and union-find (connected_runs) against the self-merge on (sat_id, beam_id) with networkx they
+# replace. Both have to find the same clusters. Run from the step2_analysis folder:
+#   python benchmark_tdoa_matching.py --receivers 20 --hours 24
+
+parser = argparse.ArgumentParser(description="Benchmark of the TDOA run matching")
+parser.add_argument("--receivers", type=int, default=20, help="number of receivers")
+parser.add_argument("--hours", type=float, default=24, help="hours of ring alerts")
+parser.add_argument("--windows", type=int, default=40, help="visibility windows per sat-beam and day")
+parser.add_argument("--skip-pairwise", action="store_true", help="don't run the self-merge (needs a lot of memory)")
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+number_consecutive_meas = 6
+intra_receiver_difference = 5  # s
+number_of_receivers = 3
+ira_interval = 4.32  # s between two ring alerts of a beam
+
+# every sat-beam is visible in random windows, each window is seen by a random group of receivers with a small
+# offset, some ring alerts get lost (which splits runs)
+rng = np.random.default_rng(args.seed)
+sensors = np.array([f"sensor_{i:02d}" for i in range(args.receivers)])
+windows = int(args.windows * args.hours / 24)
+parts = []
+for sat_id in range(66):
+    for beam_id in range(48):
+        starts = rng.uniform(0, args.hours * 3600, windows)
+        lengths = rng.uniform(30, 300, windows)
+        for start, length in zip(starts, lengths):
+            receivers = rng.choice(sensors, rng.integers(1, 7), replace=False)
+            for sensor in receivers:
+                offset = rng.uniform(-20, 20)
+                times = np.arange(start + offset, start + offset + length, ira_interval)
+                times = times[rng.random(len(times)) > 0.1]
+                parts.append(pd.DataFrame({"sensor_name": sensor, "sat_id": sat_id, "beam_id": beam_id,
+                                           "timestamp_ms": 1.7e12 + times * 1000,
+                                           "signal_strength": rng.normal(-80, 5, len(times))}))
+ira_df = pd.concat(parts, ignore_index=True)
+print(f"{len(ira_df)} ring alerts of {args.receivers} receivers over {args.hours} h")
+
+start = time.perf_counter()
+df_valid, run_summaries = summarize_runs(ira_df, number_consecutive_meas, intra_receiver_difference)
+print(f"{len(run_summaries)} runs in {time.perf_counter() - start:.2f} s")
+
+start = time.perf_counter()
+run_a, run_b = overlapping_run_pairs(run_summaries)
+clusters = connected_runs(run_a, run_b)
+sweep = time.perf_counter() - start
+print(f"sweep line + union-find: {len(run_a)} pairs, {len(clusters)} clusters in {sweep:.3f} s")
+
+if not args.skip_pairwise:
+    start = time.perf_counter()
+    merged = run_summaries.merge(run_summaries, on=["sat_id", "beam_id"], suffixes=("_A", "_B"))
+    candidates = len(merged)
+    run_overlaps = (merged
+                    .query("sensor_name_A != sensor_name_B")
+                    .query("run_start_A <= run_end_B and run_start_B <= run_end_A"))
+    G = nx.Graph()
+    for _, row in run_overlaps.iterrows():
+        G.add_edge(row["global_run_id_A"], row["global_run_id_B"])
+    reference = [list(c) for c in nx.connected_components(G)]
+    pairwise = time.perf_counter() - start
+    print(f"self-merge + networkx: {candidates} candidate pairs, {len(run_overlaps) // 2} pairs, "
+          f"{len(reference)} clusters in {pairwise:.3f} s ({pairwise / sweep:.0f}x)")
+
+    same = sorted(sorted(c) for c in reference) == sorted(sorted(c) for c in clusters)
+    print(f"same clusters: {same}")
+    if not same:
+        raise SystemExit(1)
+
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    usable = match_receiver_runs(ira_df, number_consecutive_meas, 2, intra_receiver_difference, number_of_receivers)
+print(f"match_receiver_runs: {len(usable)} usable clusters in {time.perf_counter() - start:.2f} s")
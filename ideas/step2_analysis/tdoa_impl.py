@@ -1,21 +1,14 @@
 import pandas as pd
 from pathlib import Path
-import networkx as nx
 import datetime
 import numpy as np
 
 
-def match_receiver_runs(
-    ira_df,
-    number_consecutive_meas,
-    inter_receiver_difference,
-    intra_receiver_difference,
-    number_of_receivers):
+def summarize_runs(ira_df, number_consecutive_meas, intra_receiver_difference):
     """
-    Finds timestamp-level overlaps between receivers observing the same sat-beam.
-    Produces clusters of receivers and timestamp pairs suitable for TDOA.
-    input: df containing ira messages
-    output: list of df, each df contains infos to calculate a tdoa signature
+    splits the ira messages of every receiver-sat-beam into runs (consecutive messages less than
+    intra_receiver_difference seconds apart) and keeps the runs with at least number_consecutive_meas messages
+    output: (messages of the valid runs with global_run_id, one row per run with run_start, run_end and count)
     """
 
     # ---------------------------------------------------------
@@ -55,105 +48,259 @@ def match_receiver_runs(
         .rename(columns={'min':'run_start','max':'run_end'})
     )
     #shape sensor_name, sat_id,beam_id, run_id, run_start, run_end, count
-    #print(run_summaries)
-    # ---------------------------------------------------------
-    # 4) Candidate overlapping runs across receivers
-    # ---------------------------------------------------------
-    run_overlaps = (
-        run_summaries.merge(
-            run_summaries,
-            on=["sat_id", "beam_id"],
-            suffixes=("_A","_B")
-        )
-        .query("sensor_name_A != sensor_name_B")
-        .query("run_start_A <= run_end_B and run_start_B <= run_end_A")
-    )
-    #shape sensor_name_A, sat_id,beam_id, run_id_A, run_start_A, run_end_A, count_A, sensor_name_B, run_id_B, run_start_B, run_end_B, count_B
+    return df_valid, run_summaries
+
+
+def overlapping_run_pairs(run_summaries):
+    """
+    sweep line over the runs of every sat-beam sorted by run_start: a run overlaps exactly the runs that start
+    after it and before its end, so only overlapping pairs are generated instead of all pairs of a sat-beam
+    input: run summaries (see summarize_runs)
+    output: (global_run_id_A, global_run_id_B) arrays of all overlapping runs of different receivers
+    """
+    runs = run_summaries.sort_values(["sat_id", "beam_id", "run_start"], kind="stable")
+    run_ids = runs["global_run_id"].to_numpy()
+    sensors = runs["sensor_name"].to_numpy()
+    starts = runs["run_start"].to_numpy()
+    ends = runs["run_end"].to_numpy()
+    group = runs.groupby(["sat_id", "beam_id"], sort=False).ngroup().to_numpy()
+    bounds = np.r_[0, np.flatnonzero(np.diff(group)) + 1, len(runs)]
+
+    pairs_a = []
+    pairs_b = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        # runs i+1 .. last[i]-1 start before run i ends
+        last = lo + np.searchsorted(starts[lo:hi], ends[lo:hi], side="right")
+        count = last - np.arange(lo + 1, hi + 1)
+        if not count.any():
+            continue
+        count = np.maximum(count, 0)
+        a = np.repeat(np.arange(lo, hi), count)
+        # offset of every pair within the partners of its run
+        offset = np.arange(len(a)) - np.repeat(np.cumsum(count) - count, count)
+        b = a + 1 + offset
+        pairs_a.append(a)
+        pairs_b.append(b)
+    if not pairs_a:
+        return np.array([], dtype=run_ids.dtype), np.array([], dtype=run_ids.dtype)
 
-    #print(run_overlaps.head)
+    a = np.concatenate(pairs_a)
+    b = np.concatenate(pairs_b)
+    different = sensors[a] != sensors[b]
+    return run_ids[a[different]], run_ids[b[different]]
+
+
+def connected_runs(run_a, run_b):
+    """
+    union-find over the run ids of the pairs: every run points to its root, roots get merged pair by pair
+    (vectorized, always towards the smaller id) and paths are shortened until nothing changes
+    output: list of clusters (list of run ids) with at least 2 runs, sorted by their smallest run id
+    """
+    if len(run_a) == 0:
+        return []
+    ids, inverse = np.unique(np.concatenate([run_a, run_b]), return_inverse=True)
+    a, b = inverse[:len(run_a)], inverse[len(run_a):]
+    parent = np.arange(len(ids))
+    while True:
+        root_a = parent[a]
+        root_b = parent[b]
+        if (root_a == root_b).all():
+            break
+        low = np.minimum(root_a, root_b)
+        np.minimum.at(parent, root_a, low)
+        np.minimum.at(parent, root_b, low)
+        # path compression
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                break
+            parent = grand
+
+    order = np.argsort(parent, kind="stable")
+    splits = np.flatnonzero(np.diff(parent[order])) + 1
+    return [ids[c].tolist() for c in np.split(order, splits)]
+
+
+def match_receiver_runs(
+    ira_df,
+    number_consecutive_meas,
+    inter_receiver_difference,
+    intra_receiver_difference,
+    number_of_receivers):
+    """
+    Finds timestamp-level overlaps between receivers observing the same sat-beam.
+    Produces clusters of receivers and timestamp pairs suitable for TDOA.
+    input: df containing ira messages
+    output: list of df, each df contains infos to calculate a tdoa signature
+    """
 
-    G = nx.Graph()
-    for _, row in run_overlaps.iterrows():
-        G.add_edge(row["global_run_id_A"], row["global_run_id_B"])
+    df_valid, run_summaries = summarize_runs(ira_df, number_consecutive_meas, intra_receiver_difference)
 
-    components = [list(c) for c in nx.connected_components(G)]
+    # ---------------------------------------------------------
+    # 4) Overlapping runs across receivers and their clusters
+    # ---------------------------------------------------------
+    run_a, run_b = overlapping_run_pairs(run_summaries)
+    components = connected_runs(run_a, run_b)
 
     # keep only those with number of desired receivers
     multirec = [c for c in components if len(c) >= number_of_receivers]
     print(multirec)
-    usable = []
-    counter = 0
-    for cluster in multirec:
-        cluster_df = df_valid[df_valid['global_run_id'].isin(cluster)]
 
-        #only keep messages within (max_start-2; min_start+2 seconds)
-        max_start = run_summaries[run_summaries['global_run_id'].isin(cluster)]["run_start"].max() - datetime.timedelta(0,2)
-        min_end = run_summaries[run_summaries['global_run_id'].isin(cluster)]["run_end"].min() + datetime.timedelta(0,2)
+    # ---------------------------------------------------------
+    # 5) Messages of every cluster
+    # ---------------------------------------------------------
+    cluster_of_run = pd.Series(
+        np.repeat(np.arange(len(multirec)), [len(c) for c in multirec]),
+        index=[run for c in multirec for run in c], dtype=np.int64)
+    cluster = df_valid["global_run_id"].map(cluster_of_run)
 
-        cluster_df = cluster_df[(cluster_df["datetime"] >= max_start) &(cluster_df["datetime"] <= min_end)]
+    #only keep messages within (max_start-2; min_start+2 seconds)
+    runs = run_summaries.assign(cluster=run_summaries["global_run_id"].map(cluster_of_run)).dropna(subset=["cluster"])
+    max_start = runs.groupby("cluster")["run_start"].max() - datetime.timedelta(0,2)
+    min_end = runs.groupby("cluster")["run_end"].min() + datetime.timedelta(0,2)
+    keep = (cluster.notna()
+            & (df_valid["datetime"] >= cluster.map(max_start))
+            & (df_valid["datetime"] <= cluster.map(min_end)))
 
-        
-        if not cluster_df.empty:
-            if cluster_df["sensor_name"].nunique() >= number_of_receivers:
-                if (cluster_df.groupby(["sensor_name"]).size() >= number_consecutive_meas).all():
-                    usable.append(cluster_df)
-                    counter += 1
-                
+    usable = []
+    counter = 0
+    for _, cluster_df in df_valid[keep].groupby(cluster[keep], sort=True):
+        if cluster_df["sensor_name"].nunique() >= number_of_receivers:
+            if (cluster_df.groupby(["sensor_name"]).size() >= number_consecutive_meas).all():
+                usable.append(cluster_df)
+                counter += 1
 
     print(usable)
     print(f"found {counter} clusters with {number_consecutive_meas} consecutive measurements across {number_of_receivers} receivers")
     return usable
 
-def calculate_tdoa(batch,signature_kind):
-    print(batch)
-    toas = np.array([x["timestamp_ms"] for x in batch])
-    print(toas)
+signature_columns = ["cluster_id", "sat_id", "beam_id", "index", "sensor_name", "timestamp_ms",
+                     "tdoa_reference", "tdoa_successive"]
+pairwise_columns = ["cluster_id", "index", "sensor_a", "sensor_b", "tdoa"]
+
+
+def calculate_tdoa(toas, signature_kind):
+    """
+    tdoas of a (time x receiver) matrix of timestamps, all rows at once. Missing timestamps are NaN
+    kind 0: relative to the first receiver, kind 1: relative to the previous receiver (the first one relative to the
+    last), kind 2: all pairs, (time x receiver x receiver) with [t, i, j] = toa_j - toa_i
+    """
+    toas = np.asarray(toas, dtype=np.float64)
     if signature_kind == 0:
-        return toas - toas[0] 
+        return toas - toas[:, :1]
     elif signature_kind == 1:
-        return toas - np.roll(toas, shift=1)
+        return toas - np.roll(toas, shift=1, axis=1)
     elif signature_kind == 2:
-        return (toas - toas[:,None])
+        return toas[:, None, :] - toas[:, :, None]
     else:
-        return []
-     
-   
+        return np.empty((len(toas), 0))
+
+
+def signature_matrix(matched_df):
+    """
+    aligns the messages of a cluster: the receivers sorted by name are the columns, row i holds the i-th message
+    (by time) of every receiver, NaN if a receiver has less messages. Rows go up to the message count of the
+    first receiver
+    output: (sensor names, (time x receiver) matrix of timestamp_ms)
+    """
+    df = matched_df.sort_values(["sensor_name", "timestamp_ms"], kind="stable")
+    sensors, receiver = np.unique(df["sensor_name"].to_numpy(), return_inverse=True)
+    index = df.groupby("sensor_name", sort=False).cumcount().to_numpy()
+    return sensors, _aligned_toas(receiver, index, df["timestamp_ms"].to_numpy(dtype=np.float64), len(sensors))
+
+
+def _aligned_toas(receiver, index, timestamps, receivers):
+    rows = np.count_nonzero(receiver == 0)
+    keep = index < rows
+    toas = np.full((rows, receivers), np.nan)
+    toas[index[keep], receiver[keep]] = timestamps[keep]
+    return toas
+
+
+def calculate_signatures(clusters):
+    """
+    tdoa signatures of all clusters (list of df, see match_receiver_runs), every kind of calculate_tdoa is computed
+    for a whole cluster at once. Unlike a per-row batch, receivers without an i-th message stay in place as NaN,
+    so the tdoas of the other receivers keep their partners
+    output: (signatures: one row per message with kind 0 and 1, pairwise: one row per receiver pair (a < b) and
+    message with kind 2)
+    """
+    if not clusters:
+        return pd.DataFrame(columns=signature_columns), pd.DataFrame(columns=pairwise_columns)
+
+    # sorting and numbering of all clusters at once, the loop below only slices arrays
+    df = pd.concat([c[["sensor_name", "sat_id", "beam_id", "timestamp_ms"]] for c in clusters], ignore_index=True)
+    df["cluster_id"] = np.repeat(np.arange(len(clusters)), [len(c) for c in clusters])
+    df = df.sort_values(["cluster_id", "sensor_name", "timestamp_ms"], kind="stable")
+    sensors, sensor_code = np.unique(df["sensor_name"].to_numpy(), return_inverse=True)
+    df["sensor_code"] = sensor_code
+    cluster_id = df["cluster_id"].to_numpy()
+    receiver = df.groupby("cluster_id", sort=False)["sensor_code"].rank(method="dense").to_numpy(dtype=np.int64) - 1
+    index = df.groupby(["cluster_id", "sensor_code"], sort=False).cumcount().to_numpy()
+    timestamps = df["timestamp_ms"].to_numpy(dtype=np.float64)
+    bounds = np.r_[0, np.flatnonzero(np.diff(cluster_id)) + 1, len(df)]
+
+    signature_parts = []
+    pairwise_parts = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        codes = np.unique(sensor_code[lo:hi])
+        toas = _aligned_toas(receiver[lo:hi], index[lo:hi], timestamps[lo:hi], len(codes))
+        present = ~np.isnan(toas)
+        rows, cols = np.nonzero(present)
+        signature_parts.append((np.full(len(rows), cluster_id[lo]), rows, codes[cols], toas[present],
+                                calculate_tdoa(toas, 0)[present], calculate_tdoa(toas, 1)[present]))
+
+        # upper triangle of the pairwise tdoas, the lower one is the same with flipped sign
+        a, b = np.triu_indices(len(codes), k=1)
+        tdoa = calculate_tdoa(toas, 2)[:, a, b]
+        valid = ~np.isnan(tdoa)
+        rows, pair = np.nonzero(valid)
+        pairwise_parts.append((np.full(len(rows), cluster_id[lo]), rows, codes[a[pair]], codes[b[pair]], tdoa[valid]))
+
+    cluster, rows, codes, toas, reference, successive = [np.concatenate(x) for x in zip(*signature_parts)]
+    first = df.groupby("cluster_id")[["sat_id", "beam_id"]].first().reindex(np.arange(len(clusters)))
+    signatures = pd.DataFrame({
+        "cluster_id": cluster,
+        "sat_id": first["sat_id"].to_numpy()[cluster],
+        "beam_id": first["beam_id"].to_numpy()[cluster],
+        "index": rows,
+        "sensor_name": sensors[codes],
+        "timestamp_ms": toas,
+        "tdoa_reference": reference,
+        "tdoa_successive": successive,
+    })
+    cluster, rows, codes_a, codes_b, tdoa = [np.concatenate(x) for x in zip(*pairwise_parts)]
+    pairwise = pd.DataFrame({
+        "cluster_id": cluster,
+        "index": rows,
+        "sensor_a": sensors[codes_a],
+        "sensor_b": sensors[codes_b],
+        "tdoa": tdoa,
+    })
+    return signatures, pairwise
+
 
 def calculate_signature(matched_df):
-    satellite = matched_df["sat_id"][0]
-    groups = [g.sort_values("datetime") for _, g in matched_df.groupby('sensor_name')]
-    #print(groups)
-    tdoas1 = []
-    tdoas2 = []
-    tdoas3 = []
-    for i in range(len(groups[0])):
-        batch = [g.iloc[i] for g in groups if i < len(g)]
-        batch = [x[["sensor_name","datetime", "timestamp_ms"]] for x in batch]
-        tdoa1 = calculate_tdoa(batch,0)
-        tdoa2 = calculate_tdoa(batch,1)
-        tdoa3 = calculate_tdoa(batch,2)
-
-        tdoas1.append(tdoa1)
-        tdoas2.append(tdoa2)
-        tdoas3.append(tdoa3)
-    
-    print(f'{tdoas1}\n{tdoas2}\n{tdoas3}\n\n')
-    
-    return
-
-
-
-#parsed_folder = Path("../data/parsed/")
-#ira_df =  pd.read_feather(parsed_folder/"ira.feather")
-ira_df = pd.read_feather("ira.feather")
-number_consecutive_meas = 6
-inter_receiver_difference = 2 #s
-intra_receiver_difference = 5 #s, should be about 4s
-number_of_receivers = 3
-
-"""usables = match_receiver_runs(ira_df,number_consecutive_meas,inter_receiver_difference,intra_receiver_difference,number_of_receivers)
-for i in range(len(usables)):
-    usables[i].to_csv(f"data/usables/cluster{i}.csv")"""
-
-usable = pd.read_csv("data/usables/cluster0.csv")
-calculate_signature(usable)
+    """
+    tdoa signature of a single cluster, see calculate_signatures
+    """
+    return calculate_signatures([matched_df])
+
+
+if __name__ == '__main__':
+    #parsed_folder = Path("../data/parsed/")
+    #ira_df =  pd.read_feather(parsed_folder/"ira.feather")
+    ira_df = pd.read_feather("ira.feather")
+    number_consecutive_meas = 6
+    inter_receiver_difference = 2 #s
+    intra_receiver_difference = 5 #s, should be about 4s
+    number_of_receivers = 3
+
+    """usables = match_receiver_runs(ira_df,number_consecutive_meas,inter_receiver_difference,intra_receiver_difference,number_of_receivers)
+    for i in range(len(usables)):
+        usables[i].to_csv(f"data/usables/cluster{i}.csv")"""
+
+    usable = pd.read_csv("data/usables/cluster0.csv")
+    signatures, pairwise = calculate_signature(usable)
+    print(signatures)
+    print(pairwise)